@@ -0,0 +1,174 @@
+import math
+import threading
+from array import array
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+# numpy 只在最终汇总时导入，逐行更新只用整数运算
+if TYPE_CHECKING:
+    import numpy as np
+
+OTHER_LABEL = '(其他/错误)'  # 不在编码表中的编码和出错的行
+
+
+def wilson_interval(correct: int, n: int, z: float = 1.96) -> Tuple[float, float]:
+    """准确率的 Wilson 置信区间"""
+    if n == 0:
+        return 0.0, 1.0
+    p = correct / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def normalize_code(code) -> Optional[str]:
+    """编码比较前的统一形式（去空白、小写）；空值为 None。人工编码与模型编码都经此比较"""
+    if code is None or code != code:
+        return None
+    code = str(code).strip().lower()
+    return code or None
+
+
+class AgreementStats:
+    """人工编码与模型编码的一致性统计
+
+    编码按 'code' 表映射为整数，每条结果以 O(1) 更新混淆矩阵、边际计数和
+    期望一致项，可随时读取当前的准确率和 Cohen's kappa；同时以紧凑整数数组
+    保存整列编码，最终由 NumPy 向量化计算混淆矩阵和各编码的 P/R/F1。
+    """
+    def __init__(self, codes: Sequence[str]):
+        self.labels: List[str] = []
+        self._index: Dict[str, int] = {}
+        for code in codes:
+            code = normalize_code(code)
+            if code is not None and code not in self._index:
+                self._index[code] = len(self.labels)
+                self.labels.append(code)
+        self._other = len(self.labels)
+        self.labels.append(OTHER_LABEL)
+
+        size = len(self.labels)
+        self._lock = threading.Lock()
+        self._confusion = [[0] * size for _ in range(size)]
+        self._human_totals = [0] * size
+        self._model_totals = [0] * size
+        self._agree = 0
+        self._marginal_products = 0  # sum(human_totals[i] * model_totals[i])
+        self.n = 0
+        self.skipped = 0  # 没有人工编码的行
+        self._human = array('h')
+        self._model = array('h')
+
+    def code_index(self, code) -> Optional[int]:
+        code = normalize_code(code)
+        if code is None:
+            return None
+        return self._index.get(code, self._other)
+
+    def add(self, human_code, model_code, error: bool = False):
+        """记录一条结果；没有人工编码的行不计入"""
+        h = self.code_index(human_code)
+        if h is None:
+            with self._lock:
+                self.skipped += 1
+            return
+        m = self._other if error else self.code_index(model_code)
+        if m is None:
+            m = self._other
+        with self._lock:
+            self._confusion[h][m] += 1
+            self._human_totals[h] += 1
+            self._marginal_products += self._model_totals[h]
+            self._model_totals[m] += 1
+            self._marginal_products += self._human_totals[m]
+            self._agree += int(h == m)
+            self.n += 1
+            self._human.append(h)
+            self._model.append(m)
+
+    def snapshot(self, z: float = 1.96) -> Dict:
+        """当前的准确率和 kappa 及其置信区间（O(1)）"""
+        with self._lock:
+            n, agree, products = self.n, self._agree, self._marginal_products
+        if not n:
+            return {'n': 0, 'accuracy': 0.0, 'kappa': 0.0,
+                    'accuracy_ci': (0.0, 1.0), 'kappa_ci': (-1.0, 1.0)}
+        observed = agree / n
+        expected = products / (n * n)
+        if expected < 1:
+            kappa = (observed - expected) / (1 - expected)
+            # kappa 的大样本近似标准误
+            half = z * math.sqrt(observed * (1 - observed) / n) / (1 - expected)
+        else:
+            kappa, half = 1.0, 0.0
+        return {'n': n, 'accuracy': observed, 'kappa': kappa,
+                'accuracy_ci': wilson_interval(agree, n, z),
+                'kappa_ci': (max(-1.0, kappa - half), min(1.0, kappa + half))}
+
+    def arrays(self) -> Tuple['np.ndarray', 'np.ndarray']:
+        """整数编码后的人工编码列和模型编码列"""
+        import numpy as np
+        with self._lock:
+            return (np.frombuffer(self._human.tobytes(), dtype=np.int16).copy(),
+                    np.frombuffer(self._model.tobytes(), dtype=np.int16).copy())
+
+    def final(self) -> Dict:
+        """对整列结果做向量化汇总：混淆矩阵、kappa、各编码 precision/recall/F1"""
+        import numpy as np
+        human, model = self.arrays()
+        size = len(self.labels)
+        n = len(human)
+        confusion = np.bincount(human.astype(np.int64) * size + model, minlength=size * size).reshape(size, size)
+        diag = np.diag(confusion).astype(float)
+        support = confusion.sum(axis=1).astype(float)
+        predicted = confusion.sum(axis=0).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0, diag / predicted, 0.0)
+            recall = np.where(support > 0, diag / support, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+        accuracy = diag.sum() / n if n else 0.0
+        expected = float((support * predicted).sum()) / (n * n) if n else 0.0
+        kappa = (accuracy - expected) / (1 - expected) if n and expected < 1 else (1.0 if n else 0.0)
+        # 宏平均只计入人工编码中出现过的编码
+        present = support > 0
+        macro_f1 = float(f1[present].mean()) if present.any() else 0.0
+        weighted_f1 = float((f1 * support).sum() / support.sum()) if n else 0.0
+
+        return {
+            'n': n,
+            'skipped': self.skipped,
+            'accuracy': float(accuracy),
+            'kappa': float(kappa),
+            'macro_f1': macro_f1,
+            'weighted_f1': weighted_f1,
+            'labels': list(self.labels),
+            'confusion': confusion.tolist(),
+            'per_code': [
+                {'code': label, 'precision': float(precision[i]), 'recall': float(recall[i]),
+                 'f1': float(f1[i]), 'support': int(support[i]), 'predicted': int(predicted[i])}
+                for i, label in enumerate(self.labels)
+                if support[i] or predicted[i]
+            ],
+        }
+
+    @staticmethod
+    def sheets(metrics: Dict) -> List[Tuple[str, List[str], List[list]]]:
+        """final() 结果对应的工作表：(表名, 表头, 行)"""
+        summary = [
+            ['有人工编码的条数', metrics['n']],
+            ['无人工编码的条数', metrics['skipped']],
+            ['准确率', round(metrics['accuracy'], 4)],
+            ["Cohen's kappa", round(metrics['kappa'], 4)],
+            ['宏平均 F1', round(metrics['macro_f1'], 4)],
+            ['加权平均 F1', round(metrics['weighted_f1'], 4)],
+        ]
+        labels = metrics['labels']
+        confusion = [[label] + row for label, row in zip(labels, metrics['confusion'])]
+        per_code = [[c['code'], round(c['precision'], 4), round(c['recall'], 4), round(c['f1'], 4),
+                     c['support'], c['predicted']] for c in metrics['per_code']]
+        return [
+            ('Agreement', ['metric', 'value'], summary),
+            ('Confusion Matrix', ['人工 \\ 模型'] + labels, confusion),
+            ('Per-Code Metrics', ['code', 'precision', 'recall', 'f1', 'support', 'predicted'], per_code),
+        ]
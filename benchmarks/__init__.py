@@ -0,0 +1,7 @@
+"""基准测试工具：本地模拟 API 服务、合成数据生成和 process_file 性能基准
+
+在仓库根目录运行，例如：
+
+    python -m benchmarks.mock_server --port 8765 --latency 0.3
+    python -m benchmarks.run --sizes 1000,10000 --workers 4,16 --pack-sizes 1,10
+"""
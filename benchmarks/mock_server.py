@@ -0,0 +1,257 @@
+import re
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+from prompt_template import BATCH_INSTRUCTION
+from rate_limiter import estimate_tokens
+
+DEFAULT_CODES = ('a', 'b', 'c', 'd', 'e')
+_CODES_PATTERN = re.compile(r"可选编码为：([^。\n]+)")
+_NUMBERED_LINE = re.compile(r"^\[(\d+)\] ?(.*)$")
+
+
+def _text_hash(text: str, salt: str = '') -> int:
+    return int.from_bytes(hashlib.blake2b((salt + ' '.join(text.split())).encode('utf-8'),
+                                          digest_size=8).digest(), 'big')
+
+
+def oracle_code(text: str, codes: Sequence[str]) -> str:
+    """合成数据的"正确"编码：由文本哈希决定，数据生成器和模拟服务共用"""
+    return codes[_text_hash(text) % len(codes)]
+
+
+def mock_answer(text: str, codes: Sequence[str], accuracy: float) -> str:
+    """模拟模型的答案：按 accuracy 的比例给出正确编码，其余给出另一个编码
+
+    结果只由文本决定，重复文本、缓存和重跑得到的答案一致。
+    """
+    truth = oracle_code(text, codes)
+    if len(codes) < 2 or (_text_hash(text, 'accuracy') % 10000) < accuracy * 10000:
+        return truth
+    others = [c for c in codes if c != truth]
+    return others[_text_hash(text, 'wrong') % len(others)]
+
+
+class MockSettings:
+    """模拟服务的行为参数，可在运行中修改"""
+    def __init__(self, latency: float = 0.2, sigma: float = 0.5, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 0.5, accuracy: float = 0.8,
+                 codes: Sequence[str] = DEFAULT_CODES, seed: Optional[int] = None):
+        self.latency = latency  # 延迟中位数（秒），对数正态分布
+        self.sigma = sigma  # 对数正态分布的形状参数，越大长尾越重
+        self.error_rate = error_rate  # 返回 500 的比例
+        self.throttle_rate = throttle_rate  # 返回 429 的比例
+        self.retry_after = retry_after
+        self.accuracy = accuracy
+        self.codes = tuple(codes)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """抽取一次请求的延迟和结果类型"""
+        with self.lock:
+            delay = self.random.lognormvariate(math.log(self.latency), self.sigma) if self.latency > 0 else 0.0
+            roll = self.random.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, 200
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 响应头和响应体分开写出时避免 40ms 的延迟确认
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, chunks: List[bytes]):
+        """以 SSE 分块发送流式响应（chunked 编码，连接保持可复用）"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # 客户端读到有效编码后提前断开
+
+    def do_POST(self):
+        server: 'MockChatServer' = self.server.owner
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.path.endswith('/chat/completions'):
+            self._send(404, b'{"error": "not found"}')
+            return
+        try:
+            request = json.loads(body)
+            messages = request['messages']
+        except (ValueError, KeyError, TypeError):
+            self._send(400, b'{"error": "bad request"}')
+            return
+
+        server.enter()
+        try:
+            delay, status = server.settings.sample()
+            time.sleep(delay)
+            if status == 429:
+                server.count('throttled')
+                self._send(429, b'{"error": "rate limited"}',
+                           {'Retry-After': f"{server.settings.retry_after:g}"})
+                return
+            if status != 200:
+                server.count('errors')
+                self._send(status, b'{"error": "internal error"}')
+                return
+            content = server.answer(messages)
+            prompt_tokens = sum(estimate_tokens(m.get('content', '')) for m in messages)
+            server.count('completed')
+            if request.get('stream'):
+                events = [{'choices': [{'index': 0, 'delta': {'content': piece}}]} for piece in content]
+                events.append({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+                self._send_stream([b'data: ' + json.dumps(e, ensure_ascii=False).encode('utf-8') + b'\n\n'
+                                   for e in events] + [b'data: [DONE]\n\n'])
+                return
+            payload = json.dumps({
+                'id': 'mock', 'object': 'chat.completion', 'model': request.get('model', 'mock'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': estimate_tokens(content),
+                          'total_tokens': prompt_tokens + estimate_tokens(content)},
+            }, ensure_ascii=False).encode('utf-8')
+            self._send(200, payload)
+        finally:
+            server.leave()
+
+
+class MockChatServer:
+    """本地的 OpenAI 兼容 /v1/chat/completions 模拟服务，在后台线程中运行
+
+    延迟服从对数正态分布，可按比例返回 429（带 Retry-After）或 500，
+    答案由文本哈希决定并按 accuracy 的比例与合成数据的 hcode 一致；
+    打包请求（system 消息带打包说明）按编号返回 JSON 数组；stream 为真时逐字符以 SSE 返回。
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, settings: Optional[MockSettings] = None):
+        self.settings = settings or MockSettings()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockChatServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """在当前线程中运行（命令行方式）"""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'requests': 0, 'completed': 0, 'throttled': 0, 'errors': 0,
+                           'in_flight': 0, 'peak_in_flight': 0}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def enter(self):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['in_flight'] += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._stats['in_flight'])
+
+    def leave(self):
+        with self._lock:
+            self._stats['in_flight'] -= 1
+
+    def answer(self, messages: List[Dict[str, str]]) -> str:
+        """根据消息内容生成答案：单条返回编码字母，打包请求返回 JSON 数组"""
+        system = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+        match = _CODES_PATTERN.search(system)
+        codes = [c.strip().lower() for c in match.group(1).split(',')] if match else list(self.settings.codes)
+        text = messages[-1].get('content', '') if len(messages) > 1 else system
+        if BATCH_INSTRUCTION.strip() in system:
+            texts = []
+            for line in text.splitlines():
+                numbered = _NUMBERED_LINE.match(line)
+                if numbered:
+                    texts.append(numbered.group(2))
+            return json.dumps([mock_answer(t, codes, self.settings.accuracy) for t in texts])
+        return mock_answer(text, codes, self.settings.accuracy)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Local mock OpenAI-compatible chat completions server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help="median latency in seconds")
+    parser.add_argument('--sigma', type=float, default=0.5, help="lognormal shape (tail heaviness)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of HTTP 500 responses")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of HTTP 429 responses")
+    parser.add_argument('--retry-after', type=float, default=0.5)
+    parser.add_argument('--accuracy', type=float, default=0.8, help="fraction of answers matching hcode")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(args.latency, args.sigma, args.error_rate, args.throttle_rate,
+                            args.retry_after, args.accuracy, seed=args.seed)
+    server = MockChatServer(args.host, args.port, settings)
+    print(f"Mock server listening on {server.base_url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats()), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
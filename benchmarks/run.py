@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+from typing import Dict, List, Optional
+
+from benchmarks.mock_server import MockChatServer, MockSettings
+from benchmarks.workload import make_workbook
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，不统计内存峰值
+    resource = None
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+# 回归比较的指标：(名称, 越大越好)
+COMPARED_METRICS = (('rows_per_sec', True), ('total_p95', False), ('total_p99', False), ('peak_rss_mb', False))
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_case(case: Dict, queue):
+    """在独立子进程中运行一次 process_file，内存峰值不受其它用例影响"""
+    try:
+        from processor import TextProcessor
+        processor = TextProcessor({
+            'base_url': case['base_url'], 'api_key': 'benchmark', 'model': 'mock',
+            'max_workers': case['workers'], 'pack_size': case['pack_size'],
+            'dedup': case['dedup'], 'use_cache': False, 'resume': False,
+        }, lambda current, total: None)
+        baseline_rss = _peak_rss_mb()
+        try:
+            results = processor.process_file(case['input'], case['output_dir'], 'calibrate')
+        finally:
+            processor.close()
+        os.remove(results['save_file'])
+        telemetry = results['telemetry']
+        queue.put({
+            'rows': results['processed'],
+            'seconds': results['time'],
+            'rows_per_sec': results['processed'] / results['time'] if results['time'] else 0.0,
+            'accuracy': results.get('accuracy'),
+            'requests': telemetry['requests'],
+            'retries': telemetry['retries'],
+            'errors': telemetry['errors'],
+            'total_p50': telemetry['total_p50'],
+            'total_p95': telemetry['total_p95'],
+            'total_p99': telemetry['total_p99'],
+            'ttfb_p95': telemetry['ttfb_p95'],
+            'prompt_tokens': telemetry['prompt_tokens'],
+            'completion_tokens': telemetry['completion_tokens'],
+            'peak_rss_mb': _peak_rss_mb(),
+            'baseline_rss_mb': baseline_rss,
+        })
+    except Exception as e:
+        queue.put({'error': str(e)})
+
+
+def run_case(case: Dict, timeout: float = 3600) -> Dict:
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_case, args=(case, queue))
+    process.start()
+    try:
+        result = queue.get(timeout=timeout)
+    finally:
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+    return result
+
+
+def case_key(case: Dict) -> str:
+    return f"rows={case['rows']} workers={case['workers']} pack={case['pack_size']} dedup={int(case['dedup'])}"
+
+
+def compare(current: List[Dict], baseline: List[Dict], threshold: float) -> List[str]:
+    """与基线结果比较，返回超过阈值的退化项"""
+    previous = {case_key(entry['case']): entry['result'] for entry in baseline}
+    regressions = []
+    for entry in current:
+        key = case_key(entry['case'])
+        old, new = previous.get(key), entry['result']
+        if not old or 'error' in old or 'error' in new:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            if not old.get(metric) or new.get(metric) is None:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            print(f"  {key:45s} {metric:12s} {old[metric]:10.3f} -> {new[metric]:10.3f} ({change:+.1%})",
+                  file=sys.stderr)
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{key} {metric} {change:+.1%}")
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark process_file against a local mock API server")
+    parser.add_argument('--sizes', type=_int_list, default=[1000], help="comma-separated row counts")
+    parser.add_argument('--workers', type=_int_list, default=[4], help="comma-separated worker counts")
+    parser.add_argument('--pack-sizes', type=_int_list, default=[1], help="comma-separated pack sizes")
+    parser.add_argument('--dedup', choices=['on', 'off', 'both'], default='on')
+    parser.add_argument('--dup-rate', type=float, default=0.0, help="fraction of repeated texts in the workload")
+    parser.add_argument('--latency', type=float, default=0.05, help="mock median latency in seconds")
+    parser.add_argument('--sigma', type=float, default=0.5, help="mock lognormal shape")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=None, help="where generated workbooks are kept (default: temp dir)")
+    parser.add_argument('--output', default=None, help="result JSON file (default: benchmarks/results/<time>.json)")
+    parser.add_argument('--compare', default=None, help="baseline result JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='coding_bench_')
+    os.makedirs(data_dir, exist_ok=True)
+    dedup_options = {'on': [True], 'off': [False], 'both': [True, False]}[args.dedup]
+    settings = MockSettings(args.latency, args.sigma, args.error_rate, args.throttle_rate,
+                            args.retry_after, seed=args.seed)
+
+    entries = []
+    with MockChatServer(settings=settings) as server:
+        for rows in args.sizes:
+            input_path = os.path.join(data_dir, f"bench_{rows}_{args.dup_rate:g}_{args.seed}.xlsx")
+            if not os.path.exists(input_path):
+                make_workbook(input_path, rows, dup_rate=args.dup_rate, seed=args.seed)
+            for workers, pack_size, dedup in itertools.product(args.workers, args.pack_sizes, dedup_options):
+                case = {'rows': rows, 'workers': workers, 'pack_size': pack_size, 'dedup': dedup,
+                        'input': input_path, 'output_dir': data_dir, 'base_url': server.base_url}
+                server.reset_stats()
+                result = run_case(case)
+                result['server'] = server.stats()
+                entries.append({'case': {k: v for k, v in case.items()
+                                         if k not in ('input', 'output_dir', 'base_url')},
+                                'result': result})
+                if 'error' in result:
+                    print(f"{case_key(case)}: error {result['error']}", file=sys.stderr)
+                else:
+                    print(f"{case_key(case)}: {result['rows_per_sec']:.1f} rows/s, "
+                          f"p95 {result['total_p95']:.3f}s, p99 {result['total_p99']:.3f}s, "
+                          f"peak {result['peak_rss_mb'] or 0:.0f} MB", file=sys.stderr)
+
+    report = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'mock': {'latency': args.latency, 'sigma': args.sigma, 'error_rate': args.error_rate,
+                 'throttle_rate': args.throttle_rate, 'dup_rate': args.dup_rate},
+        'entries': entries,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d_%H%M%S") + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(output)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('mock') != report['mock']:
+            print(f"Warning: baseline used different mock settings {baseline.get('mock')}", file=sys.stderr)
+        regressions = compare(entries, baseline['entries'], args.threshold)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
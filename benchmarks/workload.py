@@ -0,0 +1,100 @@
+import os
+import sys
+import random
+import argparse
+from typing import List, Optional, Sequence
+
+from benchmarks.mock_server import DEFAULT_CODES, oracle_code
+
+_CATEGORIES = {
+    'a': ('赞同', '表示同意或支持他人观点', '我同意你的看法'),
+    'b': ('疑问', '提出问题或表示不理解', '这里为什么要这样做？'),
+    'c': ('补充', '在他人观点基础上补充信息', '另外还可以参考第三章'),
+    'd': ('反对', '提出不同意见或质疑', '我觉得这个结论不太对'),
+    'e': ('情感', '表达情绪或感受', '学到了很多，很开心'),
+}
+_FRAGMENTS = (
+    '我觉得', '这个观点', '老师讲得', '很有道理', '不太理解', '为什么', '同学说的', '补充一点',
+    '课程内容', '作业里', '第三章', '有点难', '学到了', '谢谢分享', '例子', '实验结果',
+    '讨论区', '我不同意', '可以参考', '总的来说', '其实', '下次', '再看一遍', '很开心',
+)
+
+
+def synthetic_text(rng: random.Random, min_len: int, max_len: int) -> str:
+    """由常见片段随机拼成一条中文评论"""
+    target = rng.randint(min_len, max_len)
+    parts = []
+    length = 0
+    while length < target:
+        fragment = rng.choice(_FRAGMENTS)
+        parts.append(fragment)
+        length += len(fragment)
+        if rng.random() < 0.2:
+            parts.append(rng.choice('，。？！'))
+            length += 1
+    return ''.join(parts)[:max_len]
+
+
+def generate_texts(rows: int, dup_rate: float = 0.0, min_len: int = 10, max_len: int = 120,
+                   seed: int = 0) -> List[str]:
+    """生成 rows 条文本，其中约 dup_rate 比例是前面文本的重复"""
+    rng = random.Random(seed)
+    texts: List[str] = []
+    for i in range(rows):
+        if texts and rng.random() < dup_rate:
+            texts.append(rng.choice(texts))
+        else:
+            texts.append(f"{synthetic_text(rng, min_len, max_len)}（{i}）")
+    return texts
+
+
+def make_workbook(path: str, rows: int, codes: Sequence[str] = DEFAULT_CODES, dup_rate: float = 0.0,
+                  min_len: int = 10, max_len: int = 120, notes: Optional[Sequence[str]] = None,
+                  seed: int = 0) -> str:
+    """生成带 'Coding Results'、'code' 和 'notes' 表的合成工作簿
+
+    hcode 与模拟服务的"正确"编码一致，模拟服务的 accuracy 即为预期准确率。
+    """
+    from openpyxl import Workbook
+
+    codes = sorted(codes)
+    wb = Workbook(write_only=True)
+    results = wb.create_sheet('Coding Results')
+    results.append(['id', 'text', 'hcode'])
+    for i, text in enumerate(generate_texts(rows, dup_rate, min_len, max_len, seed), 1):
+        results.append([i, text, oracle_code(text, codes)])
+
+    code_sheet = wb.create_sheet('code')
+    code_sheet.append(['code_num', 'code', 'explain', 'example'])
+    for code in codes:
+        name, explain, example = _CATEGORIES.get(code, (f'类别{code}', f'属于类别{code}的文本', ''))
+        code_sheet.append([code, name, explain, example])
+    code_sheet.append(['f', '无法编码', '与课程无关或无法判断', '哈哈'])
+
+    note_sheet = wb.create_sheet('notes')
+    for note in notes if notes is not None else ('短评论按语气判断', '同时提问和反对时编码为反对'):
+        note_sheet.append([note])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    wb.save(path)
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic coding workbook")
+    parser.add_argument('output', help="path of the .xlsx file to create")
+    parser.add_argument('-n', '--rows', type=int, default=1000)
+    parser.add_argument('--codes', default=','.join(DEFAULT_CODES), help="comma-separated code letters")
+    parser.add_argument('--dup-rate', type=float, default=0.0, help="fraction of repeated texts")
+    parser.add_argument('--min-len', type=int, default=10)
+    parser.add_argument('--max-len', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    make_workbook(args.output, args.rows, [c.strip() for c in args.codes.split(',') if c.strip()],
+                  args.dup_rate, args.min_len, args.max_len, seed=args.seed)
+    print(args.output, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import random
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from fewshot import hashed_ngrams
+
+# numpy 只在训练或加载本地分类器时导入
+if TYPE_CHECKING:
+    import numpy as np
+
+CASCADE_VERSION = 1
+TEMPERATURES = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0)
+
+
+class LocalClassifier:
+    """本地多项式朴素贝叶斯分类器，特征为散列后的字符 n-gram，只需 NumPy 和 CPU
+
+    对数似然按文本的 n-gram 数取平均，再乘以温度后做 softmax 得到置信度；
+    温度在交叉验证的预测上按对数损失选取，使置信度大致可信。
+    """
+    def __init__(self, dim: int = 1 << 17, ngram_range: Tuple[int, int] = (1, 3), alpha: float = 0.1):
+        self.dim = int(dim)
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.alpha = alpha
+        self.classes: List[str] = []
+        self.temperature = 1.0
+        self._log_prior = None
+        self._log_lik = None
+
+    def fit(self, texts: Sequence[str], codes: Sequence[str]) -> 'LocalClassifier':
+        import numpy as np
+        self.classes = sorted(set(codes))
+        position = {code: i for i, code in enumerate(self.classes)}
+        counts = np.zeros((len(self.classes), self.dim), dtype=np.float64)
+        docs = np.zeros(len(self.classes), dtype=np.float64)
+        for text, code in zip(texts, codes):
+            features, tf = hashed_ngrams(text, self.dim, self.ngram_range)
+            counts[position[code], features] += tf
+            docs[position[code]] += 1
+        counts += self.alpha
+        self._log_lik = (np.log(counts) - np.log(counts.sum(axis=1, keepdims=True))).astype(np.float32)
+        self._log_prior = np.log(docs / docs.sum())
+        return self
+
+    def _logits(self, texts: Sequence[str]) -> 'np.ndarray':
+        import numpy as np
+        logits = np.empty((len(texts), len(self.classes)))
+        for row, text in enumerate(texts):
+            features, tf = hashed_ngrams(text, self.dim, self.ngram_range)
+            if len(features):
+                logits[row] = self._log_lik[:, features] @ tf / tf.sum()
+            else:
+                logits[row] = 0.0
+        return logits
+
+    def _proba(self, logits: 'np.ndarray', temperature: float) -> 'np.ndarray':
+        import numpy as np
+        scaled = logits * temperature + self._log_prior
+        scaled -= scaled.max(axis=1, keepdims=True)
+        proba = np.exp(scaled)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, texts: Sequence[str]) -> Tuple[List[str], 'np.ndarray']:
+        """返回每条文本的预测编码和置信度（最大后验概率）"""
+        if not texts:
+            import numpy as np
+            return [], np.zeros(0)
+        proba = self._proba(self._logits(texts), self.temperature)
+        best = proba.argmax(axis=1)
+        return [self.classes[i] for i in best], proba.max(axis=1)
+
+    def fit_temperature(self, logits: 'np.ndarray', codes: Sequence[str]) -> float:
+        """在留出数据上按对数损失选择温度"""
+        import numpy as np
+        position = {code: i for i, code in enumerate(self.classes)}
+        known = [i for i, code in enumerate(codes) if code in position]
+        if not known:
+            return self.temperature
+        targets = np.array([position[codes[i]] for i in known])
+
+        def loss(temperature: float) -> float:
+            proba = self._proba(logits[known], temperature)
+            return float(-np.log(np.maximum(proba[np.arange(len(known)), targets], 1e-12)).mean())
+        self.temperature = min(TEMPERATURES, key=loss)
+        return self.temperature
+
+    def arrays(self) -> Dict[str, 'np.ndarray']:
+        import numpy as np
+        return {
+            'params': np.array([CASCADE_VERSION, self.dim, *self.ngram_range], dtype=np.int64),
+            'classes': np.array(self.classes, dtype=str),
+            'temperature': np.array([self.temperature]),
+            'log_prior': self._log_prior,
+            'log_lik': self._log_lik,
+        }
+
+    @classmethod
+    def from_arrays(cls, data) -> 'LocalClassifier':
+        params = [int(v) for v in data['params']]
+        if params[0] != CASCADE_VERSION:
+            raise ValueError(f"Unsupported cascade model version: {params[0]}")
+        classifier = cls(params[1], (params[2], params[3]))
+        classifier.classes = [str(c) for c in data['classes']]
+        classifier.temperature = float(data['temperature'][0])
+        classifier._log_prior = data['log_prior']
+        classifier._log_lik = data['log_lik']
+        return classifier
+
+
+def cross_validate(texts: Sequence[str], codes: Sequence[str], folds: int = 5,
+                   seed: int = 0) -> Tuple[LocalClassifier, List[str], 'np.ndarray']:
+    """k 折交叉验证：每条文本都由没见过它的模型预测，再用全部数据训练最终模型
+
+    返回最终模型，以及每条文本的折外预测和置信度（用于无偏地选择阈值）。
+    """
+    import numpy as np
+    order = list(range(len(texts)))
+    random.Random(seed).shuffle(order)
+    folds = max(2, min(folds, len(texts)))
+    final = LocalClassifier().fit(texts, codes)
+    # 训练折中没有出现的编码取极小的对数似然，列按最终模型的编码顺序对齐
+    logits = np.full((len(texts), len(final.classes)), -1e9)
+    for fold in range(folds):
+        held = order[fold::folds]
+        held_set = set(held)
+        train = [i for i in order if i not in held_set]
+        model = LocalClassifier(final.dim, final.ngram_range, final.alpha).fit(
+            [texts[i] for i in train], [codes[i] for i in train])
+        columns = [final.classes.index(c) for c in model.classes]
+        logits[np.ix_(held, columns)] = model._logits([texts[i] for i in held])
+    final.fit_temperature(logits, codes)
+    proba = final._proba(logits, final.temperature)
+    best = proba.argmax(axis=1)
+    return final, [final.classes[i] for i in best], proba.max(axis=1)
+
+
+def tune_threshold(confidences: Sequence[float], correct: Sequence[bool], target_accuracy: float,
+                   min_rows: int = 20) -> Tuple[float, int, float]:
+    """选出最低的置信度阈值，使阈值以上的本地预测准确率不低于目标值
+
+    返回 (阈值, 阈值以上的条数, 这些行的准确率)；达不到目标时阈值为 inf，不在本地编码。
+    """
+    import numpy as np
+    confidences = np.asarray(confidences, dtype=np.float64)
+    correct = np.asarray(correct, dtype=np.float64)
+    order = np.argsort(-confidences, kind='stable')
+    running = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    # 只能在置信度变化处切分，相同置信度的行必须一起决定
+    sorted_conf = confidences[order]
+    cut = np.append(sorted_conf[1:] < sorted_conf[:-1], True)
+    ok = np.nonzero(cut & (running >= target_accuracy) & (np.arange(1, len(order) + 1) >= min_rows))[0]
+    if not len(ok):
+        return float('inf'), 0, 0.0
+    m = int(ok[-1])
+    return float(sorted_conf[m]), m + 1, float(running[m])
+
+
+class Cascade:
+    """本地分类器与路由阈值：置信度不低于阈值的文本直接在本地编码，其余交给模型"""
+    def __init__(self, classifier: LocalClassifier, threshold: float,
+                 expected_accuracy: Optional[float] = None, trained_rows: int = 0):
+        self.classifier = classifier
+        self.threshold = threshold
+        self.expected_accuracy = expected_accuracy
+        self.trained_rows = trained_rows
+
+    def route(self, texts: Sequence[str]) -> List[Optional[Tuple[str, float]]]:
+        """每条文本的本地编码和置信度；置信度不够时为 None"""
+        codes, confidences = self.classifier.predict(texts)
+        return [(code, float(conf)) if conf >= self.threshold else None
+                for code, conf in zip(codes, confidences)]
+
+    def save(self, path: str):
+        import numpy as np
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, threshold=np.array([self.threshold]),
+                     expected_accuracy=np.array([self.expected_accuracy if self.expected_accuracy is not None
+                                                 else np.nan]),
+                     trained_rows=np.array([self.trained_rows]), **self.classifier.arrays())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'Cascade':
+        import numpy as np
+        with np.load(path) as data:
+            expected = float(data['expected_accuracy'][0])
+            return cls(LocalClassifier.from_arrays(data), float(data['threshold'][0]),
+                       None if expected != expected else expected, int(data['trained_rows'][0]))
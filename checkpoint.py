@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, List, Tuple
+
+
+def file_fingerprint(file_path: str, *extra: str) -> str:
+    """输入文件内容和运行参数的哈希，用于判断日志是否属于同一个任务"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    for value in extra:
+        digest.update(b'\0' + str(value).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CheckpointJournal:
+    """追加写入的逐行结果日志，长任务中断后重新运行时跳过已完成的行
+
+    第一行记录任务指纹，其后每行一条结果。指纹不一致（输入、模型或提示词变化）时丢弃旧日志；
+    崩溃时写了一半的最后一行会被忽略。出错的行不算完成，续跑时会重新请求。
+    """
+    FSYNC_INTERVAL = 1.0  # 至少每隔多少秒把日志刷到磁盘
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.completed: Dict[int, Tuple[Dict, List[str]]] = {}
+        self._last_sync = time.monotonic()
+
+        if self._load():
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+            self._write({'fingerprint': fingerprint})
+            self.sync()
+
+    def _load(self) -> bool:
+        """读取已有日志，返回日志是否属于当前任务"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return False
+            if header.get('fingerprint') != self.fingerprint:
+                return False
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # 崩溃时未写完的最后一行
+                if 'error' not in record['result']:
+                    self.completed[record['index']] = (record['result'], record['output'])
+        return True
+
+    def _write(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+
+    def append(self, index: int, result_item: Dict, realtime_output: List[str]):
+        """记录一行结果"""
+        self._write({'index': index, 'result': result_item, 'output': realtime_output})
+        if time.monotonic() - self._last_sync >= self.FSYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def remove(self):
+        """任务完成并成功保存后删除日志"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,432 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import configparser
+from typing import Dict, List, Optional
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='coding_system',
+        description='Code educational texts with an OpenAI-compatible model (headless).'
+    )
+    parser.add_argument('input', help='input file (.xlsx/.xls/.csv/.jsonl/.parquet)')
+    parser.add_argument('-o', '--output-dir', help='directory for the result workbook (default: input directory)')
+    parser.add_argument('-m', '--mode', choices=['calibrate', 'encode', 'experiment', 'sample'], default='encode',
+                        help='calibrate compares with the hcode column; encode only codes; '
+                             'experiment ranks model x prompt configurations on hcode data; '
+                             'sample calibrates on a stratified sample until the confidence interval is narrow '
+                             '(default: encode)')
+    parser.add_argument('--code-file', help='codebook side file, required for non-Excel input')
+    parser.add_argument('--notes-file', help='calibration notes side file')
+    parser.add_argument('--prompt-file', help='custom prompt with a [文本] placeholder')
+
+    exp = parser.add_argument_group('experiment mode')
+    exp.add_argument('--models', help='comma-separated model names to compare (default: --model)')
+    exp.add_argument('--variant-prompt', action='append', default=[], metavar='FILE',
+                     help='extra prompt variant to compare with the generated prompt (repeatable)')
+    exp.add_argument('--initial-sample', type=int, default=50, help='rows per configuration in round 1 (default: 50)')
+    exp.add_argument('--eta', type=int, default=2, help='multiply the sample by eta each round (default: 2)')
+    exp.add_argument('--seed', type=int, default=0, help='sample order seed for experiment/sample modes (default: 0)')
+
+    sample = parser.add_argument_group('sample mode')
+    sample.add_argument('--target-width', type=float, default=0.05,
+                        help='stop when the accuracy confidence interval is narrower than this (default: 0.05)')
+    sample.add_argument('--kappa-width', type=float, help='also require the kappa interval to be this narrow')
+    sample.add_argument('--confidence', type=float, default=0.95, help='confidence level (default: 0.95)')
+    sample.add_argument('--min-sample', type=int, default=30, help='evaluate at least this many rows (default: 30)')
+
+    add_settings_arguments(parser)
+    return parser
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    """API 和吞吐相关的参数，单文件模式和任务队列共用"""
+    api = parser.add_argument_group('API settings (default: config.ini, then environment)')
+    api.add_argument('--config', default='config.ini', help='settings file written by the GUI (default: config.ini)')
+    api.add_argument('--base-url', help='API base URL (env: CODING_SYSTEM_BASE_URL)')
+    api.add_argument('--api-key', help='API key (env: CODING_SYSTEM_API_KEY or OPENAI_API_KEY)')
+    api.add_argument('--model', help='model name')
+
+    perf = parser.add_argument_group('throughput')
+    perf.add_argument('-j', '--workers', type=int, default=4, help='requests in flight (default: 4)')
+    perf.add_argument('-k', '--pack-size', type=int, default=1, help='texts per request (default: 1)')
+    perf.add_argument('--rpm', type=int, help='requests per minute limit, 0 = unlimited')
+    perf.add_argument('--tpm', type=int, help='tokens per minute limit, 0 = unlimited')
+    perf.add_argument('--max-retries', type=int,
+                      help='retries for timeouts, connection resets and 5xx, with jittered backoff (default: 3)')
+    perf.add_argument('--row-deadline', type=float,
+                      help='seconds one row may spend on requests and retries, 0 = unlimited (default: 120)')
+    perf.add_argument('--hedge', action='store_true',
+                      help='send a duplicate request when one exceeds the observed p95 latency, take the first answer')
+    perf.add_argument('--no-cache', action='store_true', help='bypass the on-disk response cache')
+    perf.add_argument('--cache-path', default='response_cache.sqlite3', help='response cache database')
+    perf.add_argument('--no-dedup', action='store_true', help='send duplicate texts separately')
+    perf.add_argument('--votes', type=int, default=1,
+                      help='self-consistency: sample up to N answers per text (default: 1 = off)')
+    perf.add_argument('--vote-agree', type=int, default=2,
+                      help='stop sampling once one code has this many votes (default: 2)')
+    perf.add_argument('--constrained', action='store_true',
+                      help='limit max_tokens to the code alphabet, stream single answers and retry invalid codes')
+    perf.add_argument('--no-logit-bias', action='store_true',
+                      help='constrained mode: do not bias valid code tokens (needs tiktoken otherwise)')
+    perf.add_argument('--examples', help='human-coded file (text + hcode columns) to retrieve few-shot examples from')
+    perf.add_argument('--fewshot-k', type=int, default=3, help='similar examples per text (default: 3)')
+    perf.add_argument('--fewshot-tokens', type=int, default=400,
+                      help='token budget for the examples of one request (default: 400)')
+    perf.add_argument('--cascade', action='store_true',
+                      help='code confident texts with a local classifier; calibrate mode trains it and tunes the threshold')
+    perf.add_argument('--cascade-target', type=float, default=0.95,
+                      help='accuracy the locally coded rows must reach in calibration (default: 0.95)')
+    perf.add_argument('--cascade-path', default='cascade_model.npz', help='local classifier model file')
+    perf.add_argument('--no-resume', action='store_true', help='do not write or resume from a checkpoint journal')
+
+    parser.add_argument('-q', '--quiet', action='store_true', help='no progress output on stderr')
+
+
+def build_queue_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='coding_system queue',
+        description='Queue many input files (or watch folders) and process them with one shared worker pool.'
+    )
+    parser.add_argument('inputs', nargs='*', help='input files to enqueue')
+    parser.add_argument('--db', default='job_queue.sqlite3', help='persistent queue database (default: job_queue.sqlite3)')
+    parser.add_argument('-o', '--output-dir', help='directory for result workbooks (default: each input directory)')
+    parser.add_argument('-m', '--mode', choices=['calibrate', 'encode'], default='encode',
+                        help='mode of the enqueued files (default: encode)')
+    parser.add_argument('-p', '--priority', type=int, default=0, help='higher runs first (default: 0)')
+    parser.add_argument('--code-file', help='codebook side file, required for non-Excel input')
+    parser.add_argument('--notes-file', help='calibration notes side file')
+    parser.add_argument('--prompt-file', help='custom prompt with a [文本] placeholder')
+    parser.add_argument('--watch', action='append', default=[], metavar='DIR',
+                        help='enqueue new input files that appear in this folder (repeatable); runs until interrupted')
+    parser.add_argument('--concurrent-jobs', type=int, default=2,
+                        help='files processed at the same time, sharing the worker pool (default: 2)')
+    parser.add_argument('--poll', type=float, default=5.0, help='seconds between folder scans (default: 5)')
+    parser.add_argument('--add-only', action='store_true', help='enqueue the inputs and exit without processing')
+    parser.add_argument('--list', action='store_true', help='print the queue as JSON and exit')
+    add_settings_arguments(parser)
+    return parser
+
+
+def load_api_settings(args: argparse.Namespace, prefer_config: bool = False) -> Dict:
+    """合并命令行参数、环境变量和 GUI 保存的 config.ini
+
+    优先级依次为命令行参数、环境变量、配置文件；prefer_config 时配置文件优先于环境变量，
+    用于分片工作进程各自的凭据和端点。
+    """
+    config = configparser.ConfigParser()
+    if args.config and os.path.exists(args.config):
+        config.read(args.config)
+
+    def pick(value, env_names: List[str], key: str, fallback=''):
+        if value is not None:
+            return value
+        if prefer_config and config.has_option('API', key):
+            return config.get('API', key)
+        for name in env_names:
+            if os.environ.get(name):
+                return os.environ[name]
+        return config.get('API', key, fallback=fallback)
+
+    return {
+        'base_url': pick(args.base_url, ['CODING_SYSTEM_BASE_URL'], 'base_url'),
+        'api_key': pick(args.api_key, ['CODING_SYSTEM_API_KEY', 'OPENAI_API_KEY'], 'api_key'),
+        'model': pick(args.model, ['CODING_SYSTEM_MODEL'], 'model', 'gpt-4-0613'),
+        'rpm': int(pick(args.rpm, [], 'rpm', 0) or 0),
+        'tpm': int(pick(args.tpm, [], 'tpm', 0) or 0),
+        'max_retries': int(pick(args.max_retries, [], 'max_retries', 3)),
+        'row_deadline': float(pick(args.row_deadline, [], 'row_deadline', 120)),
+        'hedge': args.hedge,
+        'max_workers': args.workers,
+        'pack_size': args.pack_size,
+        'use_cache': not args.no_cache,
+        'cache_path': args.cache_path,
+        'resume': not args.no_resume,
+        'dedup': not args.no_dedup,
+        'vote_samples': args.votes,
+        'vote_agree': args.vote_agree,
+        'constrained': args.constrained,
+        'logit_bias': not args.no_logit_bias,
+        'examples_path': args.examples,
+        'fewshot_k': args.fewshot_k,
+        'fewshot_tokens': args.fewshot_tokens,
+        'cascade': args.cascade,
+        'cascade_target': args.cascade_target,
+        'cascade_path': args.cascade_path,
+    }
+
+
+class ProgressReporter:
+    """在 stderr 上输出节流后的进度"""
+    def __init__(self, quiet: bool, interval: float = 1.0):
+        self.quiet = quiet
+        self.interval = interval
+        self._last = 0.0
+        self._start = time.monotonic()
+
+    def __call__(self, current: int, total: int):
+        if self.quiet:
+            return
+        now = time.monotonic()
+        if now - self._last < self.interval and current != total:
+            return
+        self._last = now
+        rate = current / max(now - self._start, 1e-9)
+        sys.stderr.write(f"\r{current}/{total} ({current / max(total, 1):.0%}) {rate:.1f} rows/s")
+        if current == total:
+            sys.stderr.write("\n")
+        sys.stderr.flush()
+
+
+def read_prompt(path: Optional[str]) -> Optional[str]:
+    """读取 --prompt-file 的自定义提示词，未指定时为 None；在与输入文件相同的 try 中调用"""
+    if not path:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def summarize(results: Dict) -> Dict:
+    """去掉逐行输出，只保留可序列化的汇总字段"""
+    return {k: v for k, v in results.items() if k not in ('realtime_outputs', 'start_time')}
+
+
+def run_experiment_mode(processor, args: argparse.Namespace, custom_prompt: Optional[str]) -> Dict:
+    """实验模式：生成的提示词、--prompt-file 和各 --variant-prompt 与各模型两两组合"""
+    from experiment import AUTO_PROMPT, run_experiment
+
+    prompts = {AUTO_PROMPT: None}
+    if custom_prompt:
+        prompts[os.path.basename(args.prompt_file)] = custom_prompt
+    for path in args.variant_prompt:
+        with open(path, 'r', encoding='utf-8') as f:
+            prompts[os.path.basename(path)] = f.read()
+    models = [m.strip() for m in (args.models or '').split(',') if m.strip()] or [processor.model]
+    return run_experiment(
+        processor, args.input, args.output_dir or os.path.dirname(os.path.abspath(args.input)),
+        models, prompts, args.code_file, args.notes_file, args.initial_sample, args.eta, args.seed
+    )
+
+
+def build_shard_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='coding_system shard',
+        description='Split one input into shards, code them with several worker processes or machines '
+                    'sharing a work directory, and merge the results in the original row order.'
+    )
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    plan = actions.add_parser('plan', help='split an input file into shards in WORKDIR')
+    run = actions.add_parser('run', help='plan, run local worker processes and merge')
+    for sub in (plan, run):
+        sub.add_argument('input', help='input file (.xlsx/.xls/.csv/.jsonl/.parquet)')
+        sub.add_argument('workdir', help='shared work directory')
+        sub.add_argument('-m', '--mode', choices=['calibrate', 'encode'], default='encode')
+        sub.add_argument('--shard-size', type=int, default=500, help='rows per shard (default: 500)')
+        sub.add_argument('--code-file', help='codebook side file, required for non-Excel input')
+        sub.add_argument('--notes-file', help='calibration notes side file')
+        sub.add_argument('--prompt-file', help='custom prompt with a [文本] placeholder')
+    run.add_argument('--processes', type=int, default=2, help='local worker processes (default: 2)')
+    run.add_argument('--worker-config', action='append', default=[], metavar='INI',
+                     help='config.ini with credentials/endpoint for a worker process, overriding environment '
+                          'variables (repeatable, used round-robin)')
+
+    worker = actions.add_parser('worker', help='process shards from WORKDIR until none are left')
+    worker.add_argument('workdir', help='shared work directory')
+    worker.add_argument('--worker-id', help='name recorded in the shard table (default: host:pid)')
+    for sub in (run, worker):
+        sub.add_argument('--lease', type=float, default=120.0,
+                         help='seconds before an unresponsive worker\'s shard is handed to another (default: 120)')
+        add_settings_arguments(sub)
+
+    merge = actions.add_parser('merge', help='merge finished shards into one workbook')
+    merge.add_argument('workdir', help='shared work directory')
+    for sub in (run, merge):
+        sub.add_argument('-o', '--output-dir', help='directory for the merged workbook (default: input directory)')
+
+    status = actions.add_parser('status', help='print shard status as JSON')
+    status.add_argument('workdir', help='shared work directory')
+    return parser
+
+
+def shard_main(argv: List[str]) -> int:
+    """coding_system shard：分片规划、工作进程、合并和状态查询"""
+    import sharding
+
+    args = build_shard_parser().parse_args(argv)
+    try:
+        if args.action == 'status':
+            queue = sharding.ShardQueue(args.workdir)
+            try:
+                print(json.dumps({'counts': queue.counts(), 'shards': queue.shards()}, ensure_ascii=False))
+            finally:
+                queue.close()
+            return 0
+
+        if args.action in ('plan', 'run'):
+            meta = sharding.plan_shards(args.input, args.workdir, args.mode, args.shard_size,
+                                        args.code_file, args.notes_file, read_prompt(args.prompt_file))
+            if args.action == 'plan':
+                print(json.dumps({'total': meta['total'], 'workdir': args.workdir}))
+                return 0
+
+        if args.action in ('worker', 'run'):
+            # 每个工作进程的配置文件（--worker-config，或 worker 的 --config）优先于环境变量
+            configs = getattr(args, 'worker_config', None) or [args.config]
+            per_worker = bool(getattr(args, 'worker_config', None)) or args.action == 'worker'
+            worker_settings = [load_api_settings(argparse.Namespace(**{**vars(args), 'config': path}),
+                                                 prefer_config=per_worker)
+                               for path in configs]
+            if any(not s['base_url'] or not s['api_key'] for s in worker_settings):
+                print(json.dumps({'error': 'API base URL and key are required'}))
+                return 2
+            if args.action == 'worker':
+                from processor import TextProcessor
+                processor = TextProcessor(worker_settings[0], lambda current, total: None)
+                try:
+                    stats = sharding.run_worker(processor, args.workdir, args.worker_id, args.lease)
+                finally:
+                    processor.close()
+                print(json.dumps(stats))
+                return 1 if stats['failed'] else 0
+            sharding.run_local_workers(args.workdir, worker_settings, args.processes, args.lease)
+
+        meta = sharding.ShardQueue(args.workdir)
+        try:
+            input_path = meta.meta().get('input', '')
+        finally:
+            meta.close()
+        results = sharding.merge_shards(args.workdir,
+                                        args.output_dir or os.path.dirname(os.path.abspath(input_path)))
+    except Exception as e:
+        print(json.dumps({'error': str(e)}, ensure_ascii=False))
+        return 1
+    print(json.dumps(summarize(results), ensure_ascii=False, default=str))
+    return 0
+
+
+def queue_main(argv: List[str]) -> int:
+    """coding_system queue：文件入队后按优先级处理，结束时打印各状态的任务数"""
+    from job_queue import JobRunner, JobStore
+
+    args = build_queue_parser().parse_args(argv)
+    store = JobStore(args.db)
+    try:
+        if args.list:
+            print(json.dumps(store.jobs(), ensure_ascii=False))
+            return 0
+        try:
+            prompt = read_prompt(args.prompt_file)
+            for path in args.inputs:
+                store.add(path, args.output_dir or os.path.dirname(os.path.abspath(path)), args.mode,
+                          args.priority, args.code_file, args.notes_file, prompt)
+        except Exception as e:
+            print(json.dumps({'error': str(e)}, ensure_ascii=False))
+            return 1
+        if args.add_only:
+            print(json.dumps(store.counts()))
+            return 0
+
+        api_settings = load_api_settings(args)
+        if not api_settings['base_url'] or not api_settings['api_key']:
+            print(json.dumps({'error': 'API base URL and key are required'}))
+            return 2
+
+        from processor import TextProcessor
+
+        processor = TextProcessor(api_settings, lambda current, total: None)
+        runner = JobRunner(processor, store, args.concurrent_jobs, args.poll,
+                           on_update=None if args.quiet else QueueReporter(store))
+        for folder in args.watch:
+            runner.watch(folder, args.output_dir, args.mode, args.priority, args.code_file, args.notes_file)
+        try:
+            runner.run(exit_when_idle=True)
+        except KeyboardInterrupt:
+            runner.stop(wait=True)
+        finally:
+            processor.close()
+            if not args.quiet:
+                sys.stderr.write("\n")
+        counts = store.counts()
+        print(json.dumps(counts))
+        return 1 if counts['failed'] else 0
+    finally:
+        store.close()
+
+
+class QueueReporter:
+    """在 stderr 上输出节流后的队列进度"""
+    def __init__(self, store, interval: float = 1.0):
+        self.store = store
+        self.interval = interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last < self.interval:
+                return
+            self._last = now
+        jobs = self.store.jobs()
+        running = ' '.join(f"#{j['id']} {j['processed']}/{j['total']}" for j in jobs if j['status'] == 'running')
+        counts = {}
+        for job in jobs:
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+        sys.stderr.write(f"\rqueued {counts.get('queued', 0)} done {counts.get('done', 0)} "
+                         f"failed {counts.get('failed', 0)} | {running}\033[K")
+        sys.stderr.flush()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口：不导入 PyQt，进度输出到 stderr，结束后在 stdout 打印 JSON 摘要"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['queue']:
+        return queue_main(argv[1:])
+    if argv[:1] == ['shard']:
+        return shard_main(argv[1:])
+    args = build_parser().parse_args(argv)
+    api_settings = load_api_settings(args)
+    if not api_settings['base_url'] or not api_settings['api_key']:
+        print(json.dumps({'error': 'API base URL and key are required'}))
+        return 2
+
+    from processor import TextProcessor
+
+    processor = TextProcessor(api_settings, ProgressReporter(args.quiet))
+    try:
+        custom_prompt = read_prompt(args.prompt_file)
+        if args.mode == 'experiment':
+            results = run_experiment_mode(processor, args, custom_prompt)
+        elif args.mode == 'sample':
+            from sampling import run_sampled_calibration
+            results = run_sampled_calibration(
+                processor, args.input, args.output_dir or os.path.dirname(os.path.abspath(args.input)),
+                custom_prompt, args.code_file, args.notes_file, args.target_width, args.kappa_width,
+                args.confidence, args.min_sample, args.seed
+            )
+        else:
+            results = processor.process_file(
+                args.input,
+                args.output_dir or os.path.dirname(os.path.abspath(args.input)),
+                args.mode,
+                custom_prompt,
+                args.code_file,
+                args.notes_file
+            )
+    except Exception as e:
+        print(json.dumps({'error': str(e)}, ensure_ascii=False))
+        return 1
+    finally:
+        processor.close()
+
+    print(json.dumps(summarize(results), ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
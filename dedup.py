@@ -0,0 +1,27 @@
+import hashlib
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable
+
+# NFKC 之外再统一的常见中文全角标点
+_PUNCTUATION = str.maketrans({
+    '。': '.', '、': ',', '“': '"', '”': '"', '‘': "'", '’': "'",
+    '【': '[', '】': ']', '《': '<', '》': '>', '～': '~', '…': '...',
+})
+
+
+def normalize_text(text: str) -> str:
+    """归一化文本：全角转半角、统一中文标点、合并空白、忽略大小写"""
+    text = unicodedata.normalize('NFKC', text).translate(_PUNCTUATION)
+    return ' '.join(text.split()).casefold()
+
+
+def text_key(text: str) -> bytes:
+    """归一化文本的短哈希，作为去重分组的键"""
+    return hashlib.blake2b(normalize_text(text).encode('utf-8'), digest_size=8).digest()
+
+
+def duplicate_groups(texts: Iterable[str]) -> Dict[bytes, int]:
+    """预扫描所有文本，返回出现不止一次的分组键及其出现次数"""
+    counts = Counter(text_key(text) for text in texts)
+    return {key: count for key, count in counts.items() if count > 1}
@@ -0,0 +1,227 @@
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from agreement import normalize_code, wilson_interval
+from input_reader import open_input
+from telemetry import Telemetry
+
+if TYPE_CHECKING:
+    from processor import TextProcessor
+    from prompt_template import PromptTemplate
+
+AUTO_PROMPT = 'auto'  # 由编码表自动生成的提示词
+
+
+class Candidate:
+    """实验矩阵中的一个配置（模型 × 提示词）及其已评估的样本"""
+    def __init__(self, model: str, prompt_label: str, template: 'PromptTemplate'):
+        self.model = model
+        self.prompt_label = prompt_label
+        self.template = template
+        self.evaluated = 0
+        self.correct = 0
+        self.errors = 0
+        self.eliminated_at: Optional[int] = None  # 在第几轮后被淘汰
+        self.history: List[Tuple[int, float]] = []  # 每轮结束时的 (样本数, 准确率)
+
+    @property
+    def label(self) -> str:
+        return f"{self.model} / {self.prompt_label}"
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct / self.evaluated if self.evaluated else 0.0
+
+    def summary(self) -> Dict:
+        low, high = wilson_interval(self.correct, self.evaluated)
+        return {
+            'config': self.label, 'model': self.model, 'prompt': self.prompt_label,
+            'evaluated': self.evaluated, 'correct': self.correct, 'errors': self.errors,
+            'accuracy': self.accuracy, 'ci_low': low, 'ci_high': high,
+            'eliminated_after_round': self.eliminated_at,
+        }
+
+
+def halving_budgets(total_rows: int, initial_sample: int, eta: int) -> List[int]:
+    """每轮每个存活配置累计评估的样本数：initial_sample, ×eta, ... 直到全部数据"""
+    budgets = []
+    n = max(1, min(initial_sample, total_rows))
+    while True:
+        budgets.append(n)
+        if n >= total_rows:
+            return budgets
+        n = min(total_rows, n * eta)
+
+
+def planned_calls(alive: int, budgets: Sequence[int], done: int = 0) -> int:
+    """存活配置不再被淘汰时，从已评估 done 条起跑完其余各轮还需的请求数（用于显示进度）"""
+    return sum(alive * (n - max(previous, done))
+               for previous, n in zip([0, *budgets], budgets) if n > done)
+
+
+def significantly_worse(candidates: Sequence[Candidate]) -> List[Candidate]:
+    """准确率的 Wilson 区间上界低于领先配置区间下界的配置
+
+    只淘汰明显更差的配置：准确率相同的配置区间相同，不会被拆开，
+    样本还少、区间重叠时全部保留到下一轮。
+    """
+    intervals = {c: wilson_interval(c.correct, c.evaluated) for c in candidates}
+    leader_low = max(low for low, _ in intervals.values())
+    return [c for c in candidates if intervals[c][1] < leader_low]
+
+
+def run_experiment(processor: 'TextProcessor', file_path: str, save_path: str, models: Sequence[str],
+                   prompts: Dict[str, Optional[str]], code_path: Optional[str] = None,
+                   notes_path: Optional[str] = None, initial_sample: int = 50, eta: int = 2,
+                   seed: int = 0) -> Dict:
+    """模型 × 提示词实验：在同一份带 hcode 的数据上并发评估所有配置，逐轮淘汰（successive halving）
+
+    每轮所有存活配置在同一批随机样本上评估，然后淘汰准确率 95% Wilson 区间上界低于领先配置
+    区间下界的配置，存活配置的样本数乘以 eta，直到只剩一个配置或用完全部数据。
+    prompts 为 {名称: 自定义提示词}，值为 None 表示由编码表自动生成。
+    """
+    if not models or not prompts:
+        raise ValueError("At least one model and one prompt are required")
+    eta = max(2, int(eta))
+
+    with open_input(file_path, code_path, notes_path) as source:
+        text_col = source.column_index('text')
+        hcode_col = source.column_index('hcode')
+        code_df, notes = source.code_df, source.notes
+        rows = []
+        for values in source.iter_rows():
+            hcode = normalize_code(values[hcode_col])
+            if hcode is None:
+                continue
+            text = '' if values[text_col] is None else str(values[text_col])
+            rows.append((len(rows) + 1, text, hcode))
+    if not rows:
+        raise ValueError("No rows with an hcode value to evaluate")
+    # 打乱顺序，使每轮的前 n 条都是随机样本；同一 seed 下所有配置使用相同的样本
+    random.Random(seed).shuffle(rows)
+
+    processor.load_examples(code_path)
+    templates = {}
+    for label, prompt in prompts.items():
+        template = processor.compile_prompt(code_df, notes, prompt)
+        # 与已有变体完全相同的提示词（例如编辑器中未修改的自动提示词）不重复评估
+        if all(template.system != t.system for t in templates.values()):
+            templates[label] = template
+    candidates = [Candidate(model, label, template) for model in models for label, template in templates.items()]
+    budgets = halving_budgets(len(rows), initial_sample, eta)
+    planned = planned_calls(len(candidates), budgets)
+
+    processor.telemetry = Telemetry()
+    start_time = time.time()
+    calls = 0
+    alive = list(candidates)
+    rounds = []
+
+    def evaluate(candidate: Candidate, row: Tuple[int, str, str]) -> Tuple[Candidate, Tuple, str, Optional[str]]:
+        _, text, hcode = row
+        try:
+            examples = processor.retrieve_examples([text], 'calibrate')
+            code = processor.answer(candidate.template.messages(text, examples), candidate.template.valid_codes,
+                                    model=candidate.model)
+        except Exception as e:
+            return candidate, row, '', str(e)
+        valid = candidate.template.valid_codes
+        if valid is not None and code not in valid:
+            return candidate, row, code, f"Invalid code: {code}"
+        return candidate, row, code, None
+
+    with ThreadPoolExecutor(max_workers=processor.max_workers) as executor:
+        for round_index, n in enumerate(budgets, 1):
+            futures = [executor.submit(evaluate, candidate, row)
+                       for candidate in alive for row in rows[candidate.evaluated:n]]
+            for future in as_completed(futures):
+                candidate, (index, text, hcode), code, error = future.result()
+                candidate.evaluated += 1
+                candidate.correct += int(error is None and code == hcode)
+                candidate.errors += int(error is not None)
+                calls += 1
+                processor.telemetry.record_rows()
+                if processor.result_callback:
+                    processor.result_callback({
+                        'index': index, 'display_text': f"[{candidate.label}] {text[:50]}",
+                        'model_code': code, 'human_code': hcode, 'error': error,
+                    })
+                processor.progress_callback(min(calls, planned), planned)
+
+            ranked = sorted(alive, key=lambda c: (-c.accuracy, c.errors, c.label))
+            for candidate in ranked:
+                candidate.history.append((n, candidate.accuracy))
+            rounds.append({'round': round_index, 'sample': n,
+                           'alive': [c.label for c in ranked],
+                           'accuracy': [round(c.accuracy, 4) for c in ranked]})
+            if len(alive) == 1 or n >= len(rows):
+                break
+            eliminated = significantly_worse(ranked)
+            for candidate in eliminated:
+                candidate.eliminated_at = round_index
+            alive = [c for c in ranked if c not in eliminated]
+            planned = calls + planned_calls(len(alive), budgets, n)
+            if len(alive) == 1:
+                break
+
+    ranking = sorted(candidates, key=lambda c: (c.eliminated_at is not None, -(c.eliminated_at or 0),
+                                                -c.accuracy, c.errors, c.label))
+    winner = ranking[0]
+    full_cost = len(candidates) * len(rows)
+
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    save_file = os.path.join(save_path, f"{base_name}_experiment_{timestamp}.xlsx")
+    results = {
+        'processed': calls,
+        'total': full_cost,
+        'start_time': start_time,
+        'time': time.time() - start_time,
+        'save_file': save_file,
+        'winner': winner.label,
+        'accuracy': winner.accuracy,
+        'cost_ratio': calls / full_cost,
+        'ranking': [c.summary() for c in ranking],
+        'rounds': rounds,
+        'telemetry': processor.telemetry.summary(),
+        'realtime_outputs': [],
+    }
+    _save_report(save_file, results, prompts, processor.telemetry)
+    return results
+
+
+def _save_report(save_file: str, results: Dict, prompts: Dict[str, Optional[str]], telemetry: Telemetry):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ranking = wb.create_sheet('Experiment')
+    columns = ['config', 'model', 'prompt', 'evaluated', 'correct', 'errors',
+               'accuracy', 'ci_low', 'ci_high', 'eliminated_after_round']
+    ranking.append(columns)
+    for entry in results['ranking']:
+        ranking.append([entry[c] for c in columns])
+
+    rounds = wb.create_sheet('Rounds')
+    rounds.append(['round', 'sample', 'config', 'accuracy'])
+    for entry in results['rounds']:
+        for label, accuracy in zip(entry['alive'], entry['accuracy']):
+            rounds.append([entry['round'], entry['sample'], label, accuracy])
+
+    prompt_sheet = wb.create_sheet('Prompts')
+    prompt_sheet.append(['prompt', 'text'])
+    for label, prompt in prompts.items():
+        prompt_sheet.append([label, prompt if prompt else '（由编码表自动生成）'])
+
+    stats = wb.create_sheet('Statistics')
+    stats.append(['最佳配置', '准确率', '请求数', '完整矩阵请求数', '成本比例', '处理时间'])
+    stats.append([results['winner'], results['accuracy'], results['processed'], results['total'],
+                  f"{results['cost_ratio']:.1%}", f"{results['time']:.1f}秒"])
+
+    telemetry_sheet = wb.create_sheet('Telemetry')
+    telemetry_sheet.append(['metric', 'value'])
+    for row in telemetry.sheet_rows():
+        telemetry_sheet.append(list(row))
+    wb.save(save_file)
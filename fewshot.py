@@ -0,0 +1,211 @@
+import os
+import zlib
+import hashlib
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Set, Tuple
+
+from dedup import normalize_text, text_key
+from rate_limiter import estimate_tokens
+
+# numpy 只在建立或加载索引时导入
+if TYPE_CHECKING:
+    import numpy as np
+
+INDEX_VERSION = 1
+Example = Tuple[str, str, float]  # (文本, 人工编码, 相似度)
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = (1, 3)) -> List[str]:
+    """归一化文本的字符 n-gram（中文按字切分即可，不需要分词）"""
+    text = normalize_text(text)
+    low, high = ngram_range
+    return [text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1)]
+
+
+def hashed_ngrams(text: str, dim: int, ngram_range: Tuple[int, int] = (1, 3)) -> Tuple['np.ndarray', 'np.ndarray']:
+    """字符 n-gram 用 crc32 散列到 [0, dim) 后的特征编号和词频（编号升序、不重复）"""
+    import numpy as np
+    grams = char_ngrams(text, ngram_range)
+    hashed = np.fromiter((zlib.crc32(g.encode('utf-8')) % dim for g in grams), dtype=np.int64, count=len(grams))
+    features, counts = np.unique(hashed, return_counts=True)
+    return features.astype(np.int32), counts.astype(np.float32)
+
+
+class ExampleIndex:
+    """人工编码样例的字符 n-gram TF-IDF 检索索引，纯 NumPy 实现，不联网
+
+    n-gram 用 crc32 散列到固定维度，新增样例不会改变已有样例的特征，
+    因此索引可以增量追加；IDF 和向量长度在每次追加后按文档频次重新计算。
+    样例以 CSR 形式保存（每条样例的特征编号和词频），检索时使用按特征排序的倒排表。
+    """
+    def __init__(self, dim: int = 1 << 18, ngram_range: Tuple[int, int] = (1, 3)):
+        import numpy as np
+        self.dim = int(dim)
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.texts: List[str] = []
+        self.codes: List[str] = []
+        self.keys: List[bytes] = []  # 归一化文本的 text_key，用于增量去重和排除待编码文本本身
+        self._seen: Set[Tuple[bytes, str]] = set()
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._counts = np.zeros(0, dtype=np.float32)
+        self._postings = None
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def _features(self, text: str) -> Tuple['np.ndarray', 'np.ndarray']:
+        return hashed_ngrams(text, self.dim, self.ngram_range)
+
+    def add(self, examples: Iterable[Tuple[str, str]]) -> int:
+        """追加 (文本, 人工编码) 样例，已在索引中的相同文本和编码跳过；返回新增条数"""
+        import numpy as np
+        indices, counts, lengths = [], [], []
+        for text, code in examples:
+            text, code = str(text).strip(), str(code).strip().lower()
+            if not text or not code:
+                continue
+            key = text_key(text)
+            if (key, code) in self._seen:
+                continue
+            self._seen.add((key, code))
+            features, tf = self._features(text)
+            self.texts.append(text)
+            self.codes.append(code)
+            self.keys.append(key)
+            indices.append(features)
+            counts.append(tf)
+            lengths.append(len(features))
+        if not lengths:
+            return 0
+        self._indptr = np.concatenate([self._indptr, self._indptr[-1] + np.cumsum(lengths)])
+        self._indices = np.concatenate([self._indices] + indices)
+        self._counts = np.concatenate([self._counts] + counts)
+        self._postings = None
+        return len(lengths)
+
+    def _build_postings(self):
+        """按特征排序的倒排表，以及带 IDF 的样例向量长度"""
+        import numpy as np
+        n = len(self.texts)
+        docs = np.repeat(np.arange(n, dtype=np.int64), np.diff(self._indptr))
+        df = np.bincount(self._indices, minlength=self.dim)
+        idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        weights = (1 + np.log(self._counts)) * idf[self._indices]
+        norms = np.sqrt(np.bincount(docs, weights=weights * weights, minlength=n)).astype(np.float32)
+        order = np.argsort(self._indices, kind='stable')
+        ptr = np.searchsorted(self._indices[order], np.arange(self.dim + 1))
+        keys = np.frombuffer(b''.join(self.keys), dtype=np.uint64)
+        self._postings = (idf, norms, ptr, docs[order], weights[order], keys)
+
+    def search(self, text: str, k: int, exclude: Optional[bytes] = None) -> List[Example]:
+        """余弦相似度最高的 k 条样例；exclude 为 text_key，用于校准时排除待编码文本本身"""
+        import numpy as np
+        if not self.texts or k <= 0:
+            return []
+        if self._postings is None:
+            self._build_postings()
+        idf, norms, ptr, post_docs, post_weights, keys = self._postings
+        features, tf = self._features(text)
+        if not len(features):
+            return []
+        query = (1 + np.log(tf)) * idf[features]
+        starts, lengths = ptr[features], ptr[features + 1] - ptr[features]
+        # 一次性取出所有查询特征的倒排区间并按样例累加
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        positions = offsets + np.arange(lengths.sum())
+        scores = np.bincount(post_docs[positions], weights=post_weights[positions] * np.repeat(query, lengths),
+                             minlength=len(self.texts)).astype(np.float64)
+        scores /= np.maximum(norms, 1e-12) * max(float(np.linalg.norm(query)), 1e-12)
+        if exclude is not None:
+            scores[keys == np.frombuffer(exclude, dtype=np.uint64)[0]] = 0.0
+        top = min(k, len(scores))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(self.texts[i], self.codes[i], float(scores[i])) for i in best if scores[i] > 0]
+
+    def select(self, texts: Sequence[str], k: int, max_tokens: int, exclude_self: bool = False) -> List[Example]:
+        """为一条或一组文本选出样例：每条文本取最相似的 k 条，按名次轮流合并，总长不超过 max_tokens"""
+        ranked = [self.search(text, k, text_key(text) if exclude_self else None) for text in texts]
+        chosen, seen, used = [], set(), 0
+        for rank in range(k):
+            for candidates in ranked:
+                if rank >= len(candidates) or candidates[rank][:2] in seen:
+                    continue
+                cost = estimate_tokens(candidates[rank][0]) + 8
+                if used + cost > max_tokens:
+                    continue
+                seen.add(candidates[rank][:2])
+                chosen.append(candidates[rank])
+                used += cost
+        return chosen
+
+    def digest(self) -> str:
+        """索引内容的哈希，写入检查点指纹"""
+        digest = hashlib.sha256()
+        for key, code in zip(self.keys, self.codes):
+            digest.update(key + code.encode('utf-8') + b'\0')
+        return digest.hexdigest()[:16]
+
+    def save(self, path: str):
+        """保存为 .npz；先写临时文件再替换，中断时不会留下损坏的索引"""
+        import numpy as np
+        encoded = [t.encode('utf-8') for t in self.texts]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                params=np.array([INDEX_VERSION, self.dim, *self.ngram_range], dtype=np.int64),
+                indptr=self._indptr, indices=self._indices, counts=self._counts,
+                text_bytes=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                text_offsets=np.cumsum([0] + [len(t) for t in encoded], dtype=np.int64),
+                codes=np.array(self.codes, dtype=str),
+                keys=np.array(self.keys, dtype='S8'),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, dim: int = 1 << 18, ngram_range: Tuple[int, int] = (1, 3)) -> 'ExampleIndex':
+        """读取已保存的索引；文件不存在、损坏或参数不同时返回空索引"""
+        import numpy as np
+        index = cls(dim, ngram_range)
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path) as data:
+                if list(data['params']) != [INDEX_VERSION, index.dim, *index.ngram_range]:
+                    return index
+                blob = data['text_bytes'].tobytes()
+                offsets = data['text_offsets']
+                index.texts = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+                index.codes = [str(c) for c in data['codes']]
+                index.keys = [bytes(k).ljust(8, b'\0') for k in data['keys']]
+                index._indptr = data['indptr']
+                index._indices = data['indices']
+                index._counts = data['counts']
+        except (OSError, ValueError, KeyError):
+            return cls(dim, ngram_range)
+        index._seen = set(zip(index.keys, index.codes))
+        return index
+
+
+def load_example_index(examples_path: str, code_path: Optional[str] = None,
+                       index_path: Optional[str] = None) -> ExampleIndex:
+    """打开样例文件中已有人工编码（hcode）的行，增量更新磁盘上的索引
+
+    样例文件与输入文件格式相同（需要 text 和 hcode 列）；索引默认保存在样例文件旁边。
+    """
+    from input_reader import open_input
+
+    index_path = index_path or f"{examples_path}.fewshot.npz"
+    index = ExampleIndex.load(index_path)
+    with open_input(examples_path, code_path) as source:
+        text_col = source.column_index('text')
+        hcode_col = source.column_index('hcode')
+        added = index.add(
+            (values[text_col], values[hcode_col]) for values in source.iter_rows()
+            if values[text_col] is not None and values[hcode_col] is not None
+            and values[hcode_col] == values[hcode_col]  # 跳过 NaN
+        )
+    if added:
+        index.save(index_path)
+    return index
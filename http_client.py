@@ -0,0 +1,240 @@
+import time
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+# http.client 连带导入 email、ssl 等模块，推迟到第一次建立连接时再导入
+if TYPE_CHECKING:
+    import http.client
+
+
+class HTTPResponse(NamedTuple):
+    """一次请求的结果（响应体已完整读出）及其耗时分解（秒）"""
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    connect_time: float = 0.0  # 建立 TCP/TLS 连接，复用连接时为 0
+    ttfb: float = 0.0  # 从发出请求到收到响应头
+    total_time: float = 0.0  # 含建立连接、等待和读取响应体
+    reused: bool = False
+
+
+class HTTPClient:
+    """带 keep-alive 连接池的 HTTP(S) 客户端，在多次请求之间复用 TCP/TLS 连接"""
+    # 流式读取提前停止后，剩余响应不超过这么多字节、这么多秒内读完时读完并复用连接
+    DRAIN_BYTES = 64 * 1024
+    DRAIN_SECONDS = 1.0
+
+    def __init__(self, base_url: str, pool_size: int = 4, timeout: float = 10.0):
+        url = base_url.strip()
+        if url and '://' not in url:
+            url = 'https://' + url
+        parts = urlsplit(url)
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path_prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.pool_size = max(1, int(pool_size))
+
+        self._idle: List['http.client.HTTPConnection'] = []  # 空闲连接（后进先出，优先复用最热的连接）
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {'requests': 0, 'reused': 0, 'connections_created': 0, 'stale_retries': 0,
+                       'early_stops': 0, 'early_closes': 0}
+
+    def full_path(self, path: str) -> str:
+        """拼接 base_url 中的路径前缀，例如 https://host/api/v1 + /v1/chat/completions"""
+        prefix = self.path_prefix
+        if prefix.endswith('/v1') and path.startswith('/v1/'):
+            prefix = prefix[:-3]
+        return prefix + path
+
+    def _new_connection(self) -> 'http.client.HTTPConnection':
+        import http.client
+        if not self.host:
+            raise ValueError("API Base URL is empty or invalid")
+        conn_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return conn_class(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        """从池中取出一个连接，池满时等待其他请求归还"""
+        with self._cond:
+            while not self._idle and self._in_use >= self.pool_size:
+                self._cond.wait()
+            self._in_use += 1
+            if self._idle:
+                self._stats['reused'] += 1
+                return self._idle.pop(), True
+            self._stats['connections_created'] += 1
+        try:
+            return self._new_connection(), False
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, conn: Optional['http.client.HTTPConnection']):
+        """归还连接；conn 为 None 表示该连接已失效并关闭"""
+        with self._cond:
+            self._in_use -= 1
+            if conn is not None:
+                if len(self._idle) + self._in_use < self.pool_size:
+                    self._idle.append(conn)
+                else:
+                    conn.close()
+            self._cond.notify()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None) -> HTTPResponse:
+        """发送请求并读取完整响应，连接在读完后放回池中"""
+        import http.client
+        full_path = self.full_path(path)
+        headers = headers or {}
+        with self._cond:
+            self._stats['requests'] += 1
+
+        conn, reused = self._acquire()
+        while True:
+            try:
+                conn.timeout = timeout if timeout is not None else self.timeout
+                start = time.perf_counter()
+                connect_time = 0.0
+                if conn.sock is None:
+                    conn.connect()
+                    connect_time = time.perf_counter() - start
+                else:
+                    conn.sock.settimeout(conn.timeout)
+                sent = time.perf_counter()
+                conn.request(method, full_path, body, headers)
+                res = conn.getresponse()
+                ttfb = time.perf_counter() - sent
+                data = res.read()
+                response = HTTPResponse(
+                    res.status, {k.lower(): v for k, v in res.getheaders()}, data,
+                    connect_time, ttfb, time.perf_counter() - start, reused
+                )
+                self._release(None if res.will_close else conn)
+                if res.will_close:
+                    conn.close()
+                return response
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                if not reused:
+                    self._release(None)
+                    raise
+                # 复用的连接可能已被服务端关闭，换一个新连接重试一次
+                reused = False
+                with self._cond:
+                    self._stats['stale_retries'] += 1
+                    self._stats['connections_created'] += 1
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    self._release(None)
+                    raise e
+            except Exception:
+                conn.close()
+                self._release(None)
+                raise
+
+    def stream(self, method: str, path: str, body: Optional[bytes] = None,
+               headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None,
+               on_line: Optional[Callable[[bytes], bool]] = None) -> HTTPResponse:
+        """发送请求并逐行读取流式响应（如 SSE），on_line 返回 True 时立即停止读取
+
+        提前停止后剩余的响应（max_tokens 限制下通常只有结束标记和 usage）不再交给 on_line，
+        读完后连接放回池中；剩余太多或太慢时才关闭连接。
+        非 200 响应按普通请求完整读取，响应体放在返回值的 body 中。
+        """
+        import http.client
+        full_path = self.full_path(path)
+        headers = headers or {}
+        with self._cond:
+            self._stats['requests'] += 1
+
+        conn, reused = self._acquire()
+        delivered = False
+        try:
+            conn.timeout = timeout if timeout is not None else self.timeout
+            start = time.perf_counter()
+            connect_time = 0.0
+            if conn.sock is None:
+                conn.connect()
+                connect_time = time.perf_counter() - start
+            else:
+                conn.sock.settimeout(conn.timeout)
+            sent = time.perf_counter()
+            conn.request(method, full_path, body, headers)
+            res = conn.getresponse()
+            ttfb = time.perf_counter() - sent
+            response_headers = {k.lower(): v for k, v in res.getheaders()}
+            data = b''
+            stopped = False
+            if res.status != 200 or on_line is None:
+                data = res.read()
+            else:
+                for line in iter(res.readline, b''):
+                    delivered = True
+                    if on_line(line):
+                        stopped = True
+                        break
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            self._release(None)
+            if reused and not delivered:
+                # 复用的连接可能已被服务端关闭，重新发送一次
+                with self._cond:
+                    self._stats['stale_retries'] += 1
+                    self._stats['requests'] -= 1
+                return self.stream(method, path, body, headers, timeout, on_line)
+            raise
+        except Exception:
+            conn.close()
+            self._release(None)
+            raise
+
+        finished = time.perf_counter()
+        drained = not stopped or self._drain(conn, res)
+        if stopped:
+            with self._cond:
+                self._stats['early_stops'] += 1
+                self._stats['early_closes'] += int(not drained)
+        if not drained or res.will_close:
+            conn.close()
+            self._release(None)
+        else:
+            self._release(conn)
+        return HTTPResponse(res.status, response_headers, data, connect_time, ttfb,
+                            finished - start, reused)
+
+    def _drain(self, conn: 'http.client.HTTPConnection', res: 'http.client.HTTPResponse') -> bool:
+        """读完并丢弃剩余响应，使连接可以复用；超过 DRAIN_BYTES 或 DRAIN_SECONDS 时返回 False"""
+        deadline = time.perf_counter() + self.DRAIN_SECONDS
+        remaining = self.DRAIN_BYTES
+        try:
+            conn.sock.settimeout(self.DRAIN_SECONDS)
+            while remaining > 0 and time.perf_counter() < deadline:
+                chunk = res.read1(min(remaining, 8192))
+                if not chunk:
+                    return res.isclosed()
+                remaining -= len(chunk)
+        except Exception:
+            return False
+        return False
+
+    def stats(self) -> Dict:
+        """连接池统计：请求数、复用率、当前打开的连接数等"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['open_connections'] = len(self._idle) + self._in_use
+            stats['idle_connections'] = len(self._idle)
+            stats['pool_size'] = self.pool_size
+        stats['reuse_rate'] = stats['reused'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            while self._idle:
+                self._idle.pop().close()
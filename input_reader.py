@@ -0,0 +1,243 @@
+import os
+import csv
+import json
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Sequence
+
+# pandas 只在读取编码表等小文件时才按需导入，避免拖慢启动
+if TYPE_CHECKING:
+    import pandas as pd
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS + ('.xls', '.csv', '.jsonl', '.parquet')
+
+
+class InputSource:
+    """输入数据源：逐行惰性读取待编码数据，同时提供编码表和校准说明
+
+    iter_rows() 每次调用都返回一个新的迭代器，按 columns 的顺序产出每行的值，
+    因此需要多遍扫描的功能可以重复读取而不必把整个文件放进内存。
+    """
+    def __init__(self, path: str, columns: Sequence[str], total: int,
+                 row_factory: Callable[[], Iterator[tuple]],
+                 code_df: 'pd.DataFrame', notes: List[str],
+                 on_close: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.columns = list(columns)
+        self.total = total
+        self.code_df = code_df
+        self.notes = notes
+        self._row_factory = row_factory
+        self._on_close = on_close
+
+    def column_index(self, name: str) -> int:
+        if name not in self.columns:
+            raise ValueError(f"Required column '{name}' not found")
+        return self.columns.index(name)
+
+    def iter_rows(self) -> Iterator[tuple]:
+        """按原始顺序逐行产出数据"""
+        return self._row_factory()
+
+    def close(self):
+        if self._on_close:
+            self._on_close()
+            self._on_close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _blank_row(values) -> bool:
+    """整行没有值（空行、只有分隔符的行）；各格式都跳过这样的行，也不计入 total"""
+    return all(v is None or v == '' for v in values)
+
+
+def _notes_from_values(values) -> List[str]:
+    import pandas as pd
+    return [str(note) for note in values if pd.notna(note) and str(note).strip()]
+
+
+def read_codebook(code_path: str) -> 'pd.DataFrame':
+    """读取单独提供的编码表文件（xlsx 的 'code' 表或第一个表、csv、jsonl、parquet）"""
+    import pandas as pd
+    ext = os.path.splitext(code_path)[1].lower()
+    if ext in EXCEL_EXTENSIONS + ('.xls',):
+        xl = pd.ExcelFile(code_path)
+        return xl.parse('code' if 'code' in xl.sheet_names else 0)
+    if ext == '.csv':
+        return pd.read_csv(code_path, encoding='utf-8-sig', dtype=str)
+    if ext == '.jsonl':
+        return pd.read_json(code_path, lines=True, dtype=str)
+    if ext == '.parquet':
+        return pd.read_parquet(code_path)
+    raise ValueError(f"Unsupported codebook file type: {ext}")
+
+
+def read_notes(notes_path: str) -> List[str]:
+    """读取单独提供的校准说明文件：txt 每行一条，其它格式取第一列"""
+    import pandas as pd
+    ext = os.path.splitext(notes_path)[1].lower()
+    if ext in ('.txt', '.md'):
+        with open(notes_path, 'r', encoding='utf-8-sig') as f:
+            return _notes_from_values(line.rstrip('\n') for line in f)
+    if ext in EXCEL_EXTENSIONS + ('.xls',):
+        return _notes_from_values(pd.read_excel(notes_path, header=None)[0])
+    if ext == '.csv':
+        return _notes_from_values(pd.read_csv(notes_path, header=None, encoding='utf-8-sig')[0])
+    raise ValueError(f"Unsupported notes file type: {ext}")
+
+
+def _open_excel(path: str, code_path: Optional[str], notes_path: Optional[str]) -> InputSource:
+    """用 openpyxl 只读模式逐行读取 'Coding Results' 表"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        available_sheets = wb.sheetnames
+        if 'Coding Results' not in available_sheets:
+            raise ValueError("Required sheet 'Coding Results' not found")
+        ws = wb['Coding Results']
+
+        header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        columns = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header_row)]
+        width = len(columns)
+
+        def rows() -> Iterator[tuple]:
+            for values in ws.iter_rows(min_row=2, values_only=True):
+                if _blank_row(values):
+                    continue
+                values = tuple(values[:width])
+                yield values + (None,) * (width - len(values))
+
+        # 用与 rows() 相同的规则数一遍：文件记录的维度会把空行算进去，进度到不了 total
+        total = sum(1 for _ in rows())
+
+        if code_path:
+            code_df = read_codebook(code_path)
+        elif 'code' in available_sheets:
+            code_df = _sheet_frame(wb['code'])
+        else:
+            raise ValueError("Required sheet 'code' not found")
+
+        notes = []
+        if notes_path:
+            notes = read_notes(notes_path)
+        else:
+            note_sheet_name = next((s for s in available_sheets
+                                    if s.lower() in ['note', 'notes']), None)
+            if note_sheet_name:
+                notes = _notes_from_values(
+                    row[0] for row in wb[note_sheet_name].iter_rows(values_only=True) if row
+                )
+    except Exception:
+        wb.close()
+        raise
+
+    return InputSource(path, columns, total, rows, code_df, notes, on_close=wb.close)
+
+
+def _sheet_frame(ws) -> 'pd.DataFrame':
+    """把一个小工作表（编码表）读成 DataFrame"""
+    import pandas as pd
+    values = [row for row in ws.iter_rows(values_only=True) if any(v is not None for v in row)]
+    if not values:
+        return pd.DataFrame()
+    return pd.DataFrame(values[1:], columns=values[0])
+
+
+def _open_csv(path: str) -> tuple:
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        columns = next(csv.reader(f), [])
+    width = len(columns)
+
+    def rows() -> Iterator[tuple]:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for values in reader:
+                if _blank_row(values):
+                    continue
+                yield tuple(values[:width]) + (None,) * (width - len(values))
+
+    # 与 Excel 输入相同：用 rows() 的规则计数，空行既不产出也不计入 total
+    total = sum(1 for _ in rows())
+    return columns, total, rows
+
+
+def _open_jsonl(path: str) -> tuple:
+    columns: List[str] = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            if line.strip():
+                columns = list(json.loads(line).keys())
+                break
+
+    def rows() -> Iterator[tuple]:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    values = tuple(record.get(col) for col in columns)
+                    if not _blank_row(values):
+                        yield values
+
+    total = sum(1 for _ in rows())
+    return columns, total, rows
+
+
+def _open_parquet(path: str) -> tuple:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet input requires pyarrow (pip install pyarrow)")
+    parquet_file = pq.ParquetFile(path)
+    columns = parquet_file.schema_arrow.names
+    total = parquet_file.metadata.num_rows
+
+    def rows() -> Iterator[tuple]:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=1024):
+            yield from zip(*(batch.column(i).to_pylist() for i in range(batch.num_columns)))
+    return columns, total, rows
+
+
+def open_input(path: str, code_path: Optional[str] = None,
+               notes_path: Optional[str] = None) -> InputSource:
+    """打开输入文件；非 Excel 输入必须通过 code_path 提供编码表，notes_path 可选"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in EXCEL_EXTENSIONS:
+        return _open_excel(path, code_path, notes_path)
+
+    if ext == '.xls':
+        # 旧版 xls 无法流式读取，整表读入后逐行产出
+        import pandas as pd
+        xl = pd.ExcelFile(path)
+        if 'Coding Results' not in xl.sheet_names:
+            raise ValueError("Required sheet 'Coding Results' not found")
+        frame = xl.parse('Coding Results')
+        code_df = read_codebook(code_path) if code_path else xl.parse('code')
+        note_sheet_name = next((s for s in xl.sheet_names if s.lower() in ['note', 'notes']), None)
+        if notes_path:
+            notes = read_notes(notes_path)
+        elif note_sheet_name:
+            notes = _notes_from_values(xl.parse(note_sheet_name, header=None)[0])
+        else:
+            notes = []
+        return InputSource(path, list(frame.columns), len(frame),
+                           lambda: frame.itertuples(index=False, name=None), code_df, notes)
+
+    if ext == '.csv':
+        columns, total, rows = _open_csv(path)
+    elif ext == '.jsonl':
+        columns, total, rows = _open_jsonl(path)
+    elif ext == '.parquet':
+        columns, total, rows = _open_parquet(path)
+    else:
+        raise ValueError(f"Unsupported input file type: {ext}")
+
+    if not code_path:
+        raise ValueError(f"A codebook file is required for {ext} input")
+    return InputSource(path, columns, total, rows, read_codebook(code_path),
+                       read_notes(notes_path) if notes_path else [])
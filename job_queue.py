@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from input_reader import SUPPORTED_EXTENSIONS
+from processor import ProcessingCancelled
+
+if TYPE_CHECKING:
+    from processor import TextProcessor
+
+JOB_MODES = ('calibrate', 'encode')
+JOB_STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+
+class JobStore:
+    """基于 SQLite 的持久化任务队列：每个任务是一个待处理的输入文件
+
+    优先级高的任务先处理，同优先级按加入顺序。领取任务的进程记为 owner 并定期刷新 heartbeat；
+    进程退出或失联超过 lease_seconds 的 running 任务在下次领取时重新排队，配合检查点日志
+    从中断处续跑。只查看或加入任务的进程（--list、图形界面）不会影响其它进程正在处理的任务。
+    """
+    def __init__(self, path: str = 'job_queue.sqlite3', lease_seconds: float = 60.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, signature TEXT NOT NULL, "
+            "save_dir TEXT NOT NULL, mode TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0, "
+            "code_path TEXT, notes_path TEXT, prompt TEXT, "
+            "status TEXT NOT NULL DEFAULT 'queued', processed INTEGER NOT NULL DEFAULT 0, "
+            "total INTEGER NOT NULL DEFAULT 0, save_file TEXT, error TEXT, summary TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL, owner TEXT, heartbeat REAL)"
+        )
+        # 旧版本建的表没有 owner / heartbeat 列；其中 running 的任务 heartbeat 为空，视为已过期
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (('owner', 'TEXT'), ('heartbeat', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_next ON jobs(status, priority, id)")
+
+    @staticmethod
+    def signature(path: str) -> str:
+        """文件大小和修改时间；同一个文件内容变化后可以再次入队"""
+        stat = os.stat(path)
+        return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+    def add(self, path: str, save_dir: str, mode: str = 'encode', priority: int = 0,
+            code_path: Optional[str] = None, notes_path: Optional[str] = None,
+            prompt: Optional[str] = None, unique: bool = False) -> Optional[int]:
+        """加入一个任务，返回任务编号；unique 为真且同一文件（大小和修改时间相同）已入队过时返回 None"""
+        if mode not in JOB_MODES:
+            raise ValueError(f"Unsupported job mode: {mode}")
+        path = os.path.abspath(path)
+        signature = self.signature(path)
+        now = time.time()
+        with self._lock:
+            if unique and self._conn.execute(
+                    "SELECT 1 FROM jobs WHERE path = ? AND signature = ? AND status != 'cancelled'",
+                    (path, signature)).fetchone():
+                return None
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (path, signature, save_dir, mode, priority, code_path, notes_path, prompt, "
+                "created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, signature, save_dir, mode, int(priority), code_path, notes_path, prompt, now, now)
+            )
+            return cursor.lastrowid
+
+    def claim(self) -> Optional[Dict]:
+        """取出优先级最高的排队任务并标记为由本进程处理；先把心跳已过期的 running 任务重新排队"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner = NULL, updated = ? "
+                    "WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)",
+                    (now, now - self.lease_seconds)
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE jobs SET status = 'running', error = NULL, owner = ?, "
+                                       "heartbeat = ?, updated = ? WHERE id = ?",
+                                       (self.owner, now, now, row['id']))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row is not None else None
+
+    def _update(self, job_id: int, owned: bool = False, **fields):
+        """更新任务字段；owned 时只更新仍由本进程处理的任务（已被其它进程接手时不覆盖）"""
+        fields['updated'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        condition, params = "id = ?", [job_id]
+        if owned:
+            condition += " AND status = 'running' AND owner = ?"
+            params.append(self.owner)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE {condition}", (*fields.values(), *params))
+
+    def heartbeat(self, job_ids: List[int]) -> List[int]:
+        """刷新本进程处理中任务的心跳，返回已不再属于本进程的任务编号"""
+        if not job_ids:
+            return []
+        now = time.time()
+        placeholders = ', '.join('?' * len(job_ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat = ? WHERE id IN ({placeholders}) "
+                f"AND status = 'running' AND owner = ?", (now, *job_ids, self.owner)
+            )
+            owned = {row[0] for row in self._conn.execute(
+                f"SELECT id FROM jobs WHERE id IN ({placeholders}) AND status = 'running' AND owner = ?",
+                (*job_ids, self.owner))}
+        return [job_id for job_id in job_ids if job_id not in owned]
+
+    def progress(self, job_id: int, processed: int, total: int):
+        self._update(job_id, owned=True, processed=processed, total=total, heartbeat=time.time())
+
+    def finish(self, job_id: int, results: Dict):
+        summary = {k: v for k, v in results.items() if k not in ('realtime_outputs', 'start_time')}
+        self._update(job_id, owned=True, status='done', processed=results.get('processed', 0),
+                     total=results.get('total', 0), save_file=results.get('save_file'),
+                     summary=json.dumps(summary, ensure_ascii=False, default=str))
+
+    def fail(self, job_id: int, error: str):
+        self._update(job_id, owned=True, status='failed', error=error)
+
+    def set_priority(self, job_id: int, priority: int):
+        self._update(job_id, priority=int(priority))
+
+    def requeue(self, job_id: int):
+        """失败或取消的任务重新排队"""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'queued', updated = ? "
+                               "WHERE id = ? AND status IN ('failed', 'cancelled')", (time.time(), job_id))
+
+    def release(self, job_id: int):
+        """本进程中止的任务重新排队，由下一次 claim() 从检查点日志续跑；已被其它进程接手时不变"""
+        self._update(job_id, owned=True, status='queued', owner=None, heartbeat=None)
+
+    def cancel(self, job_id: int):
+        """取消尚未开始的任务；运行中的任务不受影响"""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'cancelled', updated = ? "
+                               "WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+
+    def jobs(self) -> List[Dict]:
+        """所有任务，按状态和优先级排序（运行中、排队、已结束）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, path, mode, priority, status, processed, total, save_file, error, owner FROM jobs "
+                "ORDER BY CASE status WHEN 'running' THEN 0 WHEN 'queued' THEN 1 ELSE 2 END, "
+                "priority DESC, id"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({status: n for status, n in rows})
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobRunner:
+    """按优先级处理任务队列中的文件，所有任务共用一个限流的线程池和连接池
+
+    同时处理 concurrent_jobs 个文件：一个文件收尾（等待最后几条请求、写出工作簿）
+    或做预扫描时，其它文件的请求继续占满线程池，API 在文件之间不会空闲。
+    可以监视文件夹，新出现的输入文件自动入队。
+    """
+    def __init__(self, processor: 'TextProcessor', store: JobStore, concurrent_jobs: int = 2,
+                 poll_interval: float = 5.0,
+                 on_update: Optional[Callable[[], None]] = None):
+        self.processor = processor
+        self.store = store
+        self.concurrent_jobs = max(1, int(concurrent_jobs))
+        self.poll_interval = poll_interval
+        self.on_update = on_update
+        self.watched: List[Dict] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running: Dict[int, threading.Thread] = {}
+        self._cancel: Dict[int, threading.Event] = {}  # 任务被其它进程接手时置位，中止该文件
+        self._lock = threading.Lock()
+
+    def watch(self, folder: str, save_dir: Optional[str] = None, mode: str = 'encode', priority: int = 0,
+              code_path: Optional[str] = None, notes_path: Optional[str] = None):
+        """监视文件夹：其中新出现或内容变化的输入文件自动入队（结果默认保存在同一文件夹）"""
+        self.watched.append({'folder': os.path.abspath(folder), 'save_dir': save_dir or os.path.abspath(folder),
+                             'mode': mode, 'priority': priority, 'code_path': code_path,
+                             'notes_path': notes_path})
+        self._wake.set()
+
+    def scan_watched(self) -> int:
+        """扫描监视的文件夹，返回新入队的任务数"""
+        added = 0
+        for entry in self.watched:
+            try:
+                names = sorted(os.listdir(entry['folder']))
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(entry['folder'], name)
+                # 跳过本程序写出的结果文件、Office 锁文件和不支持的格式
+                if (name.startswith(('~$', '.')) or not name.lower().endswith(SUPPORTED_EXTENSIONS)
+                        or name.endswith('.journal.jsonl') or any(f"_{mode}_" in name for mode in JOB_MODES)
+                        or not os.path.isfile(path)):
+                    continue
+                if self.store.add(path, entry['save_dir'], entry['mode'], entry['priority'],
+                                  entry['code_path'], entry['notes_path'], unique=True) is not None:
+                    added += 1
+        return added
+
+    def running(self) -> List[int]:
+        with self._lock:
+            return list(self._running)
+
+    def _run_job(self, job: Dict):
+        last = [0.0]
+
+        def progress(current: int, total: int):
+            # 进度每秒最多写一次数据库
+            now = time.monotonic()
+            if now - last[0] >= 1.0 or current == total:
+                last[0] = now
+                self.store.progress(job['id'], current, total)
+                if self.on_update:
+                    self.on_update()
+
+        processor = self.processor.spawn(progress)
+        with self._lock:
+            processor.stop_event = self._cancel[job['id']]
+        try:
+            results = processor.process_file(job['path'], job['save_dir'], job['mode'], job['prompt'],
+                                             job['code_path'], job['notes_path'])
+            self.store.finish(job['id'], results)
+        except ProcessingCancelled:
+            # 中断时放回队列；已由其它进程接手时不变，日志和结果由它负责
+            self.store.release(job['id'])
+        except Exception as e:
+            self.store.fail(job['id'], str(e))
+        finally:
+            processor.close()
+            with self._lock:
+                self._running.pop(job['id'], None)
+                self._cancel.pop(job['id'], None)
+            self._wake.set()
+            if self.on_update:
+                self.on_update()
+
+    def _heartbeat(self):
+        """刷新处理中任务的心跳；已被其它进程接手（本进程曾失联过久）的任务立即中止"""
+        with self._lock:
+            job_ids = list(self._running)
+        for job_id in self.store.heartbeat(job_ids):
+            with self._lock:
+                event = self._cancel.get(job_id)
+            if event is not None:
+                event.set()
+
+    def _join_running(self):
+        """等待处理中的文件完成，期间继续刷新心跳"""
+        while True:
+            with self._lock:
+                threads = list(self._running.values())
+            if not threads:
+                return
+            self._heartbeat()
+            threads[0].join(self.store.lease_seconds / 3)
+
+    def _loop(self, exit_when_idle: bool):
+        next_scan = 0.0
+        while not self._stop.is_set():
+            self._heartbeat()
+            if self.watched and time.monotonic() >= next_scan:
+                self.scan_watched()
+                next_scan = time.monotonic() + self.poll_interval
+            with self._lock:
+                free = self.concurrent_jobs - len(self._running)
+            while free > 0 and not self._stop.is_set():
+                job = self.store.claim()
+                if job is None:
+                    break
+                thread = threading.Thread(target=self._run_job, args=(job,), daemon=True)
+                with self._lock:
+                    self._running[job['id']] = thread
+                    self._cancel[job['id']] = threading.Event()
+                thread.start()
+                free -= 1
+                if self.on_update:
+                    self.on_update()
+            with self._lock:
+                idle = not self._running
+            if exit_when_idle and idle and not self.watched and not self.store.counts()['queued']:
+                break
+            # 至少每 lease_seconds/3 醒来一次刷新心跳
+            self._wake.wait(min(self.poll_interval, self.store.lease_seconds / 3))
+            self._wake.clear()
+        # 停止时不再取新任务，等待正在处理的文件完成
+        self._join_running()
+
+    def run(self, exit_when_idle: bool = True):
+        """在当前线程中处理队列；exit_when_idle 时队列清空且没有监视的文件夹后返回"""
+        owns_executor = self.processor.executor is None
+        if owns_executor:
+            self.processor.executor = ThreadPoolExecutor(max_workers=self.processor.max_workers)
+        try:
+            self._loop(exit_when_idle)
+        except BaseException:
+            # 中断（如 Ctrl+C）或出错时不等大文件处理完：中止正在处理的文件，
+            # 检查点日志保留，任务放回队列由下次运行续跑
+            self._stop.set()
+            with self._lock:
+                events = list(self._cancel.values())
+            for event in events:
+                event.set()
+            raise
+        finally:
+            # 中止的文件在下一行或下一个请求前退出，等它们退出后才关闭线程池
+            self._join_running()
+            if owns_executor:
+                self.processor.executor.shutdown()
+                self.processor.executor = None
+
+    def start(self, exit_when_idle: bool = False) -> 'JobRunner':
+        """在后台线程中处理队列（图形界面使用）"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(exit_when_idle,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait: bool = False):
+        """不再开始新任务；正在处理的文件会处理完，wait 时等待它们完成（中断 run() 则会中止它们）"""
+        self._stop.set()
+        self._wake.set()
+        if wait:
+            if self._thread is not None and self._thread is not threading.current_thread():
+                self._thread.join()
+            self._join_running()
+
+    def is_alive(self) -> bool:
+        """后台线程仍在运行或仍有文件在处理；为 False 后才能关闭处理器或启动新的 runner"""
+        with self._lock:
+            running = bool(self._running)
+        return running or (self._thread is not None and self._thread.is_alive())
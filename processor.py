@@ -1,95 +1,334 @@
 import os
 import json
 import time
-import http.client
-from typing import List, Dict, Tuple, Optional, Callable
-import pandas as pd
-import numpy as np
+import threading
+from contextlib import nullcontext
+from collections import Counter, deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Collection, List, Dict, Tuple, Optional, Callable, Iterable, Iterator, Union
+from http_client import HTTPClient
+from rate_limiter import RateLimiter, estimate_tokens, parse_retry_after
+from response_cache import ResponseCache
+from result_writer import StreamingResultWriter
+from input_reader import open_input
+from checkpoint import CheckpointJournal, file_fingerprint
+from dedup import duplicate_groups, text_key
+from prompt_template import (PromptTemplate, TEXT_PLACEHOLDER, answer_max_tokens, code_logit_bias,
+                             complete_code, match_code, parse_batch_answers)
+from telemetry import Telemetry, classify_error
+from resilience import RETRYABLE_ERRORS, Hedger, RequestError, backoff_delay
+from agreement import AgreementStats, normalize_code
+from fewshot import ExampleIndex, load_example_index
+from cascade import Cascade, cross_validate, tune_threshold
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+class _MalformedChunk(ValueError):
+    """SSE 流中无法解析的数据块"""
+
+
+class _AnswerStream:
+    """解析 chat completions 的 SSE 流，出现完整的有效编码时通知停止读取"""
+    def __init__(self, valid_codes: Collection[str], cancelled: Optional[threading.Event] = None):
+        self.valid_codes = valid_codes
+        self.cancelled = cancelled  # 对冲的另一个请求已经成功时置位，立即断开
+        self.parts: List[str] = []
+        self.usage: Optional[Dict] = None
+
+    @property
+    def content(self) -> str:
+        return ''.join(self.parts)
+
+    def feed(self, line: bytes) -> bool:
+        if self.cancelled is not None and self.cancelled.is_set():
+            return True
+        if not line.startswith(b'data:'):
+            return False
+        data = line[5:].strip()
+        if data == b'[DONE]':
+            return True
+        try:
+            chunk = json.loads(data)
+            self.usage = chunk.get('usage') or self.usage
+            for choice in chunk.get('choices') or ():
+                delta = choice.get('delta') or {}
+                if delta.get('content'):
+                    self.parts.append(delta['content'])
+        except (ValueError, AttributeError, TypeError) as e:
+            raise _MalformedChunk(e) from e
+        return complete_code(self.content, self.valid_codes) is not None
+
+
+class ProcessingCancelled(Exception):
+    """stop_event 置位后 process_file 中止：不写出结果，检查点日志保留"""
+
 
 class TextProcessor:
     """文本处理类，处理编码和校准逻辑"""
     def __init__(self, api_settings: dict, progress_callback: Callable[[int, int], None]):
+        self.api_settings = dict(api_settings)
         self.base_url = api_settings['base_url']
         self.api_key = api_settings['api_key']
         self.model = api_settings.get('model', 'gpt-4o-all')
+        self.temperature = 0.1
         self.progress_callback = progress_callback
         self.preview_callback = None  # 新增预览回调
-        self.delay_seconds = 3  # 设置默认延时为3秒，可以根据需要调整
+        self.result_callback = None  # 每行结果按原始顺序产出后回调
+        self.max_workers = max(1, int(api_settings.get('max_workers', 4)))  # 同时在途的请求数
+        self.pack_size = max(1, int(api_settings.get('pack_size', 1)))  # 每次请求编码的文本条数
+        self._pack_retries = 0
+        self._stats_lock = threading.Lock()
+        self.resume = bool(api_settings.get('resume', True))  # 是否写入检查点日志并从中续跑
+        self.max_realtime_outputs = 1000  # 结果中保留的最近实时输出条数
+        self.dedup = bool(api_settings.get('dedup', True))  # 归一化后相同的文本只请求一次
+        # 自洽投票：每条文本最多采样 vote_samples 次，某个编码先得到 vote_agree 票即停止
+        self.vote_samples = max(1, int(api_settings.get('vote_samples', 1)))
+        self.vote_agree = min(self.vote_samples, max(1, int(api_settings.get('vote_agree', 2))))
+        self.vote_temperature = float(api_settings.get('vote_temperature', 0.7))
+        self._vote_extra_calls = 0
+        # 约束答案：限制 max_tokens、流式读取到有效编码即断开，编码表以外的答案重试
+        self.constrained = bool(api_settings.get('constrained', False))
+        self.use_logit_bias = bool(api_settings.get('logit_bias', True))  # 需要安装 tiktoken
+        self.invalid_retries = max(0, int(api_settings.get('invalid_retries', 2)))
+        self._invalid_retries = 0
+        # 检索式少样本：从人工编码样例中为每条文本选出最相似的 fewshot_k 条，总长不超过 fewshot_tokens
+        self.examples_path = api_settings.get('examples_path') or None
+        self.fewshot_k = max(0, int(api_settings.get('fewshot_k', 3)))
+        self.fewshot_tokens = max(0, int(api_settings.get('fewshot_tokens', 400)))
+        self.example_index: Optional[ExampleIndex] = None
+        # 级联：本地分类器置信度够高的文本直接编码，只有不确定的文本请求模型；
+        # 校准模式按 cascade_target 的目标准确率调阈值并保存模型，编码模式加载使用
+        self.cascade = bool(api_settings.get('cascade', False))
+        self.cascade_target = float(api_settings.get('cascade_target', 0.95))
+        self.cascade_path = api_settings.get('cascade_path', 'cascade_model.npz')
+        self.cascade_min_rows = 50  # 人工编码少于这个数时不训练本地分类器
+        # 超时、连接重置、5xx 等暂时性错误最多重试 max_retries 次（指数退避加抖动），
+        # 每行的所有请求和重试不超过 row_deadline 秒（0 表示不限）
+        self.max_retries = max(0, int(api_settings.get('max_retries', 3)))
+        self.row_deadline = max(0.0, float(api_settings.get('row_deadline', 120)))
+        # 对冲请求：超过已观测 p95 延迟仍未返回时再发一个相同请求，取先返回的结果
+        self.hedge = bool(api_settings.get('hedge', False))
+        self._hedger = Hedger(self.max_workers) if self.hedge else None
+        self.http_client = HTTPClient(self.base_url, pool_size=self._pool_size())
+        # 按服务商的 RPM/TPM 限额限流（0 表示不限），遇到 429/503 自动降速
+        self.rate_limiter = RateLimiter(api_settings.get('rpm', 0), api_settings.get('tpm', 0))
+        self.max_throttle_retries = 5  # 被限流时最多重新排队的次数
+        # 磁盘响应缓存，use_cache=False 时绕过；首次调用模型时才打开数据库
+        self.use_cache = bool(api_settings.get('use_cache', True))
+        self.cache_path = api_settings.get('cache_path', 'response_cache.sqlite3')
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        # 命中计数按处理器统计：spawn() 出的处理器共用同一个缓存，缓存对象上的计数混有其它任务
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self.telemetry = Telemetry()  # 逐请求耗时、token 用量和错误分类，每次 process_file 重置
+        self.agreement: Optional[AgreementStats] = None  # 校准模式下的一致性统计（kappa 等）
+        # 多个任务共用的线程池；为 None 时每次 process_file 自建线程池
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self._owns_resources = True
+        # 外部置位后 process_file 在下一行之前中止（例如分片租约被其它工作进程接手）
+        self.stop_event: Optional[threading.Event] = None
 
     def set_preview_callback(self, callback: Callable[[str, str, str], None]):
-        """设置预览回调函数"""
+        """设置预览回调函数（可能在工作线程中被调用）"""
         self.preview_callback = callback
         
-    def set_delay_seconds(self, seconds: int):
-        """设置延时秒数"""
-        self.delay_seconds = seconds
+    def set_result_callback(self, callback: Callable[[Dict], None]):
+        """设置逐行结果回调函数（按原始行顺序在处理线程中调用）"""
+        self.result_callback = callback
+        
+    def _pool_size(self) -> int:
+        """连接池大小：并发请求数，对冲时另加对冲请求的名额"""
+        return self.max_workers + (Hedger.slots_for(self.max_workers) if self.hedge else 0)
 
-    def read_excel_data(self, file_path: str) -> Tuple[pd.DataFrame, pd.DataFrame, List[str]]:
-        """读取Excel文件中的数据"""
-        try:
-            xl = pd.ExcelFile(file_path)
-            available_sheets = xl.sheet_names
-            
-            if 'Coding Results' not in available_sheets:
-                raise ValueError("Required sheet 'Coding Results' not found")
-            if 'code' not in available_sheets:
-                raise ValueError("Required sheet 'code' not found")
-                
-            coding_results = xl.parse('Coding Results')
-            code_df = xl.parse('code')
-            
-            notes = []
-            note_sheet_name = next((s for s in available_sheets 
-                                  if s.lower() in ['note', 'notes']), None)
-            
-            if note_sheet_name:
-                note_df = xl.parse(note_sheet_name, header=None)
-                notes = [str(note) for note in note_df[0] 
-                        if pd.notna(note) and str(note).strip()]
-                
-            return coding_results, code_df, notes
-            
-        except Exception as e:
-            raise Exception(f"Error reading Excel file: {str(e)}")
+    @property
+    def cache(self) -> Optional[ResponseCache]:
+        """响应缓存，关闭缓存时为 None"""
+        if not self.use_cache:
+            return None
+        with self._cache_lock:
+            if self._cache is None:
+                self._cache = ResponseCache(self.cache_path)
+            return self._cache
+
+    def spawn(self, progress_callback: Callable[[int, int], None]) -> 'TextProcessor':
+        """新建设置相同的处理器，与本处理器共用连接池、限流器、响应缓存和线程池
+
+        多个文件同时处理时，每个任务使用各自的处理器（进度、统计互不干扰），
+        请求仍受同一个 RPM/TPM 限额和并发上限约束。共用的资源由本处理器负责关闭。
+        """
+        child = TextProcessor(self.api_settings, progress_callback)
+        child.max_workers = self.max_workers
+        child.http_client = self.http_client
+        if child._hedger is not None:
+            child._hedger.shutdown()
+        child._hedger = self._hedger
+        child.rate_limiter = self.rate_limiter
+        child.use_cache = self.use_cache
+        child._cache = self.cache
+        child.executor = self.executor
+        child._owns_resources = False
+        return child
+
+    def close(self):
+        """释放连接池中的连接和缓存数据库"""
+        if not self._owns_resources:
+            return
+        self.http_client.close()
+        if self._hedger is not None:
+            self._hedger.shutdown()
+        with self._cache_lock:
+            if self._cache is not None:
+                self._cache.close()
+                self._cache = None
 
-    def generate_prompt(self, code_df: pd.DataFrame, notes: List[str], text: str) -> str:
+    def generate_prompt(self, code_df: 'pd.DataFrame', notes: List[str], text: str) -> str:
         """生成提示词"""
-        valid_codes = [row['code_num'] for _, row in code_df.iterrows() 
-                      if row['code_num'] != 'f']
-        valid_codes.sort()
+        codebook = code_df[code_df['code_num'] != 'f']
+        valid_codes = sorted(codebook['code_num'])
         
-        prompt = (
-            "你是一位经验丰富的教育研究编码专家，专门从事中文在线学习文本的编码工作。\n"
-            f"在本任务中，你需要将文本分类为{len(valid_codes)}个类别之一，"
-            f"可选编码为：{', '.join(valid_codes)}。\n\n"
-        )
-        
-        prompt += "编码框架：\n"
-        for _, row in code_df.iterrows():
-            if row['code_num'] != 'f':
-                prompt += f"\n编码 {row['code_num']} - {row['code']}:\n"
-                prompt += f"定义：{row['explain']}\n"
-                prompt += f"示例：{row['example']}\n"
+        parts = [
+            "你是一位经验丰富的教育研究编码专家，专门从事中文在线学习文本的编码工作。\n",
+            f"在本任务中，你需要将文本分类为{len(valid_codes)}个类别之一，",
+            f"可选编码为：{', '.join(valid_codes)}。\n\n",
+            "编码框架：\n"
+        ]
+        for code_num, code, explain, example in zip(
+            codebook['code_num'], codebook['code'], codebook['explain'], codebook['example']
+        ):
+            parts.append(f"\n编码 {code_num} - {code}:\n定义：{explain}\n示例：{example}\n")
         
         if notes:
-            prompt += "\n校准说明：\n"
-            for note in notes:
-                prompt += f"- {note}\n"
+            parts.append("\n校准说明：\n")
+            parts.extend(f"- {note}\n" for note in notes)
         
-        prompt += f"\n待编码文本：{text}\n"
-        prompt += f"\n你只需要返回编码的字符类别，只输出字母，不要返回任何其他的解释！\n"
-        return prompt
+        parts.append(f"\n待编码文本：{text}\n")
+        parts.append(f"\n你只需要返回编码的字符类别，只输出字母，不要返回任何其他的解释！\n")
+        return "".join(parts)
+
+    def compile_prompt(self, code_df: 'pd.DataFrame', notes: List[str],
+                       custom_prompt: Optional[str] = None) -> PromptTemplate:
+        """每次运行只编译一次提示词模板，逐行复用同一个静态前缀"""
+        valid_codes = [str(c).strip().lower() for c in code_df['code_num'] if c != 'f']
+        if custom_prompt:
+            return PromptTemplate(custom_prompt, valid_codes)
+        return PromptTemplate(self.generate_prompt(code_df, notes, TEXT_PLACEHOLDER), valid_codes)
+
+    def load_examples(self, code_path: Optional[str] = None) -> Optional[ExampleIndex]:
+        """加载（并增量更新）少样本样例索引；没有设置样例文件时为 None"""
+        if self.examples_path and self.fewshot_k:
+            try:
+                self.example_index = load_example_index(self.examples_path, code_path)
+            except Exception as e:
+                raise Exception(f"Error loading few-shot examples: {str(e)}")
+        else:
+            self.example_index = None
+        return self.example_index
+
+    def retrieve_examples(self, texts: List[str], mode: str) -> list:
+        """为待编码文本检索样例；校准模式下排除与文本本身相同的样例，避免泄露人工编码"""
+        if self.example_index is None:
+            return []
+        return self.example_index.select(texts, self.fewshot_k, self.fewshot_tokens,
+                                         exclude_self=mode == 'calibrate')
+
+    def _cascade_routes(self, source, text_col: int, hcode_col: Optional[int], mode: str,
+                        valid_codes, stats: Dict) -> Dict[int, Tuple[str, float]]:
+        """级联路由：返回由本地分类器直接编码的行（行号 -> (编码, 置信度)）
 
-    def call_model(self, prompt: str, timeout: float = 10.0) -> str:
-        """调用API获取模型响应"""
-        host = self.base_url.replace("https://", "").replace("http://", "").rstrip("/")
+        校准模式下用 hcode 做 5 折交叉验证，按折外预测选出达到目标准确率的最低阈值，
+        这些行使用折外预测（没见过该行的模型），统计到的准确率与编码模式下的预期一致；
+        再用全部人工编码训练最终模型，与阈值一起保存到 cascade_path。
+        """
+        def text_of(values) -> str:
+            return '' if values[text_col] is None else str(values[text_col])
         
-        messages = [{"role": "system", "content": prompt}]
-        payload = json.dumps({
-            "model": self.model,
+        if mode == 'calibrate':
+            rows, texts, codes = [], [], []
+            for idx, values in enumerate(source.iter_rows()):
+                hcode = normalize_code(values[hcode_col])
+                if hcode and (valid_codes is None or hcode in valid_codes):
+                    rows.append(idx)
+                    texts.append(text_of(values))
+                    codes.append(hcode)
+            if len(rows) < self.cascade_min_rows or len(set(codes)) < 2:
+                stats.update({'status': 'skipped: too few human-coded rows', 'trained_rows': len(rows)})
+                return {}
+            classifier, predicted, confidences = cross_validate(texts, codes)
+            correct = [p == c for p, c in zip(predicted, codes)]
+            threshold, local, expected = tune_threshold(confidences, correct, self.cascade_target)
+            Cascade(classifier, threshold, expected if local else None, len(rows)).save(self.cascade_path)
+            stats.update({'status': 'trained', 'trained_rows': len(rows), 'threshold': threshold,
+                          'expected_accuracy': expected if local else None, 'model_path': self.cascade_path})
+            return {idx: (code, float(conf)) for idx, code, conf in zip(rows, predicted, confidences)
+                    if conf >= threshold}
+        
+        if not os.path.exists(self.cascade_path):
+            raise Exception(f"Cascade model not found: {self.cascade_path} (run calibration with the cascade first)")
+        cascade = Cascade.load(self.cascade_path)
+        stats.update({'status': 'loaded', 'trained_rows': cascade.trained_rows, 'threshold': cascade.threshold,
+                      'expected_accuracy': cascade.expected_accuracy, 'model_path': self.cascade_path})
+        routes = {}
+        rows = enumerate(source.iter_rows())
+        for batch in iter(lambda: list(islice(rows, 1000)), []):
+            for (idx, _), route in zip(batch, cascade.route([text_of(values) for _, values in batch])):
+                if route is not None:
+                    routes[idx] = route
+        return routes
+
+    def call_model(self, prompt: Union[str, List[Dict[str, str]]], timeout: float = 10.0,
+                   model: Optional[str] = None, temperature: Optional[float] = None,
+                   sample: int = 0, valid_codes: Optional[Collection[str]] = None,
+                   answers: int = 1, deadline: Optional[float] = None) -> str:
+        """调用API获取模型响应；prompt 为字符串时作为单条 system 消息发送
+
+        model、temperature 默认使用设置中的值；sample 是投票模式下的采样序号，只用于区分缓存。
+        约束答案模式下传入 valid_codes（answers 为打包的条数）时，按编码字母表限制 max_tokens、
+        可选设置 logit_bias；单条答案以流式读取，出现有效编码即断开，返回值为该编码。
+        deadline 为本行的截止时刻（time.monotonic()），默认从现在起 row_deadline 秒。
+        """
+        model = model or self.model
+        temperature = self.temperature if temperature is None else temperature
+        if isinstance(prompt, str):
+            messages = [{"role": "system", "content": prompt}]
+        else:
+            messages = prompt
+        constrained = self.constrained and bool(valid_codes)
+        streaming = constrained and answers == 1
+        
+        # 相同模型、温度和提示词直接返回缓存的响应
+        cache = self.cache
+        cache_key = None
+        if cache is not None:
+            cache_key = ResponseCache.make_key(model, temperature, messages, sample)
+            cached = cache.get(cache_key)
+            with self._stats_lock:
+                if cached is None:
+                    self._cache_misses += 1
+                else:
+                    self._cache_hits += 1
+            if cached is not None:
+                if streaming:
+                    return match_code(cached, valid_codes) or cached.strip().lower()
+                return cached.strip().lower()
+        
+        body = {
+            "model": model,
             "messages": messages,
-            "temperature": 0.1
-        })
+            "temperature": temperature
+        }
+        if constrained:
+            body["max_tokens"] = answer_max_tokens(valid_codes, answers)
+            # +100 的偏置等于只允许编码 token，打包请求的 JSON 数组写不出括号和逗号，只用于单条答案
+            if self.use_logit_bias and answers == 1:
+                bias = code_logit_bias(model, tuple(sorted(valid_codes)))
+                if bias:
+                    body["logit_bias"] = bias
+        if streaming:
+            body["stream"] = True
+        payload = json.dumps(body)
         
         headers = {
             'Accept': 'application/json',
@@ -97,178 +336,632 @@ class TextProcessor:
             'Content-Type': 'application/json'
         }
         
+        # 输入按提示词估算，另加少量输出 token
+        token_cost = sum(estimate_tokens(m['content']) for m in messages) + 16
+        if deadline is None:
+            deadline = self.row_deadline_at()
+        
         try:
-            conn = http.client.HTTPSConnection(host, timeout=timeout)
-            conn.request("POST", "/v1/chat/completions", payload, headers)
+            content, usage = self._send_with_retries(payload, headers, timeout, streaming, valid_codes,
+                                                     token_cost, deadline)
+            if streaming:
+                code = match_code(content, valid_codes)
+                # 编码表以外的答案不写入缓存，重试时重新请求
+                if code is not None and cache_key is not None:
+                    cache.put(cache_key, code)
+                return code or content.strip().lower()
+            # 打包答案中有缺失或无效的条目时同样不缓存，否则逐条重试和以后的运行都会拿到同一个答案
+            if cache_key is not None and (answers == 1 or not valid_codes or None not in
+                                          parse_batch_answers(content, answers, valid_codes)):
+                cache.put(cache_key, content)
+            return content.strip().lower()
             
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                try:
-                    res = conn.getresponse()
-                    data = json.loads(res.read().decode("utf-8"))
-                    return data['choices'][0]['message']['content'].strip().lower()
-                except Exception:
-                    if time.time() - start_time >= timeout:
-                        return 'o'
+        except Exception as e:
+            raise Exception(f"API call error: {str(e)}")
+
+    def _send_with_retries(self, payload: str, headers: Dict[str, str], timeout: float, streaming: bool,
+                           valid_codes, token_cost: int, deadline: Optional[float]) -> Tuple[str, Optional[Dict]]:
+        """按错误分类重试：429/503 交给限流器暂停降速，超时、连接重置、5xx 和残缺响应按指数退避加抖动重试
+
+        所有重试（含退避等待）不超过 deadline（time.monotonic() 时刻），单次请求的超时也不超过剩余时间。
+        """
+        throttled = failures = 0
+        while True:
+            attempt_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RequestError('deadline', f"row deadline of {self.row_deadline:g}s exceeded")
+                attempt_timeout = min(timeout, remaining)
+            try:
+                if self._hedger is None:
+                    return self._send_once(payload, headers, attempt_timeout, streaming, valid_codes, token_cost)
+                return self._hedger.run(
+                    lambda cancelled: self._send_once(payload, headers, attempt_timeout, streaming,
+                                                      valid_codes, token_cost, cancelled),
+                    self.telemetry
+                )
+            except RequestError as e:
+                if not e.retryable:
+                    raise
+                if e.throttled:
+                    throttled += 1
+                    if throttled > self.max_throttle_retries:
+                        raise RequestError(e.error_class, f"{e} (still rate limited after "
+                                                          f"{self.max_throttle_retries} retries)")
+                    # 限流器已按 Retry-After 暂停，下次 acquire 时等待
+                else:
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise RequestError(e.error_class, f"{e} (after {self.max_retries} retries)")
+                    delay = backoff_delay(failures)
+                    if deadline is not None and time.monotonic() + delay >= deadline:
+                        raise RequestError('deadline', f"{e} (row deadline of {self.row_deadline:g}s exceeded)")
+                    time.sleep(delay)
+                self.telemetry.record_retry()
+
+    def _send_once(self, payload: str, headers: Dict[str, str], timeout: float, streaming: bool,
+                   valid_codes, token_cost: int,
+                   cancelled: Optional[threading.Event] = None) -> Tuple[str, Optional[Dict]]:
+        """发送一次请求，返回 (答案, usage)；失败时抛出带错误分类的 RequestError"""
+        telemetry = self.telemetry
+        self.rate_limiter.acquire(token_cost)
+        # 通过连接池发送请求，复用已建立的 keep-alive 连接
+        started = time.perf_counter()
+        try:
+            if streaming:
+                stream = _AnswerStream(valid_codes, cancelled)
+                res = self.http_client.stream(
+                    "POST", "/v1/chat/completions", payload.encode("utf-8"), headers, timeout, stream.feed
+                )
+            else:
+                res = self.http_client.request(
+                    "POST", "/v1/chat/completions", payload.encode("utf-8"), headers, timeout
+                )
+        except _MalformedChunk as e:
+            # 残缺的 SSE 数据块与残缺的非流式响应体一样重试，单条和打包请求的行为一致
+            telemetry.record_error('malformed_response', time.perf_counter() - started)
+            raise RequestError('malformed_response', f"malformed response: {e}", retryable=True) from e
+        except Exception as e:
+            error_class = classify_error(e)
+            telemetry.record_error(error_class, time.perf_counter() - started)
+            raise RequestError(error_class, str(e) or error_class,
+                               retryable=error_class in RETRYABLE_ERRORS) from e
+        if res.status != 200:
+            telemetry.record_request(res.connect_time, res.ttfb, res.total_time, res.reused,
+                                     error_class=f"http_{res.status}")
+            error = RequestError.from_status(res.status, res.body)
+            if error.throttled:
+                # 被限流：按 Retry-After 暂停并降速后重新排队
+                self.rate_limiter.on_throttled(parse_retry_after(res.headers.get('retry-after')))
+            raise error
+        self.rate_limiter.on_success()
+        try:
+            if streaming:
+                content, usage = stream.content, stream.usage
+            else:
+                data = json.loads(res.body.decode("utf-8"))
+                content, usage = data['choices'][0]['message']['content'], data.get('usage')
+        except Exception as e:
+            error_class = classify_error(e)
+            telemetry.record_request(res.connect_time, res.ttfb, res.total_time, res.reused,
+                                     error_class=error_class)
+            raise RequestError(error_class, f"malformed response: {e}", retryable=True) from e
+        # 服务端没有返回 usage 时按估算值计入
+        telemetry.record_request(
+            res.connect_time, res.ttfb, res.total_time, res.reused,
+            int((usage or {}).get('prompt_tokens') or token_cost - 16),
+            int((usage or {}).get('completion_tokens') or estimate_tokens(content))
+        )
+        return content, usage
+
+    def row_deadline_at(self) -> Optional[float]:
+        """从现在起 row_deadline 秒的截止时刻，不限时为 None"""
+        return time.monotonic() + self.row_deadline if self.row_deadline else None
+
+    def answer(self, messages: List[Dict[str, str]], valid_codes=None, model: Optional[str] = None,
+               temperature: Optional[float] = None, sample: int = 0,
+               deadline: Optional[float] = None) -> str:
+        """请求一条文本的编码；约束答案模式下编码表以外的答案最多重试 invalid_retries 次"""
+        if deadline is None:
+            deadline = self.row_deadline_at()
+        code = self.call_model(messages, model=model, temperature=temperature, sample=sample,
+                               valid_codes=valid_codes, deadline=deadline)
+        if not self.constrained or not valid_codes:
+            return code
+        for _ in range(self.invalid_retries):
+            if code in valid_codes:
+                break
+            with self._stats_lock:
+                self._invalid_retries += 1
+            # 无效答案没有写入缓存，同一个缓存键会重新请求模型
+            code = self.call_model(messages, model=model, temperature=temperature, sample=sample,
+                                   valid_codes=valid_codes, deadline=deadline)
+        return code
+
+    def vote(self, messages: List[Dict[str, str]], valid_codes=None,
+             deadline: Optional[float] = None) -> Tuple[str, Counter]:
+        """自洽投票：重复采样直到某个编码得到 vote_agree 票或用完 vote_samples 次
+
+        返回得票最多的编码（优先编码表中的有效编码）和各编码的票数。
+        """
+        votes: Counter = Counter()
+        for sample in range(self.vote_samples):
+            try:
+                answer = self.answer(messages, valid_codes, temperature=self.vote_temperature, sample=sample,
+                                     deadline=deadline)
+            except Exception:
+                if not votes:
                     raise
+                break  # 已有票数时，单次采样失败不影响结果
+            votes[answer] += 1
+            if sample:
+                with self._stats_lock:
+                    self._vote_extra_calls += 1
+            if votes[answer] >= self.vote_agree:
+                break
+        code = max(votes, key=lambda c: (valid_codes is None or c in valid_codes, votes[c]))
+        return code, votes
+
+    def _make_result(self, idx: int, total_items: int, text: str, human_code,
+                     mode: str, code: Optional[str] = None,
+                     error_msg: Optional[str] = None,
+                     votes: Optional[Counter] = None) -> Tuple[Dict, List[str]]:
+        """根据模型编码（或错误信息）生成结果条目和实时输出"""
+        display_text = text[:50] + "..." if len(text) > 50 else text
+        realtime_output = [f"\n文本 {idx + 1}/{total_items}:", f"内容: {display_text}"]
+        
+        if error_msg is not None:
+            result_item = {
+                'index': idx + 1,
+                'text': text,
+                'model_code': 'o',
+                'error': error_msg,
+                'display_text': display_text
+            }
+            realtime_output.append(f"错误: {error_msg}")
+            return result_item, realtime_output
+        
+        result_item = {
+            'index': idx + 1,
+            'text': text,
+            'model_code': code,
+            'display_text': display_text
+        }
+        if votes:
+            # 票数分布记为置信度列，例如 a:3 b:1
+            result_item['confidence'] = round(votes[code] / sum(votes.values()), 3)
+            result_item['votes'] = ' '.join(f"{c}:{n}" for c, n in votes.most_common())
+            realtime_output.append(f"投票: {result_item['votes']}")
+        
+        if mode == 'calibrate':
+            # 与一致性统计相同的规范化，准确率和 kappa 对 " A"、"a " 这类编码的判断一致
+            human = normalize_code(human_code)
+            correct = human is not None and normalize_code(code) == human
+            result_item['human_code'] = human_code
+            result_item['correct'] = correct
             
-            return 'o'
+            # 添加校准模式的额外输出信息
+            realtime_output.extend([
+                f"人工编码: {human_code}",
+                f"模型编码: {code}",
+                f"结果: {'✓' if correct else '✗'}"
+            ])
+        else:
+            realtime_output.extend([
+                f"模型编码: {code}"
+            ])
+        return result_item, realtime_output
+
+    def _code_item(self, idx: int, total_items: int, text: str, human_code,
+                   mode: str, template: PromptTemplate) -> Tuple[Dict, List[str]]:
+        """编码单条文本，返回结果条目和实时输出（在工作线程中执行）"""
+        prompt = None
+        shown_code = human_code if mode == 'calibrate' else "N/A"
+        
+        try:
+            # 预览显示完整提示词；实际请求复用模板的静态前缀，文本作为单独的 user 消息
+            examples = self.retrieve_examples([text], mode)
+            prompt = template.render(text, examples)
+            messages = template.messages(text, examples)
             
+            # 在调用模型前更新预览，显示"处理中..."
+            if self.preview_callback:
+                self.preview_callback(prompt, shown_code, "处理中...")
+            
+            votes = None
+            deadline = self.row_deadline_at()
+            if self.vote_samples > 1:
+                code, votes = self.vote(messages, template.valid_codes, deadline)
+            else:
+                code = self.answer(messages, template.valid_codes, deadline=deadline)
+            
+            # 在获得模型回复后更新预览
+            if self.preview_callback:
+                self.preview_callback(prompt, shown_code, code)
+            
+            return self._make_result(idx, total_items, text, human_code, mode, code, votes=votes)
+                
         except Exception as e:
-            raise Exception(f"API call error: {str(e)}")
-        finally:
-            try:
-                conn.close()
-            except:
-                pass
+            error_msg = str(e)
+            
+            # 在发生错误时更新预览
+            if self.preview_callback:
+                self.preview_callback(
+                    prompt if prompt is not None else "加载提示词出错", 
+                    shown_code, 
+                    f"错误: {error_msg}"
+                )
+            
+            return self._make_result(idx, total_items, text, human_code, mode, error_msg=error_msg)
 
-    def process_file(self, file_path: str, save_path: str, mode: str, custom_prompt: Optional[str] = None) -> Dict:
-        """处理文件并保存结果"""
+    def _code_chunk(self, chunk: List[tuple], mode: str,
+                    template: PromptTemplate) -> List[Tuple[Dict, List[str]]]:
+        """编码一组文本：多条时打包成一次请求，缺失或无效的答案逐条重试"""
+        # 已中止时窗口中尚未开始的请求不再发出
+        self._check_stopped()
+        if len(chunk) == 1:
+            return [self._code_item(*chunk[0], mode, template)]
+        
+        texts = [item[2] for item in chunk]
+        examples = self.retrieve_examples(texts, mode)
+        prompt = template.render_batch(texts, examples)
+        if self.preview_callback:
+            self.preview_callback(prompt, "N/A", "处理中...")
+        
         try:
-            coding_results, code_df, notes = self.read_excel_data(file_path)
+            codes = template.parse_batch(
+                self.call_model(template.batch_messages(texts, examples), valid_codes=template.valid_codes,
+                                answers=len(texts)),
+                len(texts)
+            )
+        except Exception:
+            codes = [None] * len(texts)
+        
+        outputs = []
+        for (idx, total_items, text, human_code), code in zip(chunk, codes):
+            if code is None:
+                with self._stats_lock:
+                    self._pack_retries += 1
+                outputs.append(self._code_item(idx, total_items, text, human_code, mode, template))
+                continue
+            if self.preview_callback:
+                self.preview_callback(prompt, human_code if mode == 'calibrate' else "N/A", code)
+            outputs.append(self._make_result(idx, total_items, text, human_code, mode, code))
+        return outputs
+
+    def _check_stopped(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise ProcessingCancelled("Processing cancelled")
+
+    def _iter_in_order(self, executor: ThreadPoolExecutor, items: Iterable[tuple],
+                       func: Callable) -> Iterator:
+        """保持至多 N 个请求在途，并按提交顺序产出结果"""
+        # 在途窗口大于工作线程数，慢请求阻塞队首时其余线程仍有任务可做
+        window = self.max_workers * 4
+        pending = deque()
+        for args in items:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _iter_rows_in_order(self, executor: ThreadPoolExecutor, rows: Iterable[Tuple[int, tuple]],
+                            request: Callable[[int, tuple], Optional[tuple]], pack_size: int,
+                            mode: str, template: PromptTemplate) -> Iterator[Tuple[int, tuple, Optional[tuple]]]:
+        """按原始顺序产出 (行号, 行, 模型结果)；不需要请求模型的行结果为 None
+
+        需要请求的行每 pack_size 条打包提交，行本身随请求在窗口中排队，输入只需一个迭代器。
+        至多 max_workers * 4 个请求在途，至多缓冲 4 倍于此的行：续跑、重复或本地编码的行
+        连成长段时也不会把整段读进内存，只是暂时少发几个请求。
+        """
+        window = self.max_workers * 4
+        max_rows = window * pack_size * 4
+        pending = deque()  # (行号, 行, 所属请求, 在请求中的位置)；请求为 [future, 条数]
+        chunk: List[tuple] = []
+        slot: Optional[list] = None
+        in_flight = 0
+        
+        def submit():
+            nonlocal chunk, slot, in_flight
+            slot[0] = executor.submit(self._code_chunk, chunk, mode, template)
+            chunk, slot = [], None
+            in_flight += 1
+        
+        def pop_front():
+            nonlocal in_flight
+            idx, values, owner, position = pending.popleft()
+            if owner is None:
+                return idx, values, None
+            if owner[0] is None:
+                submit()  # 队首所在的请求还没凑满，先发出
+            if position == owner[1] - 1:
+                in_flight -= 1
+            return idx, values, owner[0].result()[position]
+        
+        def front_ready() -> bool:
+            owner = pending[0][2]
+            return owner is None or (owner[0] is not None and owner[0].done())
+        
+        for idx, values in rows:
+            item = request(idx, values)
+            if item is None:
+                pending.append((idx, values, None, 0))
+            else:
+                if slot is None:
+                    slot = [None, 0]
+                pending.append((idx, values, slot, len(chunk)))
+                chunk.append(item)
+                slot[1] += 1
+                if len(chunk) >= pack_size:
+                    submit()
+            while pending and (front_ready() or in_flight >= window or len(pending) >= max_rows):
+                yield pop_front()
+        if chunk:
+            submit()
+        while pending:
+            yield pop_front()
+
+    def process_file(self, file_path: str, save_path: str, mode: str, custom_prompt: Optional[str] = None,
+                     code_path: Optional[str] = None, notes_path: Optional[str] = None) -> Dict:
+        """处理文件并保存结果
+
+        输入可以是 Excel 工作簿，也可以是 CSV / JSONL / Parquet 文件；
+        后者需要通过 code_path（编码表）和可选的 notes_path（校准说明）提供附属文件。
+        """
+        try:
+            source = open_input(file_path, code_path, notes_path)
+        except Exception as e:
+            raise Exception(f"Error reading input file: {str(e)}")
+        
+        try:
+            code_df, notes = source.code_df, source.notes
+            text_col = source.column_index('text')
+            hcode_col = source.column_index('hcode') if mode == 'calibrate' else None
             
             base_name = os.path.splitext(os.path.basename(file_path))[0]
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             save_file = os.path.join(save_path, f"{base_name}_{mode}_{timestamp}.xlsx")
             
-            total_items = len(coding_results)
+            total_items = source.total
+            cache = self.cache
             results = {
                 'processed': 0,
                 'correct': 0,
                 'total': total_items,
                 'start_time': time.time(),
-                'detailed_results': [],
                 'save_file': save_file,
-                'realtime_outputs': []  # 添加实时输出列表
+                # 只保留最近的实时输出，完整结果逐批写入工作簿
+                'realtime_outputs': deque(maxlen=self.max_realtime_outputs)
             }
             
-            result_df = coding_results.copy()
-            codes = []
-            detailed_results = []
+            template = self.compile_prompt(code_df, notes, custom_prompt)
+            examples = self.load_examples(code_path)
             
-            for idx, (text, human_code) in enumerate(
-                zip(coding_results['text'], 
-                    coding_results['hcode'] if mode == 'calibrate' else [None] * total_items)
-            ):
-                self.progress_callback(idx + 1, total_items)
-                
-                # 准备实时输出信息
-                display_text = text[:50] + "..." if len(text) > 50 else text
-                realtime_output = [f"\n文本 {idx + 1}/{total_items}:", f"内容: {display_text}"]
-                
-                try:
-                    if custom_prompt:
-                        # 替换自定义提示词中的[文本]占位符
-                        prompt = custom_prompt.replace("[文本]", text)
-                    else:
-                        prompt = self.generate_prompt(code_df, notes, text)
-                    
-                    # 在调用模型前更新预览，显示"处理中..."
-                    if self.preview_callback:
-                        self.preview_callback(
-                            prompt, 
-                            human_code if mode == 'calibrate' else "N/A", 
-                            "处理中..."
-                        )
-                    
-                    code = self.call_model(prompt)
-                    codes.append(code)
-                    
-                    # 在获得模型回复后更新预览
-                    if self.preview_callback:
-                        self.preview_callback(
-                            prompt, 
-                            human_code if mode == 'calibrate' else "N/A", 
-                            code
-                        )
-                    
-                    result_item = {
-                        'index': idx + 1,
-                        'text': text,
-                        'model_code': code,
-                        'display_text': display_text
-                    }
-                    
-                    if mode == 'calibrate':
-                        result_item['human_code'] = human_code
-                        result_item['correct'] = code == human_code
-                        if code == human_code:
+            # 检查点日志：指纹覆盖输入内容、模式、模型和提示词，任一变化都重新开始
+            journal = None
+            completed = {}
+            if self.resume:
+                journal = CheckpointJournal(
+                    os.path.join(save_path, f"{base_name}_{mode}.journal.jsonl"),
+                    file_fingerprint(file_path, mode, self.model, self.temperature, template.system,
+                                     *((self.vote_samples, self.vote_agree, self.vote_temperature)
+                                       if self.vote_samples > 1 else ()),
+                                     *(('constrained',) if self.constrained else ()),
+                                     *((self.fewshot_k, self.fewshot_tokens, examples.digest())
+                                       if examples is not None else ()),
+                                     *(('cascade', self.cascade_target) if self.cascade else ()))
+                )
+                completed = journal.completed
+            results['resumed'] = len(completed)
+            skipped = frozenset(completed)  # 行生成器是惰性的，不能依赖随后被 pop 的字典
+            
+            def row_text(values) -> str:
+                return '' if values[text_col] is None else str(values[text_col])
+            
+            # 级联预扫描：置信度够高的行由本地分类器编码，不进入请求队列
+            results['cascade'] = {}
+            local_codes = (self._cascade_routes(source, text_col, hcode_col, mode, template.valid_codes,
+                                                results['cascade'])
+                           if self.cascade else {})
+            results['local_coded'] = 0
+            local_rows = frozenset(local_codes)  # 处理循环会 pop 字典，惰性的行生成器只看这个集合
+            
+            # 去重预扫描：只记录出现不止一次的文本分组，每组只请求一次模型
+            dup_keys = duplicate_groups(row_text(v) for v in source.iter_rows()) if self.dedup else {}
+            results['dedup_saved'] = 0
+            
+            led = set()  # 已出现过首行的重复分组
+            
+            def request(idx: int, values: tuple) -> Optional[tuple]:
+                """需要请求模型的行返回请求参数；续跑、重复和本地编码的行返回 None"""
+                text = row_text(values)
+                if dup_keys:
+                    key = text_key(text)
+                    if key in dup_keys:
+                        if key in led:
+                            return None  # 重复文本，复用分组首行的结果
+                        led.add(key)
+                if idx in skipped or idx in local_rows:
+                    return None
+                return (idx, total_items, text, values[hcode_col] if hcode_col is not None else None)
+            # 打包模式下每 pack_size 条文本合并为一次请求；投票模式逐条采样，不打包
+            pack_size = 1 if self.vote_samples > 1 else self.pack_size
+            with self._stats_lock:
+                self._pack_retries = 0
+                self._vote_extra_calls = 0
+                self._invalid_retries = 0
+                self._cache_hits = 0
+                self._cache_misses = 0
+            self.telemetry = Telemetry()
+            self.agreement = AgreementStats(code_df['code_num']) if mode == 'calibrate' else None
+            
+            # 结果边处理边写入只写模式的工作簿，内存占用不随行数增长
+            result_columns = source.columns + ['model_code']
+            detail_columns = ['index', 'text', 'model_code', 'display_text']
+            if mode == 'calibrate':
+                result_columns.append('is_correct')
+                detail_columns += ['human_code', 'correct']
+            if self.vote_samples > 1:
+                detail_columns += ['confidence', 'votes']
+            if self.cascade:
+                detail_columns += ['route', 'local_confidence']
+            if dup_keys:
+                detail_columns.append('duplicate_of')
+            detail_columns.append('error')
+            writer = StreamingResultWriter(
+                save_file, list(code_df.columns), code_df.itertuples(index=False),
+                result_columns, detail_columns
+            )
+            
+            # 重复分组首行的结果：键 -> [编码, 错误, 首行序号, 剩余重复行数, 置信度, 票数]
+            group_results = {}
+            
+            # 多个请求并发在途，结果仍按原始行顺序汇总；已完成的行直接取自日志
+            try:
+                with (ThreadPoolExecutor(max_workers=self.max_workers) if self.executor is None
+                      else nullcontext(self.executor)) as executor:
+                    # 主处理只读一遍输入（去重和级联的预扫描另读一遍）
+                    rows = self._iter_rows_in_order(executor, enumerate(source.iter_rows()), request,
+                                                    pack_size, mode, template)
+                    for idx, input_row, fresh in rows:
+                        self._check_stopped()
+                        key = text_key(row_text(input_row)) if dup_keys else None
+                        group = group_results.get(key) if key in dup_keys else None
+                        
+                        if idx in skipped:
+                            result_item, realtime_output = completed.pop(idx)
+                        elif group is not None:
+                            # 重复文本不再请求模型，直接沿用首行的编码
+                            result_item, realtime_output = self._make_result(
+                                idx, total_items, row_text(input_row),
+                                input_row[hcode_col] if hcode_col is not None else None,
+                                mode, group[0], group[1]
+                            )
+                            result_item['duplicate_of'] = group[2]
+                            if group[4] is not None:
+                                result_item['confidence'], result_item['votes'] = group[4], group[5]
+                            realtime_output.append(f"与文本 {group[2]} 相同，复用其结果")
+                            results['dedup_saved'] += 1
+                            if journal is not None:
+                                journal.append(idx, result_item, realtime_output)
+                        elif idx in local_codes:
+                            # 本地分类器足够确定，不请求模型
+                            code, confidence = local_codes.pop(idx)
+                            result_item, realtime_output = self._make_result(
+                                idx, total_items, row_text(input_row),
+                                input_row[hcode_col] if hcode_col is not None else None,
+                                mode, code
+                            )
+                            result_item['route'] = 'local'
+                            result_item['local_confidence'] = round(confidence, 3)
+                            realtime_output.append(f"本地分类器编码，置信度 {confidence:.2f}")
+                            results['local_coded'] += 1
+                            if journal is not None:
+                                journal.append(idx, result_item, realtime_output)
+                        else:
+                            result_item, realtime_output = fresh
+                            if self.cascade:
+                                result_item['route'] = 'model'
+                            if journal is not None:
+                                journal.append(idx, result_item, realtime_output)
+                        
+                        if key in dup_keys:
+                            if group is None:
+                                group_results[key] = [result_item['model_code'], result_item.get('error'),
+                                                      idx + 1, dup_keys[key] - 1,
+                                                      result_item.get('confidence'), result_item.get('votes')]
+                            else:
+                                group[3] -= 1
+                                if group[3] == 0:
+                                    del group_results[key]
+                        
+                        result_row = list(input_row) + [result_item['model_code']]
+                        if mode == 'calibrate':
+                            result_row.append(result_item.get('correct', False))
+                        writer.add(result_row, result_item)
+                        if result_item.get('correct'):
                             results['correct'] += 1
+                        if self.agreement is not None:
+                            self.agreement.add(input_row[hcode_col], result_item['model_code'],
+                                               bool(result_item.get('error')))
                         
-                        # 添加校准模式的额外输出信息
-                        realtime_output.extend([
-                            f"人工编码: {human_code}",
-                            f"模型编码: {code}",
-                            f"结果: {'✓' if code == human_code else '✗'}"
-                        ])
-                    else:
-                        realtime_output.extend([
-                            f"模型编码: {code}"
-                        ])
-                    
-                    detailed_results.append(result_item)
-                    
-                    # 延长延时时间，让用户有更多时间查看结果
-                    time.sleep(self.delay_seconds)
-                    
-                except Exception as e:
-                    codes.append('o')
-                    error_msg = str(e)
-                    result_item = {
-                        'index': idx + 1,
-                        'text': text,
-                        'model_code': 'o',
-                        'error': error_msg,
-                        'display_text': display_text
-                    }
-                    detailed_results.append(result_item)
-                    realtime_output.append(f"错误: {error_msg}")
-                    
-                    # 在发生错误时更新预览
-                    if self.preview_callback:
-                        self.preview_callback(
-                            prompt if 'prompt' in locals() else "加载提示词出错", 
-                            human_code if mode == 'calibrate' else "N/A", 
-                            f"错误: {error_msg}"
-                        )
-                    
-                    # 错误后也延长延时
-                    time.sleep(self.delay_seconds)
-                
-                # 保存实时输出
-                results['realtime_outputs'].append(realtime_output)
-                results['processed'] += 1
+                        # 保存实时输出
+                        results['realtime_outputs'].append(realtime_output)
+                        results['processed'] += 1
+                        self.telemetry.record_rows()
+                        if self.result_callback:
+                            self.result_callback(result_item)
+                        self.progress_callback(results['processed'], total_items)
+            except BaseException:
+                writer.discard()
+                raise
+            finally:
+                if journal is not None:
+                    journal.close()
 
             # 计算结果
             results['time'] = time.time() - results['start_time']
+            results['pool_stats'] = self.http_client.stats()
+            results['rate_limit_stats'] = self.rate_limiter.stats()
+            if cache is not None:
+                results['cache_stats'] = {'hits': self._cache_hits, 'misses': self._cache_misses}
             if mode == 'calibrate':
-                results['accuracy'] = results['correct'] / total_items
+                results['accuracy'] = results['correct'] / results['processed'] if results['processed'] else 0.0
+            results['telemetry'] = self.telemetry.summary()
+            results['vote_extra_calls'] = self._vote_extra_calls
+            results['invalid_retries'] = self._invalid_retries
+            if self.agreement is not None:
+                metrics = self.agreement.final()
+                results['agreement'] = {k: metrics[k] for k in
+                                        ('n', 'accuracy', 'kappa', 'macro_f1', 'weighted_f1', 'per_code')}
+                results['kappa'] = metrics['kappa']
             
-            # 保存到Excel
-            result_df['model_code'] = codes
-            if mode == 'calibrate':
-                result_df['is_correct'] = [r.get('correct', False) for r in detailed_results]
+            # 统计表在最后写入并保存工作簿
+            if self.agreement is not None:
+                for name, columns, rows in AgreementStats.sheets(metrics):
+                    writer.add_sheet(name, columns, rows)
+            writer.add_sheet('Telemetry', ['metric', 'value'], self.telemetry.sheet_rows())
+            writer.close({
+                '处理时间': f"{results['time']:.1f}秒",
+                '总条数': total_items,
+                '处理条数': results['processed'],
+                '续跑跳过条数': results['resumed'],
+                '去重节省调用数': results['dedup_saved'],
+                '并发数': self.max_workers,
+                '每次请求条数': pack_size,
+                '投票采样上限': self.vote_samples,
+                '投票额外请求数': self._vote_extra_calls,
+                '打包后单条重试数': self._pack_retries,
+                '本地分类器编码数': results['local_coded'] if self.cascade else 'N/A',
+                '本地编码阈值': (f"{results['cascade']['threshold']:.4f}"
+                               if 'threshold' in results['cascade'] else 'N/A'),
+                '少样本样例库条数': len(examples) if examples is not None else 'N/A',
+                '约束答案': '开启' if self.constrained else '关闭',
+                '无效编码重试数': self._invalid_retries,
+                '流式提前停止数': results['pool_stats']['early_stops'],
+                '流式提前断开数': results['pool_stats']['early_closes'],
+                '连接复用率': f"{results['pool_stats']['reuse_rate']:.2%}",
+                '新建连接数': results['pool_stats']['connections_created'],
+                '限流次数': results['rate_limit_stats']['throttled'],
+                '限流等待时间': f"{results['rate_limit_stats']['wait_seconds']:.1f}秒",
+                '缓存命中': results['cache_stats']['hits'] if cache is not None else 'N/A',
+                '缓存未命中': results['cache_stats']['misses'] if cache is not None else 'N/A',
+                '准确率': f"{results['accuracy']:.2%}" if 'accuracy' in results else 'N/A',
+                'Kappa': f"{results['kappa']:.4f}" if 'kappa' in results else 'N/A'
+            })
             
-            with pd.ExcelWriter(save_file, engine='openpyxl') as writer:
-                code_df.to_excel(writer, sheet_name='code', index=False)
-                result_df.to_excel(writer, sheet_name='Coding Results', index=False)
-                
-                stats_df = pd.DataFrame([{
-                    '处理时间': f"{results['time']:.1f}秒",
-                    '总条数': total_items,
-                    '处理条数': results['processed'],
-                    '准确率': f"{results['accuracy']:.2%}" if 'accuracy' in results else 'N/A'
-                }])
-                stats_df.to_excel(writer, sheet_name='Statistics', index=False)
-                
-                pd.DataFrame(detailed_results).to_excel(
-                    writer, 
-                    sheet_name='Detailed Results',
-                    index=False
-                )
+            # 结果已完整保存，日志不再需要
+            if journal is not None:
+                journal.remove()
             
-            results['detailed_results'] = detailed_results
+            results['realtime_outputs'] = list(results['realtime_outputs'])
             return results
             
+        except ProcessingCancelled:
+            raise
         except Exception as e:
             raise Exception(f"Processing error: {str(e)}")
+        finally:
+            source.close()
@@ -0,0 +1,145 @@
+import re
+import json
+from functools import lru_cache
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+TEXT_PLACEHOLDER = "[文本]"  # 提示词中待编码文本的占位符
+TEXT_REFERENCE = "（见用户消息）"  # 占位符在 system 消息中的替换文字
+BATCH_INSTRUCTION = (
+    "\n注意：本次用户消息包含多条按编号列出的待编码文本，请逐条独立编码。"
+    "只返回一个 JSON 数组，按编号顺序给出每条文本的编码字母，"
+    "数组长度必须等于文本条数，例如 [\"a\", \"b\"]，不要返回任何其他内容！\n"
+)
+
+EXAMPLES_HEADER = "以下是已由人工编码的相似文本，供参考：\n"
+
+# 约束答案时忽略模型在编码前后加的空白、引号和标点
+_ANSWER_STRIP = ' \t\r\n"\'`*.,;:。，；：“”‘’「」【】()（）'
+LOGIT_BIAS = 100  # 有效编码 token 的偏置（OpenAI 接口的上限）
+
+
+def match_code(content: str, valid_codes: Collection[str]) -> Optional[str]:
+    """从模型回复中取出编码：去掉首尾空白和标点后必须恰好是编码表中的编码"""
+    code = content.strip(_ANSWER_STRIP).lower()
+    return code if code in valid_codes else None
+
+
+def complete_code(content: str, valid_codes: Collection[str]) -> Optional[str]:
+    """流式回复中已经可以确定的编码：是有效编码，且不是另一个更长编码的前缀"""
+    code = match_code(content, valid_codes)
+    if code is None or any(len(other) > len(code) and other.startswith(code) for other in valid_codes):
+        return None
+    return code
+
+
+def parse_batch_answers(content: str, count: int,
+                        valid_codes: Optional[Collection[str]] = None) -> List[Optional[str]]:
+    """解析打包请求的 JSON 数组答案；缺失或不在编码表中的条目返回 None"""
+    codes: List[Optional[str]] = [None] * count
+    match = re.search(r"\[.*\]", content, re.S)
+    if not match:
+        return codes
+    try:
+        answers = json.loads(match.group(0))
+    except ValueError:
+        return codes
+    if not isinstance(answers, list) or len(answers) != count:
+        return codes
+    for i, answer in enumerate(answers):
+        if not isinstance(answer, (str, int)):
+            continue
+        code = str(answer).strip().lower()
+        if code and (valid_codes is None or code in valid_codes):
+            codes[i] = code
+    return codes
+
+
+def answer_max_tokens(valid_codes: Collection[str], count: int = 1) -> int:
+    """按编码字母表确定 max_tokens：单条答案只够输出最长的编码，打包答案另加 JSON 数组的符号"""
+    from rate_limiter import estimate_tokens
+    longest = max((estimate_tokens(code) for code in valid_codes), default=1)
+    if count == 1:
+        return longest + 1
+    return count * (longest + 3) + 4
+
+
+@lru_cache(maxsize=32)
+def code_logit_bias(model: str, valid_codes: Tuple[str, ...]) -> Optional[Dict[str, int]]:
+    """有效编码对应 token 的 logit_bias；需要可选依赖 tiktoken，且每个编码都是单个 token
+
+    模型不被 tiktoken 识别、或编码需要多个 token 时返回 None（不设置偏置）。
+    """
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(model)
+    except (ImportError, KeyError):
+        return None
+    bias = {}
+    for code in valid_codes:
+        for variant in {code, code.upper(), ' ' + code, ' ' + code.upper()}:
+            tokens = encoding.encode(variant)
+            if len(tokens) != 1:
+                if variant == code:
+                    return None
+                continue
+            bias[str(tokens[0])] = LOGIT_BIAS
+    return bias
+
+
+class PromptTemplate:
+    """编译后的提示词模板
+
+    编码框架、校准说明和输出要求组成静态的 system 消息，每条请求逐字节相同，
+    可以命中服务端的提示词前缀缓存；待编码文本单独作为 user 消息发送，
+    因此逐行构造消息只与文本长度有关。
+    """
+    def __init__(self, prompt: str, valid_codes: Optional[Iterable[str]] = None):
+        self.prompt = prompt
+        self.valid_codes = set(valid_codes) if valid_codes else None
+        self._head, sep, self._tail = prompt.partition(TEXT_PLACEHOLDER)
+        self.has_placeholder = bool(sep)
+        self.system = prompt.replace(TEXT_PLACEHOLDER, TEXT_REFERENCE) if sep else prompt
+        self.batch_system = self.system + BATCH_INSTRUCTION
+
+    @staticmethod
+    def format_examples(examples: Optional[Iterable[Tuple[str, str, float]]]) -> str:
+        """检索到的人工编码样例，作为待编码文本之前的一条 user 消息"""
+        lines = [f"文本：{' '.join(text.split())}\n编码：{code}\n" for text, code, _ in examples or ()]
+        return EXAMPLES_HEADER + "".join(lines) if lines else ""
+
+    def _with_examples(self, system: str, content: str, examples) -> List[Dict[str, str]]:
+        # system 消息保持逐字节相同，样例放在单独的 user 消息中，不影响前缀缓存
+        messages = [{"role": "system", "content": system}]
+        block = self.format_examples(examples)
+        if block:
+            messages.append({"role": "user", "content": block})
+        messages.append({"role": "user", "content": content})
+        return messages
+
+    def messages(self, text: str, examples=None) -> List[Dict[str, str]]:
+        """生成一条请求的消息列表；examples 为检索到的 (文本, 编码, 相似度) 样例"""
+        return self._with_examples(self.system, text, examples)
+
+    def render(self, text: str, examples=None) -> str:
+        """把文本填回占位符，得到单条完整提示词（用于预览显示）"""
+        block = self.format_examples(examples)
+        if self.has_placeholder:
+            return self._head + text + self._tail + (f"\n{block}" if block else "")
+        return f"{self.prompt}\n\n{block}{text}"
+
+    @staticmethod
+    def _numbered(texts: List[str]) -> str:
+        # 文本内的换行折叠为空格，保证每条文本只占一行编号
+        return "\n".join(f"[{i}] {' '.join(text.split())}" for i, text in enumerate(texts, 1))
+
+    def batch_messages(self, texts: List[str], examples=None) -> List[Dict[str, str]]:
+        """打包模式：多条文本编号后放在同一条 user 消息中"""
+        return self._with_examples(self.batch_system, self._numbered(texts), examples)
+
+    def render_batch(self, texts: List[str], examples=None) -> str:
+        """打包请求的完整提示词（用于预览显示）"""
+        return f"{self.batch_system}\n{self.format_examples(examples)}{self._numbered(texts)}"
+
+    def parse_batch(self, content: str, count: int) -> List[Optional[str]]:
+        """解析打包请求的 JSON 数组答案；缺失或不在编码表中的条目返回 None"""
+        return parse_batch_answers(content, count, self.valid_codes)
@@ -0,0 +1,125 @@
+import time
+import threading
+from functools import lru_cache
+from typing import Dict, Optional
+
+
+@lru_cache(maxsize=256)
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数：中日韩字符约 1 字 1 token，其余字符约 4 字符 1 token"""
+    cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uf900' <= ch <= '\uffef')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """自适应令牌桶限流器，同时限制每分钟请求数（RPM）和每分钟 token 数（TPM）
+
+    rpm / tpm 为 0 表示不限制该项。收到 429/503 时按 Retry-After 暂停并将速率减半，
+    之后每次成功请求逐步恢复，直到回到配置的上限。
+    """
+    BURST_SECONDS = 10.0  # 令牌桶容量相当于多少秒的配额
+
+    def __init__(self, rpm: float = 0, tpm: float = 0,
+                 min_scale: float = 0.1, recovery_step: float = 0.02,
+                 default_backoff: float = 2.0):
+        self.rpm = max(0.0, float(rpm or 0))
+        self.tpm = max(0.0, float(tpm or 0))
+        self.min_scale = min_scale
+        self.recovery_step = recovery_step
+        self.default_backoff = default_backoff
+        self.scale = 1.0  # 当前速率占配置上限的比例
+
+        self._lock = threading.Lock()
+        self._request_bucket = self._capacity(self.rpm)
+        self._token_bucket = self._capacity(self.tpm)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_throttle = 0.0
+        self._stats = {'throttled': 0, 'wait_seconds': 0.0}
+
+    def _capacity(self, per_minute: float) -> float:
+        return max(1.0, per_minute * self.scale / 60.0 * self.BURST_SECONDS)
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._request_bucket = min(self._capacity(self.rpm),
+                                       self._request_bucket + elapsed * self.rpm * self.scale / 60.0)
+        if self.tpm:
+            self._token_bucket = min(self._capacity(self.tpm),
+                                     self._token_bucket + elapsed * self.tpm * self.scale / 60.0)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """阻塞直到可以发送一次消耗 tokens 的请求，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    # 单次请求超过桶容量时，只要求桶是满的，避免永远等待
+                    cost = min(float(tokens), self._capacity(self.tpm))
+                    request_ok = not self.rpm or self._request_bucket >= 1.0
+                    token_ok = not self.tpm or self._token_bucket >= cost
+                    if request_ok and token_ok:
+                        if self.rpm:
+                            self._request_bucket -= 1.0
+                        if self.tpm:
+                            self._token_bucket -= cost
+                        self._stats['wait_seconds'] += waited
+                        return waited
+                    wait = 0.0
+                    if not request_ok:
+                        wait = max(wait, (1.0 - self._request_bucket) * 60.0 / (self.rpm * self.scale))
+                    if not token_ok:
+                        wait = max(wait, (cost - self._token_bucket) * 60.0 / (self.tpm * self.scale))
+            wait = min(max(wait, 0.01), 1.0)
+            time.sleep(wait)
+            waited += wait
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        """收到 429/503 后暂停发送并降低速率"""
+        with self._lock:
+            now = time.monotonic()
+            self._stats['throttled'] += 1
+            pause = retry_after if retry_after is not None else self.default_backoff
+            self._paused_until = max(self._paused_until, now + pause)
+            # 同一波并发请求一起被拒时只降速一次
+            if now - self._last_throttle > 1.0:
+                self.scale = max(self.min_scale, self.scale * 0.5)
+                self._last_throttle = now
+            # 清空令牌桶，并从现在起计算补充，之前空闲的时间不能再攒成令牌
+            self._updated = now
+            self._request_bucket = 0.0
+            self._token_bucket = 0.0
+
+    def on_success(self):
+        """请求成功后逐步恢复速率"""
+        if self.scale < 1.0:
+            with self._lock:
+                self.scale = min(1.0, self.scale + self.recovery_step)
+
+    def stats(self) -> Dict:
+        """限流统计：被限流次数、累计等待时间、当前速率比例"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['scale'] = self.scale
+        return stats
@@ -0,0 +1,102 @@
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import TYPE_CHECKING, Callable, Optional, TypeVar
+
+if TYPE_CHECKING:
+    from telemetry import Telemetry
+
+T = TypeVar('T')
+
+# 没有收到响应时可以重试的错误分类：超时、连接被重置或无法建立（其余异常多为配置错误，重试无用）
+RETRYABLE_ERRORS = frozenset({'timeout', 'connection_reset', 'connection_error'})
+THROTTLE_STATUSES = (429, 503)
+
+
+class RequestError(Exception):
+    """一次请求失败，带错误分类（用于遥测）和是否值得重试"""
+    def __init__(self, error_class: str, message: str, retryable: bool = False, throttled: bool = False):
+        super().__init__(message)
+        self.error_class = error_class
+        self.retryable = retryable
+        self.throttled = throttled
+
+    @classmethod
+    def from_status(cls, status: int, body: bytes) -> 'RequestError':
+        """非 200 响应：429/503 由限流器处理，408 和其它 5xx 退避后重试，其余 4xx 不重试"""
+        return cls(f"http_{status}", f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}",
+                   retryable=status == 408 or status == 429 or status >= 500,
+                   throttled=status in THROTTLE_STATUSES)
+
+
+def backoff_delay(failures: int, base: float = 0.5, cap: float = 20.0,
+                  rng: Optional[random.Random] = None) -> float:
+    """第 failures 次失败后的等待秒数：指数增长并全抖动（在 0 和上限之间均匀取值），避免同时重试"""
+    return (rng or random).uniform(0.0, min(cap, base * 2 ** max(0, failures - 1)))
+
+
+class Hedger:
+    """对冲请求：请求超过已观测延迟的 p95 仍未返回时，再发一个相同的请求，取先成功返回的结果
+
+    只有约 5% 的请求会触发对冲，却能截掉最慢的长尾。对冲请求另有额度限制：
+    同时在途的对冲请求不超过 slots 个，累计不超过请求数的 budget 比例。
+    输掉的流式请求收到取消信号后断开连接，非流式请求读完后丢弃。
+    """
+    def __init__(self, max_workers: int, percentile: float = 95.0, min_samples: int = 20,
+                 budget: float = 0.1):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget = budget
+        # 每个在途请求最多占用两个线程（原请求和对冲请求），调用方线程只负责等待
+        self._executor = ThreadPoolExecutor(max_workers=2 * max(1, max_workers), thread_name_prefix='hedge')
+        self._slots = threading.BoundedSemaphore(self.slots_for(max_workers))
+
+    @staticmethod
+    def slots_for(max_workers: int) -> int:
+        """同时在途的对冲请求上限，连接池需要为它们多留出的连接数"""
+        return max(1, max_workers // 4)
+
+    def delay(self, telemetry: 'Telemetry') -> Optional[float]:
+        """发出对冲请求前的等待秒数；样本太少或额度用完时为 None（不对冲）"""
+        if telemetry.latency_count() < self.min_samples:
+            return None
+        if telemetry.hedges >= self.budget * telemetry.requests:
+            return None
+        return telemetry.percentile(self.percentile)
+
+    def run(self, send: Callable[[threading.Event], T], telemetry: 'Telemetry') -> T:
+        """send(cancelled) 发送一次请求；cancelled 置位表示另一个请求已经成功，可以提前放弃"""
+        delay = self.delay(telemetry)
+        cancelled = threading.Event()
+        if delay is None:
+            return send(cancelled)
+        primary = self._executor.submit(send, cancelled)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            if primary.done():
+                return primary.result()
+        if not self._slots.acquire(blocking=False):
+            return primary.result()
+        try:
+            telemetry.record_hedge()
+            hedge = self._executor.submit(send, cancelled)
+            pending, error = {primary, hedge}, None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        cancelled.set()
+                        if future is hedge:
+                            telemetry.record_hedge(won=True)
+                        return future.result()
+                    # 两个都失败时报告原请求的错误
+                    if error is None or future is primary:
+                        error = future.exception()
+            raise error
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,87 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Optional
+
+
+class ResponseCache:
+    """基于 SQLite 的模型响应磁盘缓存，按模型、温度和最终提示词的哈希查找
+
+    超过 max_age_days 的条目会被删除；条目数超过 max_entries 时淘汰最久未访问的条目。
+    """
+    EVICT_EVERY = 1000  # 每写入多少条检查一次淘汰
+
+    def __init__(self, path: str = 'response_cache.sqlite3',
+                 max_entries: int = 200000, max_age_days: float = 30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt, sample: int = 0) -> str:
+        """计算缓存键；prompt 可以是字符串或消息列表，sample 区分投票模式下同一提示词的多次采样"""
+        key = [model, temperature, prompt] + ([sample] if sample else [])
+        raw = json.dumps(key, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存的响应，未命中返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """写入一条响应"""
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self._puts += 1
+            evict = self._puts % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目，并把条目数压到 max_entries 以内"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_seconds,))
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def stats(self) -> Dict:
+        """命中/未命中计数"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
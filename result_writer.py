@@ -0,0 +1,89 @@
+from typing import Any, Dict, List, Sequence
+
+
+def _cell(value: Any) -> Any:
+    """把单元格值转换为 openpyxl 可写的类型：缺失值写为空，容器写为字符串"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, (list, tuple, dict, set)):
+        return str(value)
+    try:
+        # pandas 的 NaT / NA 等缺失值
+        if value != value:
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+class StreamingResultWriter:
+    """以 openpyxl 只写模式逐批写出结果工作簿
+
+    各工作表的行在追加时即写入临时文件，内存占用与行数无关；
+    Statistics 表在开始时建好，关闭时才写入统计数据，保存时再打包成 xlsx。
+    """
+    BATCH_SIZE = 500  # 缓冲多少行后写入一次
+
+    def __init__(self, save_file: str, code_columns: Sequence[str], code_rows: Sequence[Sequence],
+                 result_columns: Sequence[str], detail_columns: Sequence[str]):
+        self.save_file = save_file
+        self.detail_columns = list(detail_columns)
+        self.rows_written = 0
+        from openpyxl import Workbook
+        self._workbook = Workbook(write_only=True)
+
+        code_sheet = self._workbook.create_sheet('code')
+        code_sheet.append(list(code_columns))
+        for row in code_rows:
+            code_sheet.append([_cell(v) for v in row])
+
+        self._results_sheet = self._workbook.create_sheet('Coding Results')
+        self._results_sheet.append(list(result_columns))
+        self._stats_sheet = self._workbook.create_sheet('Statistics')
+        self._details_sheet = self._workbook.create_sheet('Detailed Results')
+        self._details_sheet.append(self.detail_columns)
+
+        self._result_buffer: List[List] = []
+        self._detail_buffer: List[List] = []
+
+    def add(self, result_row: Sequence, detail: Dict):
+        """追加一行结果：result_row 写入 'Coding Results'，detail 按列名写入 'Detailed Results'"""
+        self._result_buffer.append([_cell(v) for v in result_row])
+        self._detail_buffer.append([_cell(detail.get(col)) for col in self.detail_columns])
+        if len(self._result_buffer) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """把缓冲的行写入各工作表的临时文件"""
+        for row in self._result_buffer:
+            self._results_sheet.append(row)
+        for row in self._detail_buffer:
+            self._details_sheet.append(row)
+        self.rows_written += len(self._result_buffer)
+        self._result_buffer.clear()
+        self._detail_buffer.clear()
+
+    def add_sheet(self, name: str, columns: Sequence[str], rows: Sequence[Sequence]):
+        """追加一个小型汇总表（在 close 之前调用）"""
+        sheet = self._workbook.create_sheet(name)
+        sheet.append(list(columns))
+        for row in rows:
+            sheet.append([_cell(v) for v in row])
+
+    def close(self, stats: Dict):
+        """写入统计表并保存工作簿"""
+        self.flush()
+        self._stats_sheet.append(list(stats.keys()))
+        self._stats_sheet.append([_cell(v) for v in stats.values()])
+        self._workbook.save(self.save_file)
+
+    def discard(self):
+        """任务失败时关闭各工作表的临时文件，不生成输出"""
+        for sheet in self._workbook.worksheets:
+            if not sheet.closed:
+                try:
+                    sheet.close()
+                except Exception:
+                    pass
@@ -0,0 +1,100 @@
+from typing import Dict, List
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QColor
+
+
+class ResultStore:
+    """紧凑的逐行结果存储：每行只保存序号、截断后的文本和编码，不拼接显示字符串"""
+    def __init__(self):
+        self.indexes: List[int] = []
+        self.texts: List[str] = []
+        self.model_codes: List[str] = []
+        self.human_codes: List[str] = []
+        self.errors: Dict[int, str] = {}  # 只有出错的行才记录
+        self._codes: Dict[str, str] = {}  # 编码字符串复用同一个对象
+
+    def __len__(self) -> int:
+        return len(self.indexes)
+
+    def _intern(self, value) -> str:
+        value = '' if value is None or value != value else str(value)
+        return self._codes.setdefault(value, value)
+
+    def append(self, result_item: Dict):
+        row = len(self.indexes)
+        self.indexes.append(result_item['index'])
+        self.texts.append(result_item.get('display_text', ''))
+        self.model_codes.append(self._intern(result_item.get('model_code')))
+        self.human_codes.append(self._intern(result_item.get('human_code')))
+        if result_item.get('error'):
+            self.errors[row] = result_item['error']
+
+    def clear(self):
+        self.__init__()
+
+
+class ResultTableModel(QAbstractTableModel):
+    """QTableView 的数据模型，按需读取 ResultStore 中的单元格，可滚动数百万行"""
+    HEADERS = ["序号", "内容", "人工编码", "模型编码", "结果"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = ResultStore()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.store)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def _outcome(self, row: int) -> str:
+        if row in self.store.errors:
+            return "错误"
+        human = self.store.human_codes[row]
+        if not human:
+            return ""
+        return "✓" if self.store.model_codes[row] == human else "✗"
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == 0:
+                return self.store.indexes[row]
+            if col == 1:
+                return self.store.texts[row]
+            if col == 2:
+                return self.store.human_codes[row]
+            if col == 3:
+                return self.store.model_codes[row]
+            return self._outcome(row)
+        if role == Qt.ItemDataRole.ToolTipRole and row in self.store.errors:
+            return self.store.errors[row]
+        if role == Qt.ItemDataRole.ForegroundRole and col >= 3:
+            outcome = self._outcome(row)
+            if outcome == "✓":
+                return QColor("green")
+            if outcome in ("✗", "错误"):
+                return QColor("red")
+        return None
+
+    def append_rows(self, result_items: List[Dict]):
+        """一次插入一批结果，每帧只触发一次视图更新"""
+        if not result_items:
+            return
+        first = len(self.store)
+        self.beginInsertRows(QModelIndex(), first, first + len(result_items) - 1)
+        for item in result_items:
+            self.store.append(item)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.store.clear()
+        self.endResetModel()
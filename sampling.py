@@ -0,0 +1,180 @@
+import os
+import math
+import time
+import random
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, TypeVar
+
+from agreement import AgreementStats, normalize_code
+from input_reader import open_input
+from result_writer import StreamingResultWriter
+from telemetry import Telemetry
+
+if TYPE_CHECKING:
+    from processor import TextProcessor
+
+T = TypeVar('T')
+
+
+def stratified_order(rows: Sequence[T], key: Callable[[T], str], seed: int = 0) -> List[T]:
+    """按人工编码分层的随机顺序：各编码在任意前缀中的占比都接近其总体占比"""
+    rng = random.Random(seed)
+    groups: Dict[str, List[T]] = defaultdict(list)
+    for row in rows:
+        groups[key(row)].append(row)
+    keyed = []
+    for members in groups.values():
+        rng.shuffle(members)
+        offset = rng.random()
+        size = len(members)
+        keyed.extend(((i + offset) / size, rng.random(), row) for i, row in enumerate(members))
+    keyed.sort(key=lambda item: (item[0], item[1]))
+    return [row for _, _, row in keyed]
+
+
+def required_sample(accuracy: float, target_width: float, z: float) -> int:
+    """按当前准确率估计区间宽度降到目标所需的样本数（正态近似）"""
+    p = min(max(accuracy, 0.05), 0.95)
+    return math.ceil(z * z * p * (1 - p) / (target_width / 2) ** 2)
+
+
+def run_sampled_calibration(processor: 'TextProcessor', file_path: str, save_path: str,
+                            custom_prompt: Optional[str] = None, code_path: Optional[str] = None,
+                            notes_path: Optional[str] = None, target_width: float = 0.05,
+                            kappa_width: Optional[float] = None, confidence: float = 0.95,
+                            min_sample: int = 30, seed: int = 0) -> Dict:
+    """抽样校准：按人工编码分层随机抽样，置信区间足够窄时自动停止
+
+    准确率（以及可选的 kappa）置信区间的宽度都小于目标值、且至少评估了
+    min_sample 条之后停止，未评估的行不再请求模型。结果工作簿只包含抽样的行。
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    source = open_input(file_path, code_path, notes_path)
+    try:
+        text_col = source.column_index('text')
+        hcode_col = source.column_index('hcode')
+        code_df, notes, columns = source.code_df, source.notes, source.columns
+        rows = []
+        for idx, values in enumerate(source.iter_rows()):
+            if normalize_code(values[hcode_col]) is None:
+                continue
+            rows.append((idx, values))
+    finally:
+        source.close()
+    if not rows:
+        raise ValueError("No rows with an hcode value to evaluate")
+    population = len(rows)
+    order = stratified_order(rows, lambda row: normalize_code(row[1][hcode_col]), seed)
+
+    template = processor.compile_prompt(code_df, notes, custom_prompt)
+    processor.load_examples(code_path)
+    processor.telemetry = Telemetry()
+    processor.agreement = agreement = AgreementStats(code_df['code_num'])
+
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    save_file = os.path.join(save_path, f"{base_name}_sample_{timestamp}.xlsx")
+    detail_columns = ['index', 'text', 'model_code', 'display_text', 'human_code', 'correct']
+    if processor.vote_samples > 1:
+        detail_columns += ['confidence', 'votes']
+    writer = StreamingResultWriter(
+        save_file, list(code_df.columns), code_df.itertuples(index=False),
+        columns + ['model_code', 'is_correct'], detail_columns + ['error']
+    )
+
+    def items():
+        for idx, values in order:
+            text = '' if values[text_col] is None else str(values[text_col])
+            yield idx, population, text, values[hcode_col], 'calibrate', template
+
+    # 实际开始请求的行数：提前停止时窗口中已发出的请求照样计费，只有尚未开始的被取消
+    started = [0]
+    started_lock = threading.Lock()
+
+    def code_item(*args):
+        with started_lock:
+            started[0] += 1
+        return processor._code_item(*args)
+
+    start_time = time.time()
+    processed = correct = 0
+    stopped_early = False
+    snapshot = agreement.snapshot(z)
+    realtime_outputs = deque(maxlen=processor.max_realtime_outputs)
+    executor = ThreadPoolExecutor(max_workers=processor.max_workers)
+    try:
+        results_iter = processor._iter_in_order(executor, items(), code_item)
+        for (idx, values), (result_item, realtime_output) in zip(order, results_iter):
+            writer.add(list(values) + [result_item['model_code'], result_item.get('correct', False)],
+                       result_item)
+            agreement.add(values[hcode_col], result_item['model_code'], bool(result_item.get('error')))
+            processor.telemetry.record_rows()
+            processed += 1
+            correct += int(bool(result_item.get('correct')))
+            realtime_outputs.append(realtime_output)
+            if processor.result_callback:
+                processor.result_callback(result_item)
+
+            snapshot = agreement.snapshot(z)
+            low, high = snapshot['accuracy_ci']
+            narrow = high - low < target_width
+            if kappa_width is not None:
+                k_low, k_high = snapshot['kappa_ci']
+                narrow = narrow and k_high - k_low < kappa_width
+            # 进度按当前准确率估计的所需样本数显示
+            expected = min(population, max(min_sample, processed,
+                                           required_sample(snapshot['accuracy'], target_width, z)))
+            processor.progress_callback(processed, expected)
+            if processed >= min_sample and narrow and processed < population:
+                stopped_early = True
+                break
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        writer.discard()
+        raise
+    # 提前停止时取消窗口中尚未开始的请求
+    executor.shutdown(wait=True, cancel_futures=True)
+    processor.progress_callback(processed, processed)
+
+    metrics = agreement.final()
+    elapsed = time.time() - start_time
+    results = {
+        'processed': processed,
+        'correct': correct,
+        'total': population,
+        'start_time': start_time,
+        'time': elapsed,
+        'save_file': save_file,
+        'accuracy': correct / processed if processed else 0.0,
+        'accuracy_ci': list(snapshot['accuracy_ci']),
+        'kappa': metrics['kappa'],
+        'kappa_ci': list(snapshot['kappa_ci']),
+        'requested_rows': started[0],
+        'saved_calls': population - started[0],
+        'stopped_early': stopped_early,
+        'agreement': {k: metrics[k] for k in ('n', 'accuracy', 'kappa', 'macro_f1', 'weighted_f1', 'per_code')},
+        'telemetry': processor.telemetry.summary(),
+        'realtime_outputs': list(realtime_outputs),
+    }
+
+    for name, sheet_columns, sheet_rows in AgreementStats.sheets(metrics):
+        writer.add_sheet(name, sheet_columns, sheet_rows)
+    writer.add_sheet('Telemetry', ['metric', 'value'], processor.telemetry.sheet_rows())
+    writer.close({
+        '处理时间': f"{elapsed:.1f}秒",
+        '有人工编码的条数': population,
+        '抽样条数': processed,
+        '已请求条数': started[0],
+        '节省调用数': results['saved_calls'],
+        '提前停止': '是' if stopped_early else '否',
+        '置信水平': f"{confidence:.0%}",
+        '目标区间宽度': target_width,
+        '准确率': f"{results['accuracy']:.2%}",
+        '准确率区间': f"[{results['accuracy_ci'][0]:.2%}, {results['accuracy_ci'][1]:.2%}]",
+        'Kappa': f"{results['kappa']:.4f}",
+        'Kappa 区间': f"[{results['kappa_ci'][0]:.3f}, {results['kappa_ci'][1]:.3f}]",
+    })
+    return results
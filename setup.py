@@ -5,16 +5,28 @@ setup(
     version="1.0.0",
     author="Your Name",
     description="A coding system for educational text analysis",
-    packages=["coding_system"],
+    py_modules=[
+        "main", "cli", "processor", "http_client", "rate_limiter", "response_cache",
+        "prompt_template", "checkpoint", "result_writer", "input_reader", "dedup",
+        "results_model", "telemetry", "experiment", "agreement", "sampling", "fewshot",
+        "cascade", "job_queue", "sharding", "resilience",
+    ],
     install_requires=[
         "pandas>=1.5.0",
         "numpy>=1.21.0",
         "PyQt6>=6.4.0",
         "openpyxl>=3.0.10",
     ],
+    extras_require={
+        "parquet": ["pyarrow>=10.0.0"],
+        "logit-bias": ["tiktoken>=0.5.0"],
+    },
     entry_points={
         'console_scripts': [
-            'coding_system=main:main',
+            'coding_system=cli:main',
+        ],
+        'gui_scripts': [
+            'coding_system_gui=main:main',
         ],
     },
 )
\ No newline at end of file
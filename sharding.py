@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from agreement import AgreementStats
+from checkpoint import file_fingerprint
+from input_reader import open_input, read_codebook
+from result_writer import StreamingResultWriter
+
+if TYPE_CHECKING:
+    from processor import TextProcessor
+
+SHARD_MODES = ('calibrate', 'encode')
+QUEUE_FILE = 'shards.sqlite3'
+CODEBOOK_FILE = 'code.csv'
+NOTES_FILE = 'notes.txt'
+
+
+class ShardQueue:
+    """分片任务的 SQLite 工作队列，放在工作目录中，多个进程（或挂载同一目录的多台机器）共用
+
+    工作进程领取分片时获得租约，处理期间定期续租；进程退出或失联后租约过期，
+    分片被其它工作进程重新领取，并借助分片目录中的检查点日志从中断处续跑。
+    """
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(workdir, QUEUE_FILE), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            "id INTEGER PRIMARY KEY, start INTEGER NOT NULL, stop INTEGER NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'queued', worker TEXT, lease_until REAL NOT NULL DEFAULT 0, "
+            "attempts INTEGER NOT NULL DEFAULT 0, result_path TEXT, error TEXT, summary TEXT)"
+        )
+
+    def meta(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM meta").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set_meta(self, **values):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                   [(k, json.dumps(v, ensure_ascii=False)) for k, v in values.items()])
+
+    def add_shard(self, shard_id: int, start: int, stop: int):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO shards (id, start, stop) VALUES (?, ?, ?)",
+                               (shard_id, start, stop))
+
+    def claim(self, worker: str, lease_seconds: float, max_attempts: int = 3) -> Optional[Dict]:
+        """领取一个排队中或租约已过期的分片"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM shards WHERE attempts < ? AND (status = 'queued' OR "
+                    "(status = 'running' AND lease_until < ?)) ORDER BY id LIMIT 1",
+                    (max_attempts, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE shards SET status = 'running', worker = ?, lease_until = ?, "
+                        "attempts = attempts + 1, error = NULL WHERE id = ?",
+                        (worker, now + lease_seconds, row['id'])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row is not None else None
+
+    def renew(self, shard_id: int, worker: str, lease_seconds: float) -> bool:
+        """续租；租约已被其它工作进程接手时返回 False"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE shards SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease_seconds, shard_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id: int, worker: str, result_path: str, summary: Dict) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE shards SET status = 'done', result_path = ?, summary = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (result_path, json.dumps(summary, ensure_ascii=False, default=str), shard_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, shard_id: int, worker: str, error: str, max_attempts: int = 3):
+        """失败的分片重新排队，超过 max_attempts 次后标记为 failed"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "error = ?, lease_until = 0 WHERE id = ? AND worker = ?",
+                (max_attempts, error, shard_id, worker)
+            )
+
+    def shards(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM shards ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        for shard in self.shards():
+            counts[shard['status']] = counts.get(shard['status'], 0) + 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def shard_dir(workdir: str, shard_id: int) -> str:
+    return os.path.join(workdir, f"shard_{shard_id:05d}")
+
+
+def plan_shards(file_path: str, workdir: str, mode: str, shard_size: int = 500,
+                code_path: Optional[str] = None, notes_path: Optional[str] = None,
+                prompt: Optional[str] = None) -> Dict:
+    """把输入文件按行切成分片，每片写成 JSONL，并把编码表和说明写成附属文件
+
+    分片和附属文件都放在工作目录中，工作进程只需访问该目录即可处理。
+    重复规划同一个输入时保留已有进度；输入或参数变化时报错，避免混入旧分片。
+    """
+    if mode not in SHARD_MODES:
+        raise ValueError(f"Unsupported shard mode: {mode}")
+    shard_size = max(1, int(shard_size))
+    os.makedirs(workdir, exist_ok=True)
+    fingerprint = file_fingerprint(file_path, mode, shard_size, prompt or '')
+    queue = ShardQueue(workdir)
+    try:
+        meta = queue.meta()
+        if meta:
+            if meta.get('fingerprint') != fingerprint:
+                raise ValueError(f"Work directory {workdir} already holds a different sharded job")
+            return meta
+
+        with open_input(file_path, code_path, notes_path) as source:
+            source.column_index('text')
+            if mode == 'calibrate':
+                source.column_index('hcode')
+            source.code_df.to_csv(os.path.join(workdir, CODEBOOK_FILE), index=False, encoding='utf-8')
+            with open(os.path.join(workdir, NOTES_FILE), 'w', encoding='utf-8') as f:
+                f.writelines(f"{note}\n" for note in source.notes)
+
+            shard_id, start, out = 0, 0, None
+            total = 0
+            for idx, values in enumerate(source.iter_rows()):
+                if idx % shard_size == 0:
+                    if out is not None:
+                        out.close()
+                        queue.add_shard(shard_id, start, idx)
+                    shard_id, start = idx // shard_size, idx
+                    os.makedirs(shard_dir(workdir, shard_id), exist_ok=True)
+                    out = open(os.path.join(shard_dir(workdir, shard_id), 'input.jsonl'), 'w', encoding='utf-8')
+                # 单元格值中的日期等类型写为字符串
+                out.write(json.dumps(dict(zip(source.columns, values)), ensure_ascii=False, default=str) + "\n")
+                total = idx + 1
+            if out is None:
+                raise ValueError("No rows to shard")
+            out.close()
+            queue.add_shard(shard_id, start, total)
+            columns = source.columns
+
+        meta = {'fingerprint': fingerprint, 'input': os.path.abspath(file_path), 'mode': mode,
+                'shard_size': shard_size, 'total': total, 'columns': columns, 'prompt': prompt,
+                'created': time.time()}
+        queue.set_meta(**meta)
+        return meta
+    finally:
+        queue.close()
+
+
+def run_worker(processor: 'TextProcessor', workdir: str, worker_id: Optional[str] = None,
+               lease_seconds: float = 120.0, max_attempts: int = 3,
+               on_shard: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """工作进程：反复领取分片并处理，直到没有可领取的分片
+
+    processor 使用该工作进程自己的 API 凭据和端点；处理期间后台线程每 lease_seconds/3 续租，
+    续租失败（租约已过期并被其它工作进程接手）时中止该分片，不再写它的日志和结果。
+    返回本进程完成、失败和丢失租约的分片数。
+    """
+    from processor import ProcessingCancelled
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = ShardQueue(workdir)
+    meta = queue.meta()
+    if not meta:
+        queue.close()
+        raise ValueError(f"No sharded job planned in {workdir}")
+    stats = {'worker': worker_id, 'completed': 0, 'failed': 0, 'lost': 0, 'rows': 0}
+    try:
+        while True:
+            shard = queue.claim(worker_id, lease_seconds, max_attempts)
+            if shard is None:
+                break
+            directory = shard_dir(workdir, shard['id'])
+            stop = threading.Event()
+            lost = processor.stop_event = threading.Event()
+
+            def heartbeat(shard_id=shard['id']):
+                while not stop.wait(lease_seconds / 3):
+                    if not queue.renew(shard_id, worker_id, lease_seconds):
+                        lost.set()
+                        break
+
+            beat = threading.Thread(target=heartbeat, daemon=True)
+            beat.start()
+            try:
+                results = processor.process_file(
+                    os.path.join(directory, 'input.jsonl'), directory, meta['mode'], meta['prompt'],
+                    os.path.join(workdir, CODEBOOK_FILE), os.path.join(workdir, NOTES_FILE)
+                )
+            except ProcessingCancelled:
+                # 分片已归新的工作进程，日志和结果由它负责
+                stats['lost'] += 1
+                continue
+            except Exception as e:
+                stop.set()
+                queue.fail(shard['id'], worker_id, str(e), max_attempts)
+                stats['failed'] += 1
+                continue
+            finally:
+                stop.set()
+                beat.join()
+                processor.stop_event = None
+            summary = {k: v for k, v in results.items() if k not in ('realtime_outputs', 'start_time')}
+            if queue.complete(shard['id'], worker_id, results['save_file'], summary):
+                stats['completed'] += 1
+                stats['rows'] += results['processed']
+            if on_shard:
+                on_shard(shard)
+    finally:
+        queue.close()
+    return stats
+
+
+def _worker_process(api_settings: Dict, workdir: str, worker_id: str, lease_seconds: float) -> Dict:
+    """本地子进程的入口：用该进程自己的设置创建处理器并处理分片"""
+    from processor import TextProcessor
+    processor = TextProcessor(api_settings, lambda current, total: None)
+    try:
+        return run_worker(processor, workdir, worker_id, lease_seconds)
+    finally:
+        processor.close()
+
+
+def run_local_workers(workdir: str, worker_settings: List[Dict], processes: int,
+                      lease_seconds: float = 120.0) -> List[Dict]:
+    """在本机启动 processes 个工作进程，第 i 个进程使用 worker_settings[i % len] 中的凭据和端点"""
+    from concurrent.futures import ProcessPoolExecutor
+    processes = max(1, int(processes))
+    host = socket.gethostname()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_worker_process, worker_settings[i % len(worker_settings)], workdir,
+                               f"{host}:local-{i}", lease_seconds)
+                   for i in range(processes)]
+        return [future.result() for future in futures]
+
+
+def merge_shards(workdir: str, save_path: str) -> Dict:
+    """按原始行顺序把各分片的结果合并成一个工作簿，并重新计算整体的一致性统计"""
+    from openpyxl import load_workbook
+
+    queue = ShardQueue(workdir)
+    try:
+        meta = queue.meta()
+        shards = queue.shards()
+    finally:
+        queue.close()
+    if not meta:
+        raise ValueError(f"No sharded job planned in {workdir}")
+    unfinished = [s['id'] for s in shards if s['status'] != 'done']
+    if unfinished:
+        raise ValueError(f"Shards not finished yet: {unfinished[:10]}")
+
+    mode = meta['mode']
+    code_df = read_codebook(os.path.join(workdir, CODEBOOK_FILE))
+    # 分片可能上千个，只读工作簿会一直占用文件句柄：每个分片单独打开、读完即关闭
+    detail_columns, result_columns = [], None
+    for shard in shards:
+        wb = load_workbook(shard['result_path'], read_only=True)
+        try:
+            header = next(wb['Detailed Results'].iter_rows(max_row=1, values_only=True))
+            if result_columns is None:
+                result_columns = list(next(wb['Coding Results'].iter_rows(max_row=1, values_only=True)))
+        finally:
+            wb.close()
+        # 各分片的明细列可能不同（例如只有部分分片有重复文本），取并集并保持顺序
+        detail_columns += [c for c in header if c not in detail_columns]
+
+    base_name = os.path.splitext(os.path.basename(meta['input']))[0]
+    save_file = os.path.join(save_path, f"{base_name}_{mode}_{time.strftime('%Y%m%d_%H%M%S')}.xlsx")
+    writer = StreamingResultWriter(save_file, list(code_df.columns), code_df.itertuples(index=False),
+                                   result_columns, detail_columns)
+    agreement = AgreementStats(code_df['code_num']) if mode == 'calibrate' else None
+    hcode_col = result_columns.index('hcode') if agreement is not None else None
+    code_col = result_columns.index('model_code')
+    processed = correct = 0
+    shard_rows = []
+    try:
+        for shard in shards:
+            wb = load_workbook(shard['result_path'], read_only=True)
+            try:
+                detail_rows = wb['Detailed Results'].iter_rows(values_only=True)
+                header = next(detail_rows)
+                results_rows = wb['Coding Results'].iter_rows(min_row=2, values_only=True)
+                for result_row, detail_row in zip(results_rows, detail_rows):
+                    detail = dict(zip(header, detail_row))
+                    # 行号和重复文本的引用都换算成原始文件中的行号
+                    for column in ('index', 'duplicate_of'):
+                        if isinstance(detail.get(column), int):
+                            detail[column] += shard['start']
+                    writer.add(result_row, detail)
+                    processed += 1
+                    correct += bool(detail.get('correct'))
+                    if agreement is not None:
+                        agreement.add(result_row[hcode_col], result_row[code_col], bool(detail.get('error')))
+            finally:
+                wb.close()
+            summary = json.loads(shard['summary'] or '{}')
+            shard_rows.append([shard['id'], shard['start'] + 1, shard['stop'], shard['worker'],
+                               shard['attempts'], round(summary.get('time', 0.0), 1), shard['result_path']])
+
+        results = {'processed': processed, 'total': meta['total'], 'save_file': save_file,
+                   'shards': len(shards), 'workers': len({s['worker'] for s in shards}),
+                   'time': time.time() - meta['created']}
+        if agreement is not None:
+            metrics = agreement.final()
+            results['accuracy'] = correct / processed if processed else 0.0
+            results['kappa'] = metrics['kappa']
+            results['agreement'] = {k: metrics[k] for k in
+                                    ('n', 'accuracy', 'kappa', 'macro_f1', 'weighted_f1', 'per_code')}
+            for name, columns, rows in AgreementStats.sheets(metrics):
+                writer.add_sheet(name, columns, rows)
+        writer.add_sheet('Shards', ['shard', 'first_row', 'last_row', 'worker', 'attempts', 'seconds',
+                                    'result_file'], shard_rows)
+        writer.close({
+            '总条数': meta['total'],
+            '处理条数': processed,
+            '分片数': len(shards),
+            '工作进程数': results['workers'],
+            '规划到合并的时间': f"{results['time']:.1f}秒",
+            '准确率': f"{results['accuracy']:.2%}" if 'accuracy' in results else 'N/A',
+            'Kappa': f"{results['kappa']:.4f}" if 'kappa' in results else 'N/A'
+        })
+    except BaseException:
+        writer.discard()
+        raise
+    return results
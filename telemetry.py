@@ -0,0 +1,175 @@
+import math
+import time
+import socket
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+
+def classify_error(exc: BaseException) -> str:
+    """把请求异常归类，便于统计和决定是否重试"""
+    if isinstance(exc, (socket.timeout, TimeoutError)):
+        return 'timeout'
+    if isinstance(exc, (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)):
+        return 'connection_reset'
+    name = type(exc).__name__
+    if name == 'RemoteDisconnected':
+        return 'connection_reset'
+    if isinstance(exc, (ConnectionError, OSError)):
+        return 'connection_error'
+    if isinstance(exc, (ValueError, KeyError, IndexError, TypeError)):
+        return 'malformed_response'
+    return name
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图，内存固定，分位数误差约为一个桶宽（约 5%）"""
+    MIN_SECONDS = 0.001
+    MAX_SECONDS = 600.0
+    GROWTH = 1.05
+
+    def __init__(self):
+        self._log_growth = math.log(self.GROWTH)
+        size = int(math.log(self.MAX_SECONDS / self.MIN_SECONDS) / self._log_growth) + 2
+        self.counts = [0] * size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        if seconds <= self.MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(len(self.counts) - 1,
+                         int(math.log(seconds / self.MIN_SECONDS) / self._log_growth) + 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """返回第 q 分位（0-100）所在桶的上界"""
+        if not self.count:
+            return 0.0
+        target = q / 100.0 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return min(self.max, self.MIN_SECONDS * self.GROWTH ** bucket)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Telemetry:
+    """逐请求的遥测汇总：连接/首字节/总耗时分位数、token 用量、重试和错误分类、吞吐"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.latency = {'connect': LatencyHistogram(), 'ttfb': LatencyHistogram(), 'total': LatencyHistogram()}
+        self.requests = 0
+        self.reused_connections = 0
+        self.retries = 0
+        self.hedges = 0  # 超过 p95 延迟后发出的对冲请求
+        self.hedge_wins = 0  # 对冲请求先于原请求成功返回的次数
+        self.rows = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.errors: Counter = Counter()
+
+    def record_request(self, connect_time: float, ttfb: float, total_time: float,
+                       reused: bool = False, prompt_tokens: int = 0, completion_tokens: int = 0,
+                       error_class: Optional[str] = None):
+        """记录一次已收到响应的 HTTP 请求"""
+        with self._lock:
+            self.requests += 1
+            self.reused_connections += int(reused)
+            if not reused:
+                self.latency['connect'].add(connect_time)
+            self.latency['ttfb'].add(ttfb)
+            self.latency['total'].add(total_time)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            if error_class:
+                self.errors[error_class] += 1
+
+    def record_error(self, error_class: str, elapsed: Optional[float] = None):
+        """记录一次没有拿到响应的请求（超时、连接重置等）"""
+        with self._lock:
+            self.requests += 1
+            self.errors[error_class] += 1
+            if elapsed is not None:
+                self.latency['total'].add(elapsed)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_hedge(self, won: bool = False):
+        with self._lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedges += 1
+
+    def record_rows(self, count: int = 1):
+        with self._lock:
+            self.rows += count
+
+    def percentile(self, q: float, kind: str = 'total') -> float:
+        with self._lock:
+            return self.latency[kind].percentile(q)
+
+    def latency_count(self, kind: str = 'total') -> int:
+        with self._lock:
+            return self.latency[kind].count
+
+    def summary(self) -> Dict:
+        """当前汇总（可在运行中随时调用）"""
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            summary = {
+                'requests': self.requests,
+                'retries': self.retries,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'errors': dict(self.errors),
+                'rows': self.rows,
+                'rows_per_sec': self.rows / elapsed,
+                'requests_per_sec': self.requests / elapsed,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'reused_connections': self.reused_connections,
+            }
+            for kind, hist in self.latency.items():
+                summary[f'{kind}_mean'] = hist.mean
+                for q in (50, 95, 99):
+                    summary[f'{kind}_p{q}'] = hist.percentile(q)
+                summary[f'{kind}_max'] = hist.max
+        return summary
+
+    def sheet_rows(self) -> List[Tuple[str, object]]:
+        """'Telemetry' 工作表的 (指标, 值) 行"""
+        s = self.summary()
+        rows = [
+            ('请求数', s['requests']),
+            ('重试次数', s['retries']),
+            ('对冲请求数', s['hedges']),
+            ('对冲请求胜出数', s['hedge_wins']),
+            ('处理行数', s['rows']),
+            ('行/秒', round(s['rows_per_sec'], 3)),
+            ('请求/秒', round(s['requests_per_sec'], 3)),
+            ('输入 token', s['prompt_tokens']),
+            ('输出 token', s['completion_tokens']),
+            ('每行平均 token', round((s['prompt_tokens'] + s['completion_tokens']) / s['rows'], 1) if s['rows'] else 0),
+            ('复用连接的请求数', s['reused_connections']),
+        ]
+        for kind, label in (('connect', '建立连接'), ('ttfb', '首字节'), ('total', '总耗时')):
+            for stat in ('mean', 'p50', 'p95', 'p99', 'max'):
+                rows.append((f'{label} {stat} (秒)', round(s[f'{kind}_{stat}'], 4)))
+        for error_class, count in sorted(s['errors'].items()):
+            rows.append((f'错误: {error_class}', count))
+        return rows
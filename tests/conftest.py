@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 模块位于仓库根目录（setup.py 以 py_modules 安装），测试直接从源码树导入
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
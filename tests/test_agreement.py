@@ -0,0 +1,70 @@
+import pytest
+
+from agreement import OTHER_LABEL, AgreementStats, normalize_code, wilson_interval
+
+
+def _table(stats: AgreementStats):
+    # 2x2 表：人工 a/模型 a 20，a/b 5，b/a 10，b/b 15
+    for human, model, count in (('a', 'a', 20), ('a', 'b', 5), ('b', 'a', 10), ('b', 'b', 15)):
+        for _ in range(count):
+            stats.add(human, model)
+
+
+def test_wilson_interval_matches_hand_computed_bounds():
+    assert wilson_interval(35, 50) == pytest.approx((0.5625, 0.8090), abs=1e-4)
+    # p = 0 时上限为 z²/n / (1 + z²/n)
+    assert wilson_interval(0, 10) == pytest.approx((0.0, 3.8416 / 13.8416))
+    assert wilson_interval(50, 50)[1] == 1.0
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+
+
+def test_snapshot_and_final_agree_on_a_two_by_two_table():
+    stats = AgreementStats(['a', 'b', 'f'])
+    _table(stats)
+
+    # 观察一致 35/50 = 0.7，期望一致 (25*30 + 25*20) / 50² = 0.5，kappa = 0.2 / 0.5
+    snapshot = stats.snapshot()
+    assert snapshot['n'] == 50
+    assert snapshot['accuracy'] == pytest.approx(0.7)
+    assert snapshot['kappa'] == pytest.approx(0.4)
+    assert snapshot['accuracy_ci'] == wilson_interval(35, 50)
+
+    final = stats.final()
+    assert final['accuracy'] == pytest.approx(snapshot['accuracy'])
+    assert final['kappa'] == pytest.approx(snapshot['kappa'])
+    assert final['labels'] == ['a', 'b', 'f', OTHER_LABEL]
+    assert final['confusion'][:2] == [[20, 5, 0, 0], [10, 15, 0, 0]]
+
+    per_code = {c['code']: c for c in final['per_code']}
+    assert set(per_code) == {'a', 'b'}
+    assert per_code['a']['precision'] == pytest.approx(20 / 30)
+    assert per_code['a']['recall'] == pytest.approx(20 / 25)
+    assert per_code['a']['f1'] == pytest.approx(8 / 11)
+    assert per_code['b']['f1'] == pytest.approx(2 / 3)
+    assert final['macro_f1'] == pytest.approx((8 / 11 + 2 / 3) / 2)
+    assert final['weighted_f1'] == pytest.approx((8 / 11 + 2 / 3) / 2)
+
+
+def test_codes_are_normalized_and_unknown_codes_count_as_other():
+    assert normalize_code(' A ') == 'a'
+    assert normalize_code('  ') is None
+    assert normalize_code(float('nan')) is None
+
+    stats = AgreementStats([' A', 'b'])
+    stats.add('a ', 'A')
+    stats.add('b', 'zz')
+    stats.add('b', 'b', error=True)
+    stats.add(None, 'a')
+
+    final = stats.final()
+    assert final['n'] == 3 and final['skipped'] == 1
+    assert final['confusion'] == [[1, 0, 0], [0, 0, 2], [0, 0, 0]]
+    assert stats.snapshot()['accuracy'] == pytest.approx(1 / 3)
+
+
+def test_perfect_agreement_on_a_single_code_has_kappa_one():
+    stats = AgreementStats(['a', 'b'])
+    for _ in range(5):
+        stats.add('a', 'a')
+    assert stats.snapshot()['kappa'] == 1.0
+    assert stats.final()['kappa'] == 1.0
@@ -0,0 +1,72 @@
+import math
+import random
+
+import pytest
+
+from cascade import TEMPERATURES, Cascade, LocalClassifier, cross_validate, tune_threshold
+
+
+def test_tune_threshold_picks_the_lowest_cut_meeting_the_target():
+    confidences = [0.99, 0.95, 0.9, 0.8, 0.7, 0.6]
+    correct = [True, True, True, False, True, False]
+    # 前 k 行的准确率依次为 1, 1, 1, 0.75, 0.8, 0.667
+    assert tune_threshold(confidences, correct, 0.8, min_rows=1) == (0.7, 5, pytest.approx(0.8))
+    assert tune_threshold(confidences, correct, 0.9, min_rows=1) == (0.9, 3, 1.0)
+    # 行数不足 min_rows 的切分不算
+    assert tune_threshold(confidences, correct, 0.8, min_rows=6)[0] == math.inf
+
+
+def test_tune_threshold_keeps_tied_confidences_together():
+    # 0.9 的两行一对一错，不能只取其中一行达到 100%
+    assert tune_threshold([0.9, 0.9, 0.8], [True, False, True], 1.0, min_rows=1) == (math.inf, 0, 0.0)
+    assert tune_threshold([0.9, 0.9, 0.8], [True, False, True], 0.5, min_rows=1) == (0.8, 3, pytest.approx(2 / 3))
+
+
+def test_tune_threshold_returns_inf_when_the_target_is_unreachable():
+    threshold, rows, accuracy = tune_threshold([0.9, 0.8, 0.7], [False, True, False], 0.99, min_rows=1)
+    assert threshold == math.inf and rows == 0 and accuracy == 0.0
+    cascade = Cascade(LocalClassifier(dim=1 << 10).fit(['aaa', 'bbb'], ['a', 'b']), threshold)
+    assert cascade.route(['aaa', 'bbb']) == [None, None]
+
+
+def _corpus(seed: int = 0):
+    rng = random.Random(seed)
+    words = {'a': ['退款', '退货', '退钱', '返还'], 'b': ['物流', '快递', '配送', '送达']}
+    texts, codes = [], []
+    for i in range(60):
+        code = 'ab'[i % 2]
+        texts.append(''.join(rng.choice(words[code]) for _ in range(3)) + f'{i}')
+        codes.append(code)
+    return texts, codes
+
+
+def test_cross_validate_predicts_each_row_out_of_fold():
+    texts, codes = _corpus()
+    # 只出现一次的编码：折外模型从没见过它，不可能预测出来
+    texts.append('独一无二的编码')
+    codes.append('z')
+    final, predicted, confidences = cross_validate(texts, codes, folds=5)
+
+    assert final.classes == ['a', 'b', 'z']
+    assert final.temperature in TEMPERATURES
+    assert predicted[-1] != 'z'
+    assert final.predict(['独一无二的编码'])[0] == ['z']
+    accuracy = sum(p == c for p, c in zip(predicted[:-1], codes[:-1])) / (len(codes) - 1)
+    assert accuracy > 0.9
+    assert all(0.0 < c <= 1.0 for c in confidences)
+
+
+def test_cascade_save_and_load_round_trip(tmp_path):
+    texts, codes = _corpus()
+    classifier = LocalClassifier(dim=1 << 12).fit(texts, codes)
+    path = str(tmp_path / 'cascade.npz')
+
+    Cascade(classifier, 0.75, 0.96, len(texts)).save(path)
+    loaded = Cascade.load(path)
+    assert (loaded.threshold, loaded.expected_accuracy, loaded.trained_rows) == (0.75, 0.96, 60)
+    assert loaded.classifier.classes == classifier.classes
+    assert loaded.route(texts[:10]) == Cascade(classifier, 0.75).route(texts[:10])
+
+    Cascade(classifier, math.inf).save(path)
+    loaded = Cascade.load(path)
+    assert loaded.threshold == math.inf and loaded.expected_accuracy is None
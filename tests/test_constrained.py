@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import processor as processor_module
+from http_client import HTTPResponse
+from processor import TextProcessor
+
+CODES = {'a', 'b', 'c'}
+
+
+class _ScriptedClient:
+    """按顺序返回预设响应的 HTTP 客户端；流式响应逐行交给 on_line"""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        return self.responses.pop(0)
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        return HTTPResponse(200, {}, self._next().encode('utf-8'))
+
+    def stream(self, method, path, body=None, headers=None, timeout=None, on_line=None):
+        for line in self._next():
+            if on_line(line):
+                break
+        return HTTPResponse(200, {}, b'')
+
+    def close(self):
+        pass
+
+
+def _sse(*parts):
+    return [b'data: ' + json.dumps({'choices': [{'delta': {'content': p}}]}).encode() for p in parts]
+
+
+def _completion(content):
+    return json.dumps({'choices': [{'message': {'content': content}}]})
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.setattr(processor_module, 'backoff_delay', lambda failures: 0.0)
+    processor = TextProcessor({'base_url': 'http://mock', 'api_key': 'k', 'constrained': True,
+                               'cache_path': str(tmp_path / 'cache.sqlite3')}, lambda c, t: None)
+    yield processor
+    processor.close()
+
+
+def test_malformed_stream_chunk_is_retried_like_a_malformed_body(processor):
+    processor.http_client = _ScriptedClient([b'data: {not json'], _sse('b'))
+    assert processor.call_model('prompt', valid_codes=CODES) == 'b'
+    assert processor.http_client.calls == 2
+
+    processor.http_client = _ScriptedClient('{not json', _completion('["a", "b"]'))
+    assert processor.call_model('packed', valid_codes=CODES, answers=2) == '["a", "b"]'
+    assert processor.http_client.calls == 2
+
+
+def test_invalid_packed_answers_are_not_cached(processor):
+    processor.http_client = _ScriptedClient(_completion('["a", "z"]'), _completion('["a", "c"]'))
+    assert processor.call_model('packed', valid_codes=CODES, answers=2) == '["a", "z"]'
+    # 无效答案没有缓存，同样的请求重新调用模型；有效答案缓存后不再调用
+    assert processor.call_model('packed', valid_codes=CODES, answers=2) == '["a", "c"]'
+    assert processor.call_model('packed', valid_codes=CODES, answers=2) == '["a", "c"]'
+    assert processor.http_client.calls == 2
+
+
+def test_invalid_streamed_answer_is_not_cached(processor):
+    processor.http_client = _ScriptedClient(_sse('z'), _sse('a'))
+    assert processor.call_model('prompt', valid_codes=CODES) == 'z'
+    assert processor.call_model('prompt', valid_codes=CODES) == 'a'
+    assert processor.call_model('prompt', valid_codes=CODES) == 'a'
+    assert processor.http_client.calls == 2
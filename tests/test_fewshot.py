@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from dedup import text_key
+from fewshot import ExampleIndex, hashed_ngrams, load_example_index
+from rate_limiter import estimate_tokens
+
+DIM = 1 << 12
+EXAMPLES = [
+    ('the cat sat on the mat', 'a'),
+    ('a dog barked loudly', 'b'),
+    ('the cat sat on a hat', 'a'),
+    ('stock prices fell today', 'c'),
+    ('快递三天才到，包装也破了', 'd'),
+]
+
+
+def _dense_cosine(texts, query):
+    """逐项照定义计算的 TF-IDF 余弦相似度，作为稀疏实现的参照"""
+    def tf(text):
+        vector = np.zeros(DIM)
+        features, counts = hashed_ngrams(text, DIM)
+        vector[features] = 1 + np.log(counts)
+        return vector
+    docs = np.array([tf(t) for t in texts])
+    df = (docs > 0).sum(axis=0)
+    idf = np.log((1 + len(texts)) / (1 + df)) + 1
+    docs, q = docs * idf, tf(query) * idf
+    return docs @ q / (np.linalg.norm(docs, axis=1) * np.linalg.norm(q))
+
+
+def test_search_matches_dense_tfidf_cosine():
+    index = ExampleIndex(dim=DIM)
+    assert index.add(EXAMPLES) == len(EXAMPLES)
+    query = 'the cat sat on the mat'
+    expected = _dense_cosine([t for t, _ in EXAMPLES], query)
+
+    results = index.search(query, 3)
+    order = np.argsort(-expected)[:3]
+    assert [r[0] for r in results] == [EXAMPLES[i][0] for i in order]
+    assert [r[2] for r in results] == pytest.approx(list(expected[order]), rel=1e-5)
+    assert results[0][2] == pytest.approx(1.0, rel=1e-5)
+
+    # 校准时排除待编码文本本身
+    excluded = index.search(query, 3, exclude=text_key(query))
+    assert query not in [r[0] for r in excluded]
+    assert excluded[0][0] == 'the cat sat on a hat'
+
+
+def test_add_skips_duplicates_and_blank_rows():
+    index = ExampleIndex(dim=DIM)
+    index.add(EXAMPLES)
+    assert index.add([('The cat sat on the mat ', 'A'), ('', 'a'), ('text', ' ')]) == 0
+    # 相同文本、不同编码仍是新样例
+    assert index.add([('the cat sat on the mat', 'b')]) == 1
+    assert len(index) == len(EXAMPLES) + 1
+
+
+def test_select_merges_by_rank_within_the_token_budget():
+    index = ExampleIndex(dim=DIM)
+    index.add(EXAMPLES)
+    queries = ['the cat sat', 'dog barked']
+    ranked = [index.search(q, 2) for q in queries]
+
+    chosen = index.select(queries, 2, 1000)
+    # 先取每条文本的第一名，再取第二名，重复的样例只出现一次
+    expected = []
+    for rank in range(2):
+        for candidates in ranked:
+            if candidates[rank] not in expected:
+                expected.append(candidates[rank])
+    assert chosen == expected
+
+    first = ranked[0][0]
+    budget = estimate_tokens(first[0]) + 8
+    assert index.select(queries[:1], 2, budget) == [first]
+    assert index.select(queries, 2, 0) == []
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'index.npz')
+    index = ExampleIndex(dim=DIM)
+    index.add(EXAMPLES)
+    index.save(path)
+
+    loaded = ExampleIndex.load(path, dim=DIM)
+    assert loaded.texts == index.texts and loaded.codes == index.codes
+    assert loaded.digest() == index.digest()
+    assert loaded.search('快递太慢了', 2) == index.search('快递太慢了', 2)
+    assert loaded.add(EXAMPLES[:2]) == 0
+
+    # 参数不同或文件损坏时返回空索引
+    assert len(ExampleIndex.load(path, dim=DIM * 2)) == 0
+    with open(path, 'wb') as f:
+        f.write(b'not an npz file')
+    assert len(ExampleIndex.load(path, dim=DIM)) == 0
+
+
+def test_load_example_index_appends_only_new_rows(tmp_path):
+    codebook = tmp_path / 'codes.csv'
+    codebook.write_text('code_num,code_name\na,A\nb,B\n', encoding='utf-8')
+    examples = tmp_path / 'examples.csv'
+    examples.write_text('text,hcode\nthe cat sat on the mat,a\na dog barked loudly,b\nno code yet,\n',
+                        encoding='utf-8')
+    index_path = str(tmp_path / 'examples.npz')
+
+    index = load_example_index(str(examples), str(codebook), index_path)
+    assert index.texts == ['the cat sat on the mat', 'a dog barked loudly']
+
+    with open(examples, 'a', encoding='utf-8') as f:
+        f.write('the cat sat on a hat,a\n')
+    index = load_example_index(str(examples), str(codebook), index_path)
+    assert index.texts == ['the cat sat on the mat', 'a dog barked loudly', 'the cat sat on a hat']
+    # 增量结果与从头建立的索引一致
+    fresh = ExampleIndex()
+    fresh.add([(t, c) for t, c in zip(index.texts, index.codes)])
+    assert ExampleIndex.load(index_path).digest() == fresh.digest()
+    assert ExampleIndex.load(index_path).search('cat on a hat', 3) == fresh.search('cat on a hat', 3)
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from job_queue import JobRunner, JobStore
+
+
+def _add(store: JobStore, tmp_path, name: str) -> int:
+    path = tmp_path / name
+    path.write_text('text\n')
+    return store.add(str(path), str(tmp_path))
+
+
+def test_only_stale_running_jobs_are_requeued(tmp_path):
+    db = str(tmp_path / 'queue.sqlite3')
+    first = JobStore(db, lease_seconds=0.5)
+    job_id = _add(first, tmp_path, 'a.csv')
+    assert first.claim()['id'] == job_id
+
+    # 另一个进程打开队列（--list、图形界面）不影响正在处理的任务
+    second = JobStore(db, lease_seconds=0.5)
+    assert [job['status'] for job in second.jobs()] == ['running']
+    assert second.claim() is None
+
+    # 心跳过期后才由其它进程接手，原进程随后的结果不再写入
+    time.sleep(0.6)
+    assert second.claim()['id'] == job_id
+    assert first.heartbeat([job_id]) == [job_id]
+    first.finish(job_id, {'processed': 1, 'total': 1})
+    assert second.jobs()[0]['status'] == 'running'
+    first.close()
+    second.close()
+
+
+def _mock_processor(base_url: str):
+    from processor import TextProcessor
+    api_settings = {'base_url': base_url, 'api_key': 'test', 'use_cache': False, 'max_workers': 2}
+    return TextProcessor(api_settings, lambda current, total: None)
+
+
+def test_stop_waits_for_running_jobs_and_lost_jobs_are_not_failed(tmp_path):
+    pytest.importorskip('openpyxl')
+    from benchmarks.mock_server import MockChatServer, MockSettings
+    from benchmarks.workload import make_workbook
+
+    db = str(tmp_path / 'queue.sqlite3')
+    store = JobStore(db, lease_seconds=0.6)
+    kept = store.add(make_workbook(str(tmp_path / 'kept.xlsx'), 40), str(tmp_path), mode='calibrate')
+    taken = store.add(make_workbook(str(tmp_path / 'taken.xlsx'), 80), str(tmp_path), mode='calibrate')
+
+    def take_over():
+        # 模拟本进程失联期间任务被另一个进程接手
+        with sqlite3.connect(db) as conn:
+            conn.execute("UPDATE jobs SET owner = 'other', heartbeat = heartbeat + 60 WHERE id = ?", (taken,))
+
+    with MockChatServer(settings=MockSettings(latency=0.05, sigma=0.1, seed=0)) as server:
+        processor = _mock_processor(server.base_url)
+        runner = JobRunner(processor, store, concurrent_jobs=2, poll_interval=0.05)
+        # 与命令行相同，run() 在调用方自己的线程中运行，stop(wait=True) 也要等正在处理的文件
+        caller = threading.Thread(target=runner.run, args=(False,), daemon=True)
+        caller.start()
+        timer = threading.Timer(0.3, take_over)
+        timer.start()
+        try:
+            time.sleep(0.4)
+            runner.stop(wait=True)
+            assert not runner.is_alive()
+            jobs = {job['id']: job for job in store.jobs()}
+        finally:
+            timer.cancel()
+            caller.join()
+            processor.close()
+
+    store.close()
+    assert jobs[kept]['status'] == 'done'
+    assert jobs[taken]['status'] == 'running' and jobs[taken]['owner'] == 'other'
+
+
+def test_interrupted_run_requeues_running_jobs_without_finishing_them(tmp_path):
+    pytest.importorskip('openpyxl')
+    from benchmarks.mock_server import MockChatServer, MockSettings
+    from benchmarks.workload import make_workbook
+
+    store = JobStore(str(tmp_path / 'queue.sqlite3'))
+    job_id = store.add(make_workbook(str(tmp_path / 'big.xlsx'), 400), str(tmp_path), mode='calibrate')
+
+    with MockChatServer(settings=MockSettings(latency=0.05, sigma=0.1, seed=0)) as server:
+        processor = _mock_processor(server.base_url)
+        runner = JobRunner(processor, store, concurrent_jobs=1, poll_interval=0.05)
+        heartbeat = runner._heartbeat
+        pressed, raised = threading.Event(), threading.Event()
+        threading.Timer(0.5, pressed.set).start()
+
+        def interrupting_heartbeat():
+            # 模拟处理中按下 Ctrl+C（只中断一次，之后的心跳照常）
+            if pressed.is_set() and not raised.is_set():
+                raised.set()
+                raise KeyboardInterrupt
+            heartbeat()
+
+        runner._heartbeat = interrupting_heartbeat
+        started = time.monotonic()
+        try:
+            with pytest.raises(KeyboardInterrupt):
+                runner.run(exit_when_idle=True)
+        finally:
+            processor.close()
+        elapsed = time.monotonic() - started
+
+    job = store.jobs()[0]
+    store.close()
+    # 400 行约需 10 秒；中断后不等处理完，任务放回队列，检查点日志留给下次续跑
+    assert elapsed < 5 and not runner.is_alive()
+    assert job['id'] == job_id and job['status'] == 'queued' and job['owner'] is None
+    assert 0 < job['processed'] < 400
+    assert any(name.endswith('.journal.jsonl') for name in os.listdir(tmp_path))
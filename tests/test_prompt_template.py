@@ -0,0 +1,43 @@
+import pytest
+
+from prompt_template import PromptTemplate, TEXT_PLACEHOLDER
+
+TEMPLATE = PromptTemplate(f"编码表：a, b, c\n文本：{TEXT_PLACEHOLDER}\n只返回编码", ['a', 'b', 'c'])
+
+
+@pytest.mark.parametrize('content, expected', [
+    ('["a", "B", " c "]', ['a', 'b', 'c']),
+    ('结果如下：\n```json\n["c", "a", "b"]\n```', ['c', 'a', 'b']),
+    # 不在编码表中、为空或不是字符串的条目单独作废，其余位置照常使用
+    ('["a", "z", "b"]', ['a', None, 'b']),
+    ('["a", "", null]', ['a', None, None]),
+    ('[{"code": "a"}, ["b"], "c"]', [None, None, 'c']),
+])
+def test_parse_batch_keeps_valid_positions(content, expected):
+    assert TEMPLATE.parse_batch(content, 3) == expected
+
+
+@pytest.mark.parametrize('content', [
+    '["a", "b"]',  # 少一条：无法确定缺的是哪一条，整组重试
+    '["a", "b", "c", "a"]',
+    '["a", "b", "c"',  # 截断的回复
+    '["a", b, "c"]',
+    '{"answers": "abc"}',
+    '',
+])
+def test_parse_batch_rejects_malformed_or_wrong_length_arrays(content):
+    assert TEMPLATE.parse_batch(content, 3) == [None, None, None]
+
+
+def test_parse_batch_accepts_numeric_codes_and_open_codebooks():
+    numeric = PromptTemplate("只返回编码", ['1', '2'])
+    assert numeric.parse_batch('[1, "2", 3]', 3) == ['1', '2', None]
+    open_codes = PromptTemplate("只返回编码")
+    assert open_codes.parse_batch('["x", " Y "]', 2) == ['x', 'y']
+
+
+def test_batch_messages_number_each_text_on_one_line():
+    messages = TEMPLATE.batch_messages(['第一条\n换行', '第二条'])
+    assert messages[0]['content'] == TEMPLATE.batch_system
+    assert messages[0]['content'].startswith(TEMPLATE.system)
+    assert messages[-1] == {'role': 'user', 'content': '[1] 第一条 换行\n[2] 第二条'}
@@ -0,0 +1,79 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, parse_retry_after
+
+
+class _Clock:
+    """假时钟：sleep 只推进时间，不真正等待"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_rpm_allows_a_ten_second_burst_then_one_request_per_second(clock):
+    limiter = RateLimiter(rpm=60)
+    assert [limiter.acquire() for _ in range(10)] == [0.0] * 10
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert limiter.stats()['wait_seconds'] == pytest.approx(2.0)
+
+
+def test_tpm_waits_for_enough_tokens(clock):
+    limiter = RateLimiter(tpm=600)  # 每秒 10 个 token，桶容量 100
+    assert limiter.acquire(100) == 0.0
+    assert limiter.acquire(50) == pytest.approx(5.0)
+    # 超过桶容量的请求只要求桶是满的
+    clock.sleep(60)
+    assert limiter.acquire(1000) == 0.0
+
+
+def test_unlimited_limiter_never_waits(clock):
+    limiter = RateLimiter()
+    assert all(limiter.acquire(10_000) == 0.0 for _ in range(1000))
+
+
+def test_throttling_pauses_and_halves_the_rate_once_per_wave(clock):
+    limiter = RateLimiter(rpm=60, min_scale=0.2)
+    limiter.on_throttled(retry_after=3.0)
+    limiter.on_throttled(retry_after=1.0)  # 同一波被拒的请求：不再降速，暂停不缩短
+    assert limiter.scale == 0.5
+    assert limiter.acquire() == pytest.approx(3.0)
+
+    for _ in range(3):
+        clock.sleep(2.0)
+        limiter.on_throttled(retry_after=0.0)
+    assert limiter.scale == 0.2
+    assert limiter.stats()['throttled'] == 5
+
+    limiter.on_success()
+    assert limiter.scale == pytest.approx(0.22)
+    # 速率减半后补充一个请求的令牌需要的时间相应变长
+    assert limiter.acquire() == pytest.approx(60.0 / (60 * 0.22), rel=0.02)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('5') == 5.0
+    assert parse_retry_after(' 1.5 ') == 1.5
+    assert parse_retry_after('-3') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('') is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=1.5)
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
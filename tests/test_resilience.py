@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from resilience import Hedger, RequestError, backoff_delay
+from telemetry import Telemetry
+
+
+class _UpperBound:
+    """uniform() 总是返回上限的随机源，用来读出退避的上限"""
+    def uniform(self, low, high):
+        return high
+
+
+def test_backoff_delay_doubles_up_to_the_cap_with_full_jitter():
+    caps = [backoff_delay(n, base=0.5, cap=20.0, rng=_UpperBound()) for n in range(0, 9)]
+    assert caps == [0.5, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 20.0, 20.0]
+
+    class Lower:
+        def uniform(self, low, high):
+            return low
+    assert backoff_delay(5, rng=Lower()) == 0.0
+
+
+@pytest.mark.parametrize('status, retryable, throttled', [
+    (400, False, False), (404, False, False), (408, True, False),
+    (429, True, True), (500, True, False), (503, True, True),
+])
+def test_request_error_from_status(status, retryable, throttled):
+    error = RequestError.from_status(status, b'x' * 500)
+    assert error.error_class == f"http_{status}"
+    assert (error.retryable, error.throttled) == (retryable, throttled)
+    assert str(error) == f"HTTP {status}: " + 'x' * 200
+
+
+def _telemetry(requests: int, seconds: float = 0.02) -> Telemetry:
+    telemetry = Telemetry()
+    for _ in range(requests):
+        telemetry.record_request(0.0, seconds, seconds)
+    return telemetry
+
+
+def test_hedger_delay_needs_samples_and_budget():
+    hedger = Hedger(4, min_samples=20, budget=0.1)
+    try:
+        assert Hedger.slots_for(1) == Hedger.slots_for(4) == 1 and Hedger.slots_for(8) == 2
+        assert hedger.delay(_telemetry(19)) is None
+        telemetry = _telemetry(40)
+        assert hedger.delay(telemetry) == pytest.approx(0.02)
+        # 对冲请求累计达到请求数的 10% 后不再对冲
+        telemetry.hedges = 4
+        assert hedger.delay(telemetry) is None
+    finally:
+        hedger.shutdown()
+
+
+def _slow_then_fast():
+    calls = []
+    lock = threading.Lock()
+
+    def send(cancelled: threading.Event) -> str:
+        with lock:
+            calls.append(cancelled)
+            first = len(calls) == 1
+        if first:
+            # 原请求很慢，另一个请求成功后收到取消信号
+            return 'primary' if not cancelled.wait(0.5) else 'cancelled'
+        return 'hedge'
+    return send, calls
+
+
+def test_hedge_wins_when_the_primary_is_slow():
+    hedger = Hedger(4)
+    telemetry = _telemetry(40)
+    send, calls = _slow_then_fast()
+    try:
+        assert hedger.run(send, telemetry) == 'hedge'
+        assert (telemetry.hedges, telemetry.hedge_wins) == (1, 1)
+        assert len(calls) == 2 and calls[0].is_set()
+    finally:
+        hedger.shutdown()
+
+
+def test_no_hedge_without_a_free_slot():
+    hedger = Hedger(4)
+    telemetry = _telemetry(40)
+    send, calls = _slow_then_fast()
+    hedger._slots.acquire()  # 唯一的对冲名额已被占用
+    try:
+        assert hedger.run(send, telemetry) == 'primary'
+        assert telemetry.hedges == 0 and len(calls) == 1
+    finally:
+        hedger._slots.release()
+        hedger.shutdown()
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+def test_get_put_and_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite3'), max_entries=2)
+    key = ResponseCache.make_key('m', 0.1, 'prompt')
+    assert key == ResponseCache.make_key('m', 0.1, 'prompt')
+    assert key != ResponseCache.make_key('m', 0.1, 'prompt', sample=1)
+    assert cache.get(key) is None
+    cache.put(key, 'a')
+    assert cache.get(key) == 'a'
+
+    for i in range(3):
+        cache.put(f'k{i}', str(i))
+    cache.evict()
+    assert cache.get(key) is None and cache.get('k2') == '2'
+    cache.close()
+
+
+def test_concurrent_jobs_report_their_own_hits_and_misses(tmp_path):
+    pytest.importorskip('openpyxl')
+    from benchmarks.mock_server import MockChatServer, MockSettings
+    from benchmarks.workload import make_workbook
+    from processor import TextProcessor
+
+    cached_input = make_workbook(str(tmp_path / 'cached.xlsx'), 40, seed=1)
+    fresh_input = make_workbook(str(tmp_path / 'fresh.xlsx'), 40, seed=2)
+    with MockChatServer(settings=MockSettings(latency=0.02, sigma=0.1, seed=0)) as server:
+        parent = TextProcessor({'base_url': server.base_url, 'api_key': 'k', 'resume': False, 'dedup': False,
+                                'cache_path': str(tmp_path / 'cache.sqlite3')}, lambda c, t: None)
+        try:
+            parent.process_file(cached_input, str(tmp_path), 'encode')
+            # 两个任务共用同一个缓存并发处理：一个全部命中，一个全部未命中
+            children = [parent.spawn(lambda c, t: None) for _ in range(2)]
+            results = {}
+
+            def run(name, child, path):
+                results[name] = child.process_file(path, str(tmp_path), 'encode')
+            threads = [threading.Thread(target=run, args=('cached', children[0], cached_input)),
+                       threading.Thread(target=run, args=('fresh', children[1], fresh_input))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            parent.close()
+
+    assert results['cached']['cache_stats'] == {'hits': 40, 'misses': 0}
+    assert results['fresh']['cache_stats'] == {'hits': 0, 'misses': 40}
@@ -0,0 +1,31 @@
+from collections import Counter
+
+from sampling import required_sample, stratified_order
+
+
+def test_required_sample_uses_the_normal_approximation():
+    # n = z² p(1-p) / (w/2)²：p = 0.8、w = 0.05 时为 983.4，向上取整
+    assert required_sample(0.8, 0.05, 1.96) == 984
+    assert required_sample(0.5, 0.1, 1.96) == 385
+    # 准确率为 0 或 1 时按 0.05 / 0.95 估计，不会得到 0 个样本
+    assert required_sample(1.0, 0.05, 1.96) == required_sample(0.0, 0.05, 1.96) == 292
+
+
+def test_stratified_order_keeps_every_prefix_close_to_the_population_mix():
+    rows = [('a', i) for i in range(600)] + [('b', i) for i in range(300)] + [('c', i) for i in range(100)]
+    order = stratified_order(rows, lambda row: row[0], seed=7)
+
+    assert sorted(order) == sorted(rows)
+    shares = {code: count / len(rows) for code, count in Counter(r[0] for r in rows).items()}
+    seen = Counter()
+    for k, row in enumerate(order, 1):
+        seen[row[0]] += 1
+        for code, share in shares.items():
+            assert abs(seen[code] - share * k) <= 2, (k, code)
+
+
+def test_stratified_order_is_reproducible_for_a_seed():
+    rows = [(code, i) for i in range(50) for code in 'abc']
+    key = lambda row: row[0]
+    assert stratified_order(rows, key, seed=1) == stratified_order(rows, key, seed=1)
+    assert stratified_order(rows, key, seed=1) != stratified_order(rows, key, seed=2)
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+pytest.importorskip('openpyxl')
+
+import sharding
+from benchmarks.mock_server import MockChatServer, MockSettings
+from benchmarks.workload import make_workbook
+from processor import TextProcessor
+
+
+def _processor(base_url: str, **settings) -> TextProcessor:
+    api_settings = {'base_url': base_url, 'api_key': 'test', 'use_cache': False, 'max_workers': 2}
+    api_settings.update(settings)
+    return TextProcessor(api_settings, lambda current, total: None)
+
+
+def test_worker_stops_when_lease_is_taken_over(tmp_path):
+    input_path = make_workbook(str(tmp_path / 'input.xlsx'), 80)
+    workdir = str(tmp_path / 'work')
+    sharding.plan_shards(input_path, workdir, 'calibrate', shard_size=80)
+
+    def take_over():
+        # 模拟租约过期后被另一个工作进程领取
+        with sqlite3.connect(os.path.join(workdir, sharding.QUEUE_FILE)) as conn:
+            conn.execute("UPDATE shards SET worker = 'other', lease_until = lease_until + 60")
+
+    with MockChatServer(settings=MockSettings(latency=0.05, sigma=0.1, seed=0)) as server:
+        processor = _processor(server.base_url)
+        timer = threading.Timer(0.3, take_over)
+        timer.start()
+        try:
+            stats = sharding.run_worker(processor, workdir, 'me', lease_seconds=0.6)
+        finally:
+            timer.cancel()
+            processor.close()
+
+    assert stats['lost'] == 1 and stats['completed'] == 0 and stats['failed'] == 0
+    queue = sharding.ShardQueue(workdir)
+    shard = queue.shards()[0]
+    queue.close()
+    assert shard['worker'] == 'other' and shard['status'] == 'running'
+    # 检查点日志留给新的工作进程续跑
+    journals = [name for name in os.listdir(sharding.shard_dir(workdir, shard['id']))
+                if name.endswith('.journal.jsonl')]
+    assert journals
+
+
+def _coding_results(path: str):
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb['Coding Results'].iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def test_local_workers_merge_in_original_order(tmp_path):
+    input_path = make_workbook(str(tmp_path / 'input.xlsx'), 240, dup_rate=0.2)
+    workdir = str(tmp_path / 'work')
+    meta = sharding.plan_shards(input_path, workdir, 'calibrate', shard_size=50)
+    assert meta['total'] == 240
+
+    with MockChatServer(settings=MockSettings(latency=0.005, sigma=0.2, seed=0)) as server:
+        # 两套"凭据"轮流分给三个工作进程
+        worker_settings = [{'base_url': server.base_url, 'api_key': key, 'use_cache': False, 'max_workers': 4}
+                           for key in ('key-a', 'key-b')]
+        stats = sharding.run_local_workers(workdir, worker_settings, processes=3, lease_seconds=30)
+        assert sum(s['completed'] for s in stats) == 5
+        assert sum(s['failed'] + s['lost'] for s in stats) == 0
+
+        merged = sharding.merge_shards(workdir, str(tmp_path))
+
+        # 与单进程处理同一文件的结果逐行相同
+        single_dir = tmp_path / 'single'
+        single_dir.mkdir()
+        processor = _processor(server.base_url)
+        try:
+            single = processor.process_file(input_path, str(single_dir), 'calibrate')
+        finally:
+            processor.close()
+
+    assert merged['processed'] == 240 and merged['shards'] == 5
+    assert merged['accuracy'] == pytest.approx(single['accuracy'])
+    assert _coding_results(merged['save_file']) == _coding_results(single['save_file'])
+
+
+def test_merge_opens_one_shard_workbook_at_a_time(tmp_path):
+    resource = pytest.importorskip('resource')
+    input_path = make_workbook(str(tmp_path / 'input.xlsx'), 60)
+    workdir = str(tmp_path / 'work')
+    sharding.plan_shards(input_path, workdir, 'calibrate', shard_size=1)
+    with MockChatServer(settings=MockSettings(latency=0.0, seed=0)) as server:
+        processor = _processor(server.base_url)
+        try:
+            assert sharding.run_worker(processor, workdir, 'me')['completed'] == 60
+        finally:
+            processor.close()
+
+    # 文件句柄上限比分片数少得多：同时打开所有分片工作簿时合并会失败
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    in_use = len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else 64
+    resource.setrlimit(resource.RLIMIT_NOFILE, (in_use + 30, hard))
+    try:
+        merged = sharding.merge_shards(workdir, str(tmp_path))
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert merged['processed'] == 60 and merged['shards'] == 60
+    assert [row[0] for row in _coding_results(merged['save_file'])] == \
+        [row[0] for row in _coding_results(input_path)]
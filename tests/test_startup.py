@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+# 在新进程中导入命令行入口和处理器的时间预算（秒）；实际约 0.1 秒，留足慢机器的余量
+IMPORT_BUDGET_SECONDS = 0.75
+HEAVY_MODULES = ('PyQt6', 'pandas', 'openpyxl', 'numpy', 'http.client')
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import cli, processor
+elapsed = time.perf_counter() - started
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _probe() -> dict:
+    output = subprocess.run([sys.executable, '-c', _PROBE], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_cli_and_processor_import_without_heavy_modules():
+    assert _probe()['loaded'] == []
+
+
+def test_cli_and_processor_import_within_budget():
+    # 取三次中最快的一次，排除磁盘缓存冷启动和调度抖动
+    seconds = min(_probe()['seconds'] for _ in range(3))
+    assert seconds <= IMPORT_BUDGET_SECONDS, f"import took {seconds:.3f}s (budget {IMPORT_BUDGET_SECONDS}s)"
+
+
+def test_gui_startup_check():
+    pytest.importorskip('PyQt6')
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    result = subprocess.run([sys.executable, 'main.py', '--startup-check'], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr